@@ -1,10 +1,23 @@
 # File: app.py
 
+import os
+from functools import partial
 import streamlit as st
 import pandas as pd
 
 # Import your utility modules and components
-from utils.data_loader import load_schemes, load_workflow, load_attachments, load_health_metrics
+from utils.data_loader import (
+    DATA_DIR, DATA_FORMAT, load_schemes, load_workflow, load_attachments, load_health_metrics, load_summary_transitions, dataset_version,
+    load_health_history, load_scheme_cube, load_workflow_cube, load_scheme_sketch, load_workflow_sketch, load_scheme_facts,
+    data_dir, pin_dataset, pinned_dataset, evict_directory, load_tables_async,
+)
+from utils.refresh import start_refresher
+from utils.cube import SCHEME_CUBE, WORKFLOW_CUBE, cube_answers, get_cube_index
+from utils.facts import get_scheme_facts
+from utils.sketch import STANDARD_ERROR, use_sketches, approx_distinct
+from utils.query_backend import QUERY_BACKEND, get_backend
+from utils.instrumentation import timed, span, start_rerun, finish_rerun
+from utils.filter_index import CREATION_MODES, FilterIndex, get_filter_index, filter_fingerprint
 from components.filters import sidebar_filters
 from components.kpi_cards import display_kpi_cards
 from components.charts import (
@@ -14,102 +27,297 @@ from components.charts import (
     aging_bucket_distribution,
     performance_matrix,
     histogram_avg_time_bins,
+    memoized_prep,
+    prewarm_preps,
+    prep_avg_processing_time,
+    prep_category_counts,
+    prep_avg_time_bins,
+    prep_performance,
+    prep_scheme_flow,
+    prep_transition_flow,
+    prep_aging_counts,
 )
-from components.data_health import display_data_health
+from components.data_health import display_data_health, display_selection_health, HEALTH_STATE_KEYS
+from components.debug_panel import display_rerun_timings
+from components.reports import display_annual_reports
+from components.tables import paged_table, table_state_keys
 from components.theme_utils import accessibility_options  # optional
 
-# Filtering function supporting both creationInfo and workflowPath modes
-def filter_data(schemes, workflow, attachments, filters):
-    start_date, end_date = filters["date_range"]
-    filter_mode = filters["filter_mode"]
-
-    filtered_schemes = pd.DataFrame()
-    filtered_workflow = pd.DataFrame()
-
-    if filter_mode == "creationInfo":
-        filtered_schemes = schemes[
-            (schemes['creationDate'] >= pd.to_datetime(start_date)) &
-            (schemes['creationDate'] <= pd.to_datetime(end_date))
-        ]
-        if filters["categories"]:
-            filtered_schemes = filtered_schemes[filtered_schemes['category'].isin(filters["categories"])]
-        if filters["departments"]:
-            filtered_schemes = filtered_schemes[filtered_schemes['department_at_time'].isin(filters["departments"])]
-        if filters["users"]:
-            filtered_schemes = filtered_schemes[filtered_schemes['createdBy'].isin(filters["users"])]
-        filtered_workflow = workflow[workflow['scheme_id'].isin(filtered_schemes['scheme_id'])]
-
-    else:  # workflowPath
-        filtered_workflow = workflow[
-            (workflow['forwarded_at'] >= pd.to_datetime(start_date)) &
-            (workflow['forwarded_at'] <= pd.to_datetime(end_date))
-        ]
-        if filters["departments"]:
-            filtered_workflow = filtered_workflow[filtered_workflow['department'].isin(filters["departments"])]
-        if filters["users"]:
-            filtered_workflow = filtered_workflow[filtered_workflow['user'].isin(filters["users"])]
-        scheme_ids = filtered_workflow['scheme_id'].unique()
-        filtered_schemes = schemes[schemes['scheme_id'].isin(scheme_ids)]
-
-    filtered_attachments = attachments[attachments['scheme_id'].isin(filtered_schemes['scheme_id'])]
+# Cached tables are shared with every session as shallow copies; with
+# copy-on-write an in-place edit copies the affected columns first (always on
+# from pandas 3)
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.set_option("mode.copy_on_write", True)
+
+# Columns the dashboard uses from the large tables; loaders only read these
+WORKFLOW_COLUMNS = ["scheme_id", "user", "department", "forwarded_at", "time_taken", "next_department"]
+ATTACHMENT_COLUMNS = ["scheme_id", "fileName", "user", "department"]
+
+# Every table a rerun reads, loaded concurrently; the KPI strip only waits for the first six
+DASHBOARD_LOADERS = {
+    "schemes": load_schemes,
+    "workflow": partial(load_workflow, columns=WORKFLOW_COLUMNS),
+    "attachments": partial(load_attachments, columns=ATTACHMENT_COLUMNS),
+    "scheme_cube": load_scheme_cube,
+    "workflow_cube": load_workflow_cube,
+    "scheme_facts": load_scheme_facts,
+    "health": load_health_metrics,
+    "health_history": load_health_history,
+    "transitions": load_summary_transitions,
+}
+
+# "lazy" renders only the selected section; "tabs" renders every section in st.tabs
+NAVIGATION = os.environ.get("DASHBOARD_NAVIGATION", "lazy")
+
+@timed()
+@memoized_prep
+def prep_sql_aggregates(filters, version):
+    """Every dashboard aggregation from the SQL backend (SCHEMES_QUERY_BACKEND=duckdb)."""
+    return get_backend(data_dir(), DATA_FORMAT, version).aggregates(filters)
+
+def warm_dataset(directory):
+    """
+    Load a newly built dataset version into the shared caches and build its
+    filter index, so the first rerun after it is published finds them ready.
+    """
+    with pinned_dataset(directory):
+        version = dataset_version()
+        tables = {name: future.result() for name, future in load_tables_async(DASHBOARD_LOADERS).items()}
+        index = get_filter_index(tables["schemes"], tables["workflow"], tables["attachments"], version)
+        get_scheme_facts(tables["scheme_facts"], index, tables["workflow"], version)
+        get_cube_index(tables["scheme_cube"], SCHEME_CUBE, version)
+        get_cube_index(tables["workflow_cube"], WORKFLOW_CUBE, version)
+
+# Filtering function supporting both creationInfo and workflowPath modes.
+# Rows are resolved by the shared FilterIndex; sidebar_filters already stores
+# the resolved selection in filters["selection"], so nothing is re-scanned here.
+@timed()
+def filter_data(schemes, workflow, attachments, filters, index=None):
+    selection = filters.get("selection")
+    if selection is None or "attachments" not in selection:
+        index = index or FilterIndex(schemes, workflow, attachments)
+        selection = index.resolve(filters)
+
+    filtered_schemes = schemes.iloc[selection["schemes"]]
+    filtered_workflow = workflow.iloc[selection["workflow"]]
+    filtered_attachments = attachments.iloc[selection["attachments"]]
     return filtered_schemes, filtered_workflow, filtered_attachments
 
 
+# --- Sections ---
+# Each section is (render function, prep jobs for background pre-warming,
+# widget keys whose state must survive while the section is not shown).
+
+def overview_section(data):
+    st.header("📈 Overview")
+    line_avg_processing_time(data["workflow"], cache_key=data["cache_key"], monthly=data["monthly"])
+    bar_scheme_count_by_category(data["schemes"], cache_key=data["cache_key"],
+                                 counts=data["sql"].get("category_counts"))
+    histogram_avg_time_bins(data["schemes"], data["workflow"], cache_key=data["cache_key"], facts=data["facts"])
+
+def performance_section(data):
+    st.header("🏆 Performance")
+    performance_matrix(data["workflow"], cache_key=data["cache_key"], performance=data["sql"].get("performance"))
+
+def date_only(filters):
+    """True when the filtered workflow is exactly the steps forwarded in the date range."""
+    return filters["filter_mode"] not in CREATION_MODES and not (
+        filters["categories"] or filters["departments"] or filters["users"]
+    )
+
+def scheme_flow_section(data):
+    st.header("🔄 Scheme Flow")
+    if data["sql"]:
+        sankey_scheme_flow(data["workflow"], cache_key=data["cache_key"], flow_counts=data["sql"]["flow_counts"])
+    elif data["transitions"] is not None and date_only(data["filters"]):
+        # Sum the daily transition table instead of grouping workflow rows
+        sankey_scheme_flow(data["workflow"], cache_key=data["cache_key"],
+                           transitions=data["transitions"], date_range=data["filters"]["date_range"],
+                           all_workflow=data["all_workflow"], index=data["index"])
+    else:
+        sankey_scheme_flow(data["workflow"], cache_key=data["cache_key"])
+
+def scheme_flow_preps(data):
+    if data["workflow"].empty or data["sql"]:
+        return []
+    if data["transitions"] is not None and date_only(data["filters"]):
+        return [(prep_transition_flow, (data["transitions"], data["all_workflow"], data["index"],
+                                        *data["filters"]["date_range"]))]
+    return [(prep_scheme_flow, (data["workflow"],))]
+
+def aging_section(data):
+    st.header("⏳ Aging Analysis")
+    aging_bucket_distribution(data["schemes"], cache_key=data["cache_key"], counts=data["sql"].get("aging_counts"))
+
+def reports_section(data):
+    st.header("🗓️ Annual Reports")
+    display_annual_reports(data["all_workflow"], data["version"])
+
+def data_health_section(data):
+    st.header("⚠️ Data Quality & Health")
+    display_data_health(data["health"], data["health_history"])
+    display_selection_health(data["schemes"], data["workflow"], data["attachments"], cache_key=data["cache_key"])
+
+def detailed_data_section(data):
+    st.header("📋 Detailed Scheme Data")
+    # Rows, count and sort order come from the filter index over the full table
+    paged_table(data["all_schemes"], key="detailed_table", rows=data["selection"]["schemes"], index=data["index"])
+
+def no_preps(data):
+    return []
+
+def workflow_preps(*preps):
+    """Pre-warm jobs for prep functions over the filtered workflow (skipped when empty or answered by SQL)."""
+    return lambda data: [] if data["workflow"].empty or data["sql"] else [(prep, (data["workflow"],)) for prep in preps]
+
+SECTIONS = {
+    "Overview": (
+        overview_section,
+        lambda data: [] if data["schemes"].empty or data["workflow"].empty else [
+            *([] if data["monthly"] is not None else [(prep_avg_processing_time, (data["workflow"],))]),
+            *([] if data["sql"] else [(prep_category_counts, (data["schemes"],))]),
+            (prep_avg_time_bins, (data["schemes"], data["workflow"], data["facts"])),
+        ],
+        ["bins_val", "histogram_range", "histogram_selected_bin"] + table_state_keys("histogram_table"),
+    ),
+    "Performance": (performance_section, workflow_preps(prep_performance), table_state_keys("performance_table")),
+    "Scheme Flow": (scheme_flow_section, scheme_flow_preps, []),
+    "Aging Analysis": (
+        aging_section,
+        lambda data: [] if data["schemes"].empty or data["sql"] else [(prep_aging_counts, (data["schemes"],))],
+        [],
+    ),
+    "Annual Reports": (reports_section, no_preps, ["report_group", "report_year"] + table_state_keys("report_table")),
+    "Data Health": (data_health_section, no_preps, HEALTH_STATE_KEYS),
+    "Detailed Data": (detailed_data_section, no_preps, table_state_keys("detailed_table")),
+}
+
+def keep_widget_state(sections):
+    """
+    Streamlit drops the state of widgets that are not rendered in a run;
+    re-assigning the keys keeps hidden sections' widgets as the user left them.
+    """
+    for _, _, keys in sections.values():
+        for key in keys:
+            if key in st.session_state:
+                st.session_state[key] = st.session_state[key]
+
+
 def main():
     st.set_page_config(layout="wide", page_title="Workflow Dashboard", page_icon="📊")
+    # Per-rerun timings of loaders, filters and charts (SCHEMES_PROFILE=1)
+    rerun = start_rerun()
     # accessibility_options()
 
     st.title("📊 Workflow Dashboard")
 
-    # Load data
-    schemes = load_schemes()
-    workflow = load_workflow()
-    attachments = load_attachments()
-    data_health = load_health_metrics()
+    # Background refresh of the dataset when the raw CSVs change (SCHEMES_REFRESH_SECONDS)
+    refresher = start_refresher(DATA_DIR, warm=warm_dataset, retire=evict_directory)
+    if refresher is not None and refresher.status["building"]:
+        st.sidebar.caption("🔄 Building a new dataset version...")
+    if refresher is not None and refresher.status["last_error"]:
+        st.sidebar.caption(f"⚠️ Last data refresh failed: {refresher.status['last_error']}")
+
+    # Load data; the whole rerun reads the dataset version active now
+    pin_dataset()
+    version = dataset_version()
+    tables = load_tables_async(DASHBOARD_LOADERS)
+    with span("load: KPI tables"):
+        schemes, workflow, attachments = (tables[name].result() for name in ("schemes", "workflow", "attachments"))
+        scheme_cube, workflow_cube = tables["scheme_cube"].result(), tables["workflow_cube"].result()
+        facts_table = tables["scheme_facts"].result()
+    if dataset_version() != version:
+        version = None  # tables were rewritten while loading; don't cache the index
+
+    # Filter index, scheme facts and cube indexes, built once per dataset version and shared by all sessions
+    index = get_filter_index(schemes, workflow, attachments, version)
+    scheme_facts = get_scheme_facts(facts_table, index, workflow, version)
+    scheme_cube = get_cube_index(scheme_cube, SCHEME_CUBE, version)
+    workflow_cube = get_cube_index(workflow_cube, WORKFLOW_CUBE, version)
 
     # Sidebar filters
-    filters = sidebar_filters(schemes, workflow)
+    filters = sidebar_filters(schemes, workflow, index)
 
     # Filter data
-    filtered_schemes, filtered_workflow, filtered_attachments = filter_data(schemes, workflow, attachments, filters)
+    filtered_schemes, filtered_workflow, filtered_attachments = filter_data(schemes, workflow, attachments, filters, index)
 
-    # KPI Cards
-    display_kpi_cards(filtered_schemes, filtered_workflow,filtered_attachments)
+    # Charts reuse their prepared data while the filter state is unchanged
+    cache_key = filter_fingerprint(filters, version)
 
-     # Main tabs for organization
-    tabs = st.tabs(["Overview", "Performance", "Scheme Flow", "Aging Analysis", "Data Health", "Detailed Data"])
+    # Per-scheme totals of the selection, reduced from the fact table by scheme code
+    facts = None
+    if scheme_facts is not None:
+        facts = scheme_facts.select(filters["selection"], filters["filter_mode"] in CREATION_MODES)
 
-    with tabs[0]:
-        st.header("📈 Overview")
-        line_avg_processing_time(filtered_workflow)
-        bar_scheme_count_by_category(filtered_schemes)
-        histogram_avg_time_bins(filtered_schemes, filtered_workflow)
+    sql = {}
+    if QUERY_BACKEND == "duckdb":
+        # KPIs and chart aggregations run as SQL over the table files
+        sql = prep_sql_aggregates(filters, version, cache_key=cache_key)
+        kpis, monthly = dict(sql["kpis"]), sql["monthly"]
+    else:
+        # KPIs and the monthly trend are summed from the daily cubes where they can be
+        kpis, monthly = cube_answers(filters, index, scheme_cube, workflow_cube, schemes, workflow, attachments)
+        if facts is not None:
+            kpis = {**facts.kpis(), **kpis}
 
+    # Optional approximate distinct counts for large selections (SCHEMES_DISTINCT_COUNTS=approx)
+    if not sql and use_sketches(filters["selection"]):
+        approx = approx_distinct(filters, index, load_scheme_sketch(), load_workflow_sketch(), schemes, workflow)
+        kpis.update(approx)
+        if approx:
+            st.caption(f"Distinct counts are approximate (standard error ±{STANDARD_ERROR:.1%}).")
 
-    with tabs[1]:
-        st.header("🏆 Performance")
-        performance_matrix(filtered_workflow)
-
-    with tabs[2]:
-        st.header("🔄 Scheme Flow")
-        sankey_scheme_flow(filtered_workflow)
+    # KPI Cards
+    display_kpi_cards(filtered_schemes, filtered_workflow, filtered_attachments, kpis)
 
-    with tabs[3]:
-        st.header("⏳ Aging Analysis")
-        aging_bucket_distribution(filtered_schemes)
+    # The remaining tables have been loading while the sidebar and KPI strip rendered
+    with span("load: remaining tables"):
+        data_health, health_history, transitions = (
+            tables[name].result() for name in ("health", "health_history", "transitions")
+        )
 
-    with tabs[4]:
-        st.header("⚠️ Data Quality & Health")
-        display_data_health(data_health)
+    data = {
+        "schemes": filtered_schemes,
+        "workflow": filtered_workflow,
+        "attachments": filtered_attachments,
+        "health": data_health,
+        "health_history": health_history,
+        "cache_key": cache_key,
+        "filters": filters,
+        "transitions": transitions,
+        "monthly": monthly,
+        "sql": sql,
+        "all_schemes": schemes,
+        "all_workflow": workflow,
+        "version": version,
+        "selection": filters["selection"],
+        "index": index,
+        "facts": facts,
+    }
 
-    with tabs[5]:
-        st.header("📋 Detailed Scheme Data")
-        st.dataframe(filtered_schemes.reset_index(drop=True))
+    # Main sections for organization
+    if NAVIGATION == "tabs":
+        tabs = st.tabs(list(SECTIONS))
+        for tab, (name, (render, _, _)) in zip(tabs, SECTIONS.items()):
+            with tab, span(f"section: {name}"):
+                render(data)
+    else:
+        section = st.radio("Section", list(SECTIONS), horizontal=True, key="section", label_visibility="collapsed")
+        keep_widget_state(SECTIONS)
+        with span(f"section: {section}"):
+            SECTIONS[section][0](data)
+        prewarm_preps(
+            [job for name, (_, preps, _) in SECTIONS.items() if name != section for job in preps(data)],
+            cache_key,
+        )
 
     # Footer / last updated or attribution
     st.markdown("---")
     st.caption("Created by Tanay.")
 
+    if rerun is not None:
+        display_rerun_timings(finish_rerun())
+
 
 if __name__ == "__main__":
     main()
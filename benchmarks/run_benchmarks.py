@@ -0,0 +1,342 @@
+import argparse
+import gc
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from benchmarks.synthetic_data import generate, parse_scale, format_scale
+from utils import data_loader, preprocessing
+from utils.filter_index import CREATION_MODES, FilterIndex
+from utils.health import HealthAudit
+from utils.cube import SCHEME_CUBE, WORKFLOW_CUBE, cube_answers, get_cube_index
+from utils.facts import SchemeFacts
+from app import WORKFLOW_COLUMNS, ATTACHMENT_COLUMNS, filter_data
+from components.kpi_cards import compute_kpis
+from components.reports import annual_report
+from components.charts import (
+    prep_avg_processing_time,
+    prep_category_counts,
+    prep_scheme_flow,
+    prep_transition_flow,
+    prep_aging_counts,
+    prep_performance,
+    prep_avg_time_bins,
+)
+
+# --- Benchmark Suite ---
+# For each scale: generate synthetic raw exports (benchmarks.synthetic_data),
+# run the preprocessing.main stages one by one, then time the loaders, the
+# filter index, filter_data in both filter modes, every chart data prep and
+# the KPI aggregation behind display_kpi_cards. Each measurement records wall
+# time (min and median over --repeat runs) and the Python heap high-water mark
+# (tracemalloc; numpy and pandas buffers included, Arrow buffers not). The
+# peak comes from one extra run of its own: tracing every allocation slows
+# pandas code several times over, so timed runs are never traced. Results go
+# to a JSON file that --compare diffs against an earlier run.
+#
+#   python -m benchmarks.run_benchmarks --scales 10k,100k,1M --format parquet -o results.json
+#   python -m benchmarks.run_benchmarks --scales 100k --compare results.json
+
+DEFAULT_SCALES = "10k,100k,1M"
+
+class Benchmark:
+    def __init__(self, repeat=3, trace_memory=True):
+        self.repeat = repeat
+        self.trace_memory = trace_memory
+        self.results = []
+
+    def measure(self, group, name, func, *args, repeat=None, rows_in=None, **kwargs):
+        """
+        Time `func(*args, **kwargs)`, record the result row and return func's
+        value. `func` must give the same result when called again.
+        """
+        peak = None
+        if self.trace_memory:
+            gc.collect()
+            tracemalloc.start()
+            try:
+                func(*args, **kwargs)
+            finally:
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+        runs = []
+        value = None
+        for _ in range(repeat or self.repeat):
+            value = None
+            gc.collect()
+            start = time.perf_counter()
+            try:
+                value = func(*args, **kwargs)
+            finally:
+                runs.append(time.perf_counter() - start)
+        self.results.append({
+            "group": group,
+            "name": name,
+            "seconds": min(runs),
+            "median_seconds": statistics.median(runs),
+            "runs": len(runs),
+            "peak_mb": round(peak / 2**20, 2) if peak is not None else None,
+            "rows_in": rows_in,
+            "rows_out": rows_of(value),
+        })
+        print(f"  {group:<14} {name:<60} {min(runs):9.4f}s"
+              + (f" {peak / 2**20:9.1f} MB" if peak is not None else ""), flush=True)
+        return value
+
+def rows_of(value):
+    if isinstance(value, (pd.DataFrame, pd.Series)):
+        return len(value)
+    if isinstance(value, tuple) and value and all(isinstance(v, pd.DataFrame) for v in value):
+        return sum(len(v) for v in value)
+    return None
+
+def peak_rss_mb():
+    """Process resident-set high-water mark so far, or None where unavailable."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+# --- Stages ---
+
+def bench_preprocessing(bench, raw_dir, outdir, fmt):
+    """The stages of preprocessing.main, in order, on the raw CSVs in raw_dir."""
+    group = "preprocessing"
+    schemes, workflow, attachments = bench.measure(group, "load_csvs", preprocessing.load_csvs, raw_dir, repeat=1)
+    rows = len(schemes) + len(workflow) + len(attachments)
+    audits = []
+    def clean_and_enrich():
+        audits.append(HealthAudit())  # a fresh audit per run, as the memory run calls this too
+        return preprocessing.clean_and_enrich(schemes, workflow, attachments, audits[-1])
+    try:
+        schemes, workflow, attachments = bench.measure(group, "clean_and_enrich", clean_and_enrich, repeat=1, rows_in=rows)
+        health = audits[-1]
+        tables = (schemes, workflow, attachments, outdir, fmt)
+        bench.measure(group, "save_clean_data", preprocessing.save_clean_data, *tables, repeat=1, rows_in=rows)
+        bench.measure(group, "generate_summary_tables", preprocessing.generate_summary_tables, *tables, repeat=1, rows_in=rows)
+        bench.measure(group, "generate_cubes", preprocessing.generate_cubes, *tables, repeat=1, rows_in=rows)
+        bench.measure(group, "save_health_summary", lambda: preprocessing.save_health_summary(health.result(), outdir), repeat=1)
+    finally:
+        for audit in audits:
+            audit.close()
+
+def bench_loaders(bench, outdir, fmt):
+    """Cold (empty cache) and warm loads of every table the dashboard reads."""
+    data_loader.DATA_DIR, data_loader.DATA_FORMAT = outdir, fmt
+    loaders = {
+        "load_schemes": lambda: data_loader.load_schemes(),
+        "load_workflow": lambda: data_loader.load_workflow(columns=WORKFLOW_COLUMNS),
+        "load_attachments": lambda: data_loader.load_attachments(columns=ATTACHMENT_COLUMNS),
+        "load_health_metrics": data_loader.load_health_metrics,
+        "load_summary_transitions": data_loader.load_summary_transitions,
+        "load_scheme_cube": data_loader.load_scheme_cube,
+        "load_workflow_cube": data_loader.load_workflow_cube,
+        "load_scheme_facts": data_loader.load_scheme_facts,
+    }
+    for name, load in loaders.items():
+        def cold():
+            data_loader.clear_cache()
+            return load()
+        bench.measure("loaders", f"{name} (cold)", cold)
+        bench.measure("loaders", f"{name} (warm)", load)
+
+    def concurrent():
+        data_loader.clear_cache()
+        return {name: future.result() for name, future in data_loader.load_tables_async(loaders).items()}
+    bench.measure("loaders", "load_tables_async (cold, all tables)", concurrent)
+    data_loader.clear_cache()
+    return {name: load() for name, load in loaders.items()}
+
+def filter_scenarios(index, schemes, workflow):
+    """Filter dicts (as built by sidebar_filters) for both modes and three selectivities."""
+    start, end = index.scheme_dates.bounds()
+    last_year = (end - pd.DateOffset(months=12), end)
+    busiest = {
+        "Creation Info": schemes["department_at_time"].value_counts().index[0],
+        "Workflow Path": workflow["department"].value_counts().index[0],
+    }
+    scenarios = {}
+    for mode, department in busiest.items():
+        for label, date_range, departments in (
+            ("all time", (start, end), []),
+            ("12 months", last_year, []),
+            ("12 months, one department", last_year, [department]),
+        ):
+            scenarios[f"{mode} / {label}"] = {
+                "filter_mode": mode,
+                "date_range": date_range,
+                "categories": [],
+                "departments": departments,
+                "users": [],
+            }
+    return scenarios
+
+def bench_dashboard(bench, tables):
+    """Filter index, filter_data, chart preps and KPI aggregation on the loaded tables."""
+    schemes, workflow = tables["load_schemes"], tables["load_workflow"]
+    attachments = tables["load_attachments"]
+    rows = len(schemes) + len(workflow) + len(attachments)
+    index = bench.measure("filters", "FilterIndex", FilterIndex, schemes, workflow, attachments, rows_in=rows)
+    facts = tables["load_scheme_facts"]
+    if facts is not None:
+        facts = bench.measure("kpis", "SchemeFacts", SchemeFacts, facts, index, workflow, rows_in=len(facts))
+    cubes = {}
+    for name, table in ((SCHEME_CUBE, tables["load_scheme_cube"]), (WORKFLOW_CUBE, tables["load_workflow_cube"])):
+        if table is not None:
+            cubes[name] = bench.measure("kpis", f"CubeIndex [{name}]", get_cube_index, table, name, rows_in=len(table))
+
+    selections = {}
+    for label, filters in filter_scenarios(index, schemes, workflow).items():
+        selections[label] = filters, bench.measure(
+            "filters", f"filter_data [{label}]", filter_data, schemes, workflow, attachments, filters, index,
+            rows_in=rows,
+        )
+
+    for label in ("Creation Info / all time", "Workflow Path / 12 months"):
+        filters, (f_schemes, f_workflow, f_attachments) = selections[label]
+        group = "charts"
+        preps = {
+            "prep_avg_processing_time": (prep_avg_processing_time, (f_workflow,)),
+            "prep_category_counts": (prep_category_counts, (f_schemes,)),
+            "prep_scheme_flow": (prep_scheme_flow, (f_workflow,)),
+            "prep_aging_counts": (prep_aging_counts, (f_schemes,)),
+            "prep_performance": (prep_performance, (f_workflow,)),
+            "prep_avg_time_bins": (prep_avg_time_bins, (f_schemes, f_workflow)),
+            "annual_report": (annual_report, (f_workflow,)),
+        }
+        if tables["load_summary_transitions"] is not None and filters["filter_mode"] == "Workflow Path":
+            preps["prep_transition_flow"] = (
+                prep_transition_flow, (tables["load_summary_transitions"], workflow, index, *filters["date_range"]),
+            )
+        for name, (prep, args) in preps.items():
+            bench.measure(group, f"{name} [{label}]", prep, *args, rows_in=sum(len(a) for a in args[:2]))
+
+    # KPI strip from the filtered rows vs from the cubes (rows only for what they can't answer)
+    for label, (filters, (f_schemes, f_workflow, f_attachments)) in selections.items():
+        filtered = len(f_schemes) + len(f_workflow) + len(f_attachments)
+        bench.measure("kpis", f"compute_kpis [{label}]", compute_kpis, f_schemes, f_workflow, f_attachments,
+                      rows_in=filtered)
+        if cubes:
+            def from_cubes():
+                kpis, monthly = cube_answers(filters, index, cubes.get(SCHEME_CUBE), cubes.get(WORKFLOW_CUBE),
+                                             schemes, workflow, attachments)
+                return compute_kpis(f_schemes, f_workflow, f_attachments, kpis), monthly
+            bench.measure("kpis", f"cube_answers [{label}]", cube_answers, filters, index, cubes.get(SCHEME_CUBE),
+                          cubes.get(WORKFLOW_CUBE), schemes, workflow, attachments)
+            bench.measure("kpis", f"compute_kpis from cubes [{label}]", from_cubes, rows_in=filtered)
+        if facts is not None:
+            selection = index.resolve(filters)
+            bench.measure("kpis", f"scheme facts kpis [{label}]",
+                          lambda: facts.select(selection, filters["filter_mode"] in CREATION_MODES).kpis(),
+                          rows_in=len(selection["schemes"]))
+
+# --- Runs ---
+
+def run_scale(workflow_rows, workdir, fmt, bench, seed=0):
+    label = format_scale(workflow_rows)
+    raw_dir = os.path.join(workdir, f"raw_{label}_{seed}")
+    outdir = os.path.join(workdir, f"out_{label}_{fmt}")
+    if not os.path.exists(os.path.join(raw_dir, "attachments.csv")):
+        print(f"Generating {label} workflow rows in {raw_dir} ...", flush=True)
+        generate(raw_dir, workflow_rows, seed)
+    shutil.rmtree(outdir, ignore_errors=True)
+    os.makedirs(outdir)
+
+    start = len(bench.results)
+    print(f"Scale {label}:", flush=True)
+    bench_preprocessing(bench, raw_dir, outdir, fmt)
+    tables = bench_loaders(bench, outdir, fmt)
+    bench_dashboard(bench, tables)
+    data_loader.clear_cache()
+    raw_bytes = sum(os.path.getsize(os.path.join(raw_dir, f)) for f in os.listdir(raw_dir))
+    return {
+        "workflow_rows": workflow_rows,
+        "raw_mb": round(raw_bytes / 2**20, 1),
+        "results": bench.results[start:],
+    }
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(report, baseline):
+    """Print the time ratio of every measurement that appears in both reports."""
+    print(f"\nComparison with {baseline.get('meta', {}).get('commit') or 'baseline'} (new / old):")
+    for scale, run in report["scales"].items():
+        old = {(r["group"], r["name"]): r for r in baseline.get("scales", {}).get(scale, {}).get("results", [])}
+        for r in run["results"]:
+            before = old.get((r["group"], r["name"]))
+            if before and before["seconds"] > 0:
+                ratio = r["seconds"] / before["seconds"]
+                flag = "  slower" if ratio > 1.2 else "  faster" if ratio < 0.8 else ""
+                print(f"  {scale:>5} {r['group']:<14} {r['name']:<60} {before['seconds']:9.4f}s -> "
+                      f"{r['seconds']:9.4f}s  x{ratio:5.2f}{flag}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark preprocessing, loading, filtering and chart preps.")
+    parser.add_argument("--scales", default=DEFAULT_SCALES,
+                        help=f"comma-separated workflow row counts, 10k to 10M (default {DEFAULT_SCALES})")
+    parser.add_argument("--format", choices=sorted(preprocessing.FORMATS), default="parquet",
+                        help="storage format written by preprocessing and read by the loaders")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per dashboard measurement (min is reported)")
+    parser.add_argument("--seed", type=int, default=0, help="seed of the synthetic data")
+    parser.add_argument("--workdir", default=None,
+                        help="keep generated data here and reuse it across runs (default: a temp dir)")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="skip the extra tracemalloc run that measures each step's peak memory")
+    parser.add_argument("-o", "--output", default="benchmark_results.json", help="JSON report path")
+    parser.add_argument("--compare", default=None, help="earlier JSON report to compare against")
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="schemes_bench_")
+    bench = Benchmark(repeat=args.repeat, trace_memory=not args.no_memory)
+    report = {
+        "meta": {
+            "timestamp": pd.Timestamp.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "format": args.format,
+            "seed": args.seed,
+            "repeat": args.repeat,
+            "python": platform.python_version(),
+            "pandas": pd.__version__,
+            "numpy": np.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "scales": {},
+    }
+    try:
+        for scale in args.scales.split(","):
+            rows = parse_scale(scale)
+            report["scales"][format_scale(rows)] = run_scale(rows, workdir, args.format, bench, args.seed)
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+    report["meta"]["peak_rss_mb"] = peak_rss_mb()
+
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, default=str)
+    print(f"\nResults written to {args.output} (peak RSS {report['meta']['peak_rss_mb']} MB)")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+if __name__ == "__main__":
+    main()
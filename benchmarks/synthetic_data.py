@@ -0,0 +1,162 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+# --- Synthetic Raw Exports ---
+# Writes schemes.csv, workflow.csv and attachments.csv shaped like the real
+# exports read by utils/preprocessing.py: day-first text dates, scheme
+# labels with inconsistent case and padding (which preprocessing normalizes),
+# a few missing values and duplicate rows. Departments, users and categories follow Zipf-like
+# popularity, so a handful of them own most of the rows as in production.
+# Schemes are generated in blocks and appended, so memory stays bounded at
+# any scale.
+
+START = pd.Timestamp("2018-01-01")
+SPAN_DAYS = 8 * 365
+DATE_FORMAT = "%d-%m-%Y %H:%M"
+
+N_DEPARTMENTS = 24
+N_CATEGORIES = 14
+N_PLANTS = 8
+STEPS_PER_SCHEME = 5          # mean workflow rows per scheme
+ATTACHMENTS_PER_SCHEME = 2    # mean attachment rows per scheme
+BLOCK_SCHEMES = 100_000
+
+MISSING_RATE = 0.002
+DUPLICATE_RATE = 0.001
+
+def parse_scale(text):
+    """'10k', '2.5M' or '100000' -> number of workflow rows."""
+    text = str(text).strip().lower()
+    factor = {"k": 1_000, "m": 1_000_000}.get(text[-1:], 1)
+    return int(float(text[:-1] if factor > 1 else text) * factor)
+
+def format_scale(rows):
+    """Inverse of parse_scale for labels: 10000 -> '10k'."""
+    for suffix, factor in (("M", 1_000_000), ("k", 1_000)):
+        if rows >= factor and rows % factor == 0:
+            return f"{rows // factor}{suffix}"
+    return str(rows)
+
+def zipf_weights(n, s=1.1):
+    weights = 1.0 / np.arange(1, n + 1) ** s
+    return weights / weights.sum()
+
+def messy(labels, rng):
+    """Labels as a hand-typed export has them: mixed case, stray spaces."""
+    labels = np.asarray(labels, dtype=object)
+    variants = rng.integers(0, 4, len(labels))
+    return np.where(variants == 0, np.char.lower(labels.astype(str)),
+                    np.where(variants == 1, np.char.add(labels.astype(str), " "), labels)).astype(object)
+
+def with_missing(values, rng, rate=MISSING_RATE):
+    values = np.asarray(values, dtype=object)
+    values[rng.random(len(values)) < rate] = None
+    return values
+
+class Population:
+    """Departments, their users and the label vocabularies for one dataset."""
+
+    def __init__(self, workflow_rows, rng):
+        self.departments = np.array([f"DEPT_{i:02d}" for i in range(N_DEPARTMENTS)])
+        self.department_weights = zipf_weights(N_DEPARTMENTS)
+        n_users = int(np.clip(workflow_rows // 2_000, 50, 5_000))
+        self.users = np.array([f"USER_{i:05d}" for i in range(n_users)])
+        # Every user works in one department; big departments get more users
+        self.user_department = rng.choice(N_DEPARTMENTS, n_users, p=self.department_weights)
+        self.user_weights = zipf_weights(n_users, 0.8)
+        self.categories = np.array([f"CATEGORY_{i:02d}" for i in range(N_CATEGORIES)])
+        self.category_weights = zipf_weights(N_CATEGORIES)
+        self.plants = np.array([f"PLANT_{i}" for i in range(N_PLANTS)])
+
+    def pick_users(self, n, rng):
+        users = rng.choice(len(self.users), n, p=self.user_weights)
+        return self.users[users], self.departments[self.user_department[users]]
+
+def step_counts(workflow_rows, rng):
+    """Workflow rows per scheme (geometric, at least one), summing to workflow_rows."""
+    counts = rng.geometric(1 / STEPS_PER_SCHEME, workflow_rows // STEPS_PER_SCHEME * 2 + 1)
+    total = np.cumsum(counts)
+    cut = int(np.searchsorted(total, workflow_rows))
+    counts[cut] -= total[cut] - workflow_rows
+    return counts[:cut + 1]
+
+def scheme_block(first_id, counts, population, rng):
+    """Raw rows of the schemes [first_id, first_id + len(counts))."""
+    n = len(counts)
+    ids = np.arange(first_id, first_id + n)
+    # More schemes in recent years
+    created = START + pd.to_timedelta(np.sqrt(rng.random(n)) * SPAN_DAYS * 24 * 60, unit="min").floor("min")
+    creators, creator_departments = population.pick_users(n, rng)
+    schemes = pd.DataFrame({
+        "scheme_id": ids,
+        "creationDate": with_missing(created.strftime(DATE_FORMAT), rng),
+        "department_at_time": messy(creator_departments, rng),
+        "createdBy": creators,
+        "category": with_missing(messy(rng.choice(population.categories, n, p=population.category_weights), rng), rng),
+        "plant": rng.choice(population.plants, n),
+    })
+
+    # Steps follow each other with log-normal waits (hours) after creation
+    steps = int(counts.sum())
+    scheme_of_step = np.repeat(np.arange(n), counts)
+    waits = rng.lognormal(mean=2.5, sigma=1.2, size=steps)
+    elapsed = np.cumsum(waits)
+    elapsed -= np.repeat(np.concatenate([[0], elapsed])[np.cumsum(counts) - counts], counts)
+    forwarded = created[scheme_of_step] + pd.to_timedelta(elapsed * 60, unit="min").floor("min")
+    users, departments = population.pick_users(steps, rng)
+    workflow = pd.DataFrame({
+        "scheme_id": ids[scheme_of_step],
+        "forwarded_at": forwarded.strftime(DATE_FORMAT),
+        "user": users,
+        "department": departments,
+        "time_taken": with_missing(np.round(waits, 2), rng),
+    })
+    workflow = workflow.iloc[np.argsort(forwarded.to_numpy(), kind="stable")]
+
+    n_files = rng.poisson(ATTACHMENTS_PER_SCHEME, n)
+    scheme_of_file = np.repeat(np.arange(n), n_files)
+    file_users, file_departments = population.pick_users(len(scheme_of_file), rng)
+    attachments = pd.DataFrame({
+        "scheme_id": ids[scheme_of_file],
+        "fileName": with_missing(
+            [f"scheme_{s}_doc_{k}.pdf" for s, k in zip(ids[scheme_of_file], rng.integers(0, 50, len(scheme_of_file)))],
+            rng,
+        ),
+        "user": file_users,
+        "department": file_departments,
+    })
+    return schemes, duplicate_some(workflow, rng), duplicate_some(attachments, rng)
+
+def duplicate_some(df, rng, rate=DUPLICATE_RATE):
+    repeats = df[rng.random(len(df)) < rate]
+    return pd.concat([df, repeats]) if len(repeats) else df
+
+def generate(outdir, workflow_rows, seed=0):
+    """
+    Write synthetic raw exports with `workflow_rows` workflow rows (plus a
+    few duplicates) to `outdir`; returns the row count written per file.
+    """
+    rng = np.random.default_rng(seed)
+    os.makedirs(outdir, exist_ok=True)
+    population = Population(workflow_rows, rng)
+    counts = step_counts(workflow_rows, rng)
+    n_schemes = len(counts)
+
+    rows = {"schemes": 0, "workflow": 0, "attachments": 0}
+    paths = {key: os.path.join(outdir, f"{key}.csv") for key in rows}
+    for first in range(0, n_schemes, BLOCK_SCHEMES):
+        block = scheme_block(first, counts[first:first + BLOCK_SCHEMES], population, rng)
+        for (key, path), df in zip(paths.items(), block):
+            df.to_csv(path, mode="w" if first == 0 else "a", header=first == 0, index=False)
+            rows[key] += len(df)
+    return rows
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Write synthetic schemes/workflow/attachments CSVs.")
+    parser.add_argument("outdir", help="directory for the raw CSVs")
+    parser.add_argument("--rows", default="100k", help="workflow rows, e.g. 10k, 1M (default 100k)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    print(generate(args.outdir, parse_scale(args.rows), args.seed))
@@ -1,25 +1,270 @@
 # File: components/charts.py
 
+import functools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
 import plotly.express as px
 import pandas as pd
 import plotly.graph_objects as go
 import numpy as np
 
-def line_avg_processing_time(workflow_df: pd.DataFrame):
+from components.tables import paged_table
+from utils.instrumentation import timed
+from utils.cube import whole_days
+
+# --- Data-prep memo ---
+# Every chart is split into a pure prep_* function (pandas only, no Streamlit)
+# and a thin render wrapper. When the caller passes `cache_key` (the filter
+# fingerprint from utils.filter_index), prep results are reused across reruns,
+# so switching tabs or editing a chart widget does not redo the aggregations.
+
+_prep_cache = OrderedDict()     # (prep name, cache_key, kwargs) -> result, in LRU order
+_prep_lock = threading.Lock()
+MAX_PREP_ENTRIES = 64
+
+def memoized_prep(func):
+    """Memoize a prep function on the `cache_key` keyword; no key means no caching."""
+    @functools.wraps(func)
+    def wrapper(*args, cache_key=None, **kwargs):
+        if cache_key is None:
+            return func(*args, **kwargs)
+        key = (func.__name__, cache_key, tuple(sorted(kwargs.items())))
+        with _prep_lock:
+            if key in _prep_cache:
+                _prep_cache.move_to_end(key)
+                return _prep_cache[key]
+        result = func(*args, **kwargs)
+        with _prep_lock:
+            _prep_cache[key] = result
+            while len(_prep_cache) > MAX_PREP_ENTRIES:
+                _prep_cache.popitem(last=False)
+        return result
+    return wrapper
+
+def clear_prep_cache():
+    with _prep_lock:
+        _prep_cache.clear()
+
+# Background pre-warming: once the visible section has rendered, the prep
+# functions of the other sections are run on a single worker thread so that
+# switching sections finds their results already memoized.
+_prewarm_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="chart-prewarm")
+_prewarm_submitted = OrderedDict()
+
+def prewarm_preps(jobs, cache_key):
+    """Queue (prep function, args) pairs to be memoized under `cache_key` in the background."""
+    if cache_key is None:
+        return
+    for prep, args in jobs:
+        job_key = (prep.__name__, cache_key)
+        with _prep_lock:
+            if job_key in _prewarm_submitted:
+                continue
+            _prewarm_submitted[job_key] = True
+            while len(_prewarm_submitted) > MAX_PREP_ENTRIES:
+                _prewarm_submitted.popitem(last=False)
+        _prewarm_pool.submit(_run_prewarm, prep, args, cache_key)
+
+def _run_prewarm(prep, args, cache_key):
+    try:
+        prep(*args, cache_key=cache_key)
+    except Exception:
+        pass  # best effort; the section computes (and reports) it when opened
+
+@timed()
+@memoized_prep
+def prep_avg_processing_time(workflow_df: pd.DataFrame) -> pd.DataFrame:
+    """Mean time_taken per calendar month of forwarded_at."""
+    month = workflow_df['forwarded_at'].dt.to_period('M').dt.to_timestamp().rename('month')
+    return workflow_df['time_taken'].groupby(month).mean().reset_index()
+
+@timed()
+@memoized_prep
+def prep_category_counts(schemes_df: pd.DataFrame) -> pd.DataFrame:
+    counts = schemes_df['category'].value_counts().reset_index()
+    counts.columns = ['category', 'count']
+    return counts
+
+@timed()
+@memoized_prep
+def prep_scheme_flow(workflow_df: pd.DataFrame) -> dict:
+    """Sankey nodes and department -> next_department link counts."""
+    flow_counts = workflow_df.groupby(['department', 'next_department'], observed=True).size().reset_index(name='count')
+    return flow_from_counts(flow_counts)
+
+@timed()
+@memoized_prep
+def prep_transition_flow(transitions: pd.DataFrame, workflow_df: pd.DataFrame, index, start, end) -> dict:
+    """
+    Sankey flow for all steps forwarded in [start, end] from the daily
+    transition table. Days only partly inside the range (at most the two
+    boundary days) are counted from their rows, looked up in the FilterIndex
+    `index` of the full `workflow_df`.
+    """
+    first, stop, partials = whole_days(start, end)
+    days = transitions['transition_date']  # the table is sorted by day
+    whole = transitions.iloc[days.searchsorted(first):days.searchsorted(stop)]
+    rows = [index.workflow_dates.rows(lo, hi, inclusive) for lo, hi, inclusive in partials]
+    partial = workflow_df.iloc[np.concatenate(rows)] if rows else workflow_df.iloc[:0]
+    departments = department_codes(whole, partial)
+    totals = pair_totals(whole, departments, whole['transitions'])
+    if len(partial):
+        totals += pair_totals(partial, departments)
+    n = len(departments)
+    seen = np.flatnonzero(totals)
+    return flow_from_counts(pd.DataFrame({
+        'department': departments[seen // n],
+        'next_department': departments[seen % n],
+        'count': totals[seen].astype('int64'),
+    }))
+
+def department_codes(*frames):
+    """
+    Departments (either side of a step) of `frames`: the shared vocabulary
+    when every column is dictionary-encoded against it (the longest one, as
+    the vocabulary only grows by appending), otherwise the sorted values.
+    """
+    columns = [frame[col] for frame in frames for col in ('department', 'next_department')]
+    if all(isinstance(c.dtype, pd.CategoricalDtype) for c in columns):
+        vocabularies = [c.cat.categories for c in columns]
+        longest = max(vocabularies, key=len)
+        if all(longest[:len(v)].equals(v) for v in vocabularies):
+            return longest
+    return pd.Index(pd.unique(pd.concat([c.astype(object) for c in columns]).dropna())).sort_values()
+
+def pair_totals(frame, departments, weights=None):
+    """
+    Row counts (or sums of `weights`) of every (department, next_department)
+    pair of `frame`, as a flat array indexed by code(department) * n +
+    code(next_department) over `departments`. One bincount over category
+    codes; pairs with a missing side are left out.
+    """
+    n = len(departments)
+    source = pd.Categorical(frame['department'], categories=departments).codes
+    target = pd.Categorical(frame['next_department'], categories=departments).codes
+    valid = (source >= 0) & (target >= 0)
+    if weights is not None:
+        weights = np.asarray(weights, dtype=float)[valid]
+    return np.bincount(source[valid].astype(np.int64) * n + target[valid], weights=weights, minlength=n * n)
+
+def flow_from_counts(flow_counts: pd.DataFrame) -> dict:
+    """Sankey nodes and link indices from (department, next_department, count) rows."""
+    all_nodes = list(pd.unique(flow_counts[['department', 'next_department']].values.ravel('K')))
+    node_indices = {k: v for v, k in enumerate(all_nodes)}
+    return {
+        "nodes": all_nodes,
+        "source": flow_counts['department'].map(node_indices),
+        "target": flow_counts['next_department'].map(node_indices),
+        "value": flow_counts['count'],
+    }
+
+@timed()
+@memoized_prep
+def prep_aging_counts(schemes_df: pd.DataFrame) -> pd.DataFrame:
+    counts = schemes_df['aging_bucket'].value_counts().reindex(
+        ["< 90 days", "90–180 days", "> 180 days"], fill_value=0
+    ).reset_index()
+    counts.columns = ['Aging Bucket', 'Count']
+    return counts
+
+@timed()
+@memoized_prep
+def prep_performance(workflow_df: pd.DataFrame) -> pd.DataFrame:
+    """Schemes handled and mean processing time per user, with a tercile rating."""
+    df = workflow_df.groupby('user', observed=True).agg(
+        schemes_handled=('scheme_id', 'nunique'),
+        avg_processing_time=('time_taken', 'mean')
+    ).reset_index()
+    return rate_performance(df)
+
+def rate_performance(df: pd.DataFrame) -> pd.DataFrame:
+    """Add the Fast/Medium/Slow tercile of avg_processing_time."""
+    if not df.empty and df['avg_processing_time'].nunique() > 1:
+        df['performance'] = pd.qcut(df['avg_processing_time'], q=3, labels=["Fast", "Medium", "Slow"])
+    else:
+        df['performance'] = "N/A"
+    return df
+
+@timed()
+@memoized_prep
+def prep_inflow_counts(schemes_df: pd.DataFrame) -> pd.DataFrame:
+    return schemes_df.groupby('creationDate').size().reset_index(name='count')
+
+class AvgTimeBins:
+    """
+    Per-scheme average time_taken, computed and sorted once. `means` gives
+    the averages of the schemes_df rows directly, e.g. from the fact table.
+
+    Any (range, bin count) histogram is answered with searchsorted offsets
+    into the sorted averages, and a bin's schemes are a slice of the sorted
+    order, so re-binning costs O(bins) plus the rows actually shown.
+    """
+
+    def __init__(self, schemes_df: pd.DataFrame, workflow_df: pd.DataFrame, means=None):
+        if means is None:
+            avg = workflow_df.groupby("scheme_id", observed=True)['time_taken'].mean()
+            pos = avg.index.get_indexer(schemes_df['scheme_id'])
+            rows = np.flatnonzero(pos >= 0)
+            values = avg.to_numpy(dtype=float)[pos[rows]]
+        else:
+            # Already reduced per scheme row (FactSelection.scheme_means)
+            rows, values = np.arange(len(schemes_df)), np.asarray(means, dtype=float)
+        keep = ~np.isnan(values)
+        rows, values = rows[keep], values[keep]
+        order = np.argsort(values, kind="stable")
+        self.schemes = schemes_df
+        self.rows = rows[order]         # positions in schemes_df, by ascending average
+        self.sorted = values[order]
+
+    def __len__(self):
+        return len(self.sorted)
+
+    def bounds(self):
+        """Whole-hour (min, max) of the averages."""
+        return int(np.floor(self.sorted[0])), int(np.ceil(self.sorted[-1]))
+
+    def histogram(self, lo, hi, num_bins):
+        """
+        Bin edges, counts and sorted-order offsets for `num_bins` equal bins
+        over [lo, hi]; like np.histogram the last bin includes `hi`.
+        """
+        if lo >= hi:
+            lo, hi = lo - 0.5, hi + 0.5
+        edges = np.linspace(lo, hi, num_bins + 1)
+        offsets = np.searchsorted(self.sorted, edges, side="left")
+        offsets[-1] = np.searchsorted(self.sorted, hi, side="right")
+        return edges, np.diff(offsets), offsets
+
+    def bin_schemes(self, offsets, i):
+        """Schemes in bin `i` with their avg_time_taken, in ascending order."""
+        start, stop = offsets[i], offsets[i + 1]
+        return self.schemes.iloc[self.rows[start:stop]].assign(avg_time_taken=self.sorted[start:stop])
+
+@timed()
+@memoized_prep
+def prep_avg_time_bins(schemes_df: pd.DataFrame, workflow_df: pd.DataFrame, facts=None) -> AvgTimeBins:
+    """`facts` is the FactSelection (utils.facts) of the filtered rows, if the fact table is available."""
+    return AvgTimeBins(schemes_df, workflow_df, None if facts is None else facts.scheme_means())
+
+# --- Charts ---
+
+@timed()
+def line_avg_processing_time(workflow_df: pd.DataFrame, cache_key=None, monthly=None):
     """
     Line chart for Average Processing Time Over Time (monthly).
+    `monthly` is an already aggregated (month, time_taken) frame, e.g. from
+    the daily workflow cube; otherwise the workflow rows are grouped.
     """
     if workflow_df.empty:
         st.info("No workflow data available for Average Processing Time chart.")
         return
 
-    df = workflow_df.copy()
-    if 'forwarded_at' not in df:
+    if 'forwarded_at' not in workflow_df:
         st.warning("The workflow data is missing the 'forwarded_at' datetime column.")
         return
-    df['month'] = df['forwarded_at'].dt.to_period('M').dt.to_timestamp()
-    avg_time = df.groupby('month')['time_taken'].mean().reset_index()
+    avg_time = monthly if monthly is not None else prep_avg_processing_time(workflow_df, cache_key=cache_key)
 
     fig = px.line(
         avg_time,
@@ -33,16 +278,19 @@ def line_avg_processing_time(workflow_df: pd.DataFrame):
 
     st.plotly_chart(fig, use_container_width=True)
 
-def bar_scheme_count_by_category(schemes_df: pd.DataFrame):
+@timed()
+def bar_scheme_count_by_category(schemes_df: pd.DataFrame, cache_key=None, counts=None):
     """
     Bar chart for Scheme Count by Category.
+    `counts` is an already aggregated (category, count) frame, e.g. from the
+    SQL query backend.
     """
     if schemes_df.empty:
         st.info("No scheme data available for Scheme Count by Category chart.")
         return
 
-    counts = schemes_df['category'].value_counts().reset_index()
-    counts.columns = ['category', 'count']
+    if counts is None:
+        counts = prep_category_counts(schemes_df, cache_key=cache_key)
 
     fig = px.bar(
         counts,
@@ -57,58 +305,64 @@ def bar_scheme_count_by_category(schemes_df: pd.DataFrame):
 
     st.plotly_chart(fig, use_container_width=True)
 
-def sankey_scheme_flow(workflow_df: pd.DataFrame):
+@timed()
+def sankey_scheme_flow(workflow_df: pd.DataFrame, cache_key=None, transitions=None, date_range=None,
+                       flow_counts=None, all_workflow=None, index=None):
     """
     Sankey diagram to visualize scheme flow between departments.
     Assumes workflow dataframe has 'department' and 'next_department' columns.
+    When `workflow_df` is exactly the steps forwarded within `date_range`,
+    pass the daily `transitions` table to sum it instead of grouping rows,
+    with the full workflow `all_workflow` and its FilterIndex `index` for
+    the boundary days.
+    `flow_counts` is an already aggregated (department, next_department,
+    count) frame, e.g. from the SQL query backend.
     """
     if workflow_df.empty:
         st.info("No workflow data available for Sankey diagram.")
         return
 
-    df = workflow_df.copy()
-    if 'next_department' not in df.columns or 'department' not in df.columns:
+    if 'next_department' not in workflow_df.columns or 'department' not in workflow_df.columns:
         st.warning("Sankey diagram requires 'department' and 'next_department' columns in workflow data.")
         return
 
-    flow_counts = df.groupby(['department', 'next_department']).size().reset_index(name='count')
-    all_nodes = list(pd.unique(flow_counts[['department', 'next_department']].values.ravel('K')))
-    node_indices = {k: v for v, k in enumerate(all_nodes)}
-
-    source_indices = flow_counts['department'].map(node_indices)
-    target_indices = flow_counts['next_department'].map(node_indices)
-    values = flow_counts['count']
+    if flow_counts is not None:
+        flow = flow_from_counts(flow_counts)
+    elif transitions is not None and date_range is not None:
+        flow = prep_transition_flow(transitions, all_workflow, index, *date_range, cache_key=cache_key)
+    else:
+        flow = prep_scheme_flow(workflow_df, cache_key=cache_key)
 
     fig = go.Figure(data=[go.Sankey(
         node=dict(
             pad=15,
             thickness=20,
             line=dict(color="black", width=0.5),
-            label=all_nodes,
+            label=flow["nodes"],
             color="blue"
         ),
         link=dict(
-            source=source_indices,
-            target=target_indices,
-            value=values
+            source=flow["source"],
+            target=flow["target"],
+            value=flow["value"]
         )
     )])
 
     fig.update_layout(title_text="Scheme Flow Between Departments", font_size=10, transition_duration=500)
     st.plotly_chart(fig, use_container_width=True)
 
-def aging_bucket_distribution(schemes_df: pd.DataFrame):
+@timed()
+def aging_bucket_distribution(schemes_df: pd.DataFrame, cache_key=None, counts=None):
     """
     Bar chart showing distribution of schemes across aging buckets.
+    `counts` is an already aggregated (Aging Bucket, Count) frame.
     """
     if schemes_df.empty:
         st.info("No scheme data available for aging bucket distribution.")
         return
 
-    counts = schemes_df['aging_bucket'].value_counts().reindex(
-        ["< 90 days", "90–180 days", "> 180 days"], fill_value=0
-    ).reset_index()
-    counts.columns = ['Aging Bucket', 'Count']
+    if counts is None:
+        counts = prep_aging_counts(schemes_df, cache_key=cache_key)
 
     fig = px.bar(
         counts,
@@ -128,44 +382,42 @@ def aging_bucket_distribution(schemes_df: pd.DataFrame):
 
     st.plotly_chart(fig, use_container_width=True)
 
-def performance_matrix(workflow_df: pd.DataFrame):
+@timed()
+def performance_matrix(workflow_df: pd.DataFrame, cache_key=None, performance=None):
     """
     Table showing performance metrics per user or department with highlighting.
+    `performance` is an already aggregated (user, schemes_handled,
+    avg_processing_time) frame, e.g. from the SQL query backend.
     """
     if workflow_df.empty:
         st.info("No workflow data available for Performance Matrix.")
         return
 
-    df = workflow_df.groupby('user').agg(
-        schemes_handled=('scheme_id', 'nunique'),
-        avg_processing_time=('time_taken', 'mean')
-    ).reset_index()
+    df = prep_performance(workflow_df, cache_key=cache_key) if performance is None else rate_performance(performance)
 
-    import numpy as np
-    if not df.empty and df['avg_processing_time'].nunique() > 1:
-        df['performance'] = pd.qcut(df['avg_processing_time'], q=3, labels=["Fast", "Medium", "Slow"])
-    else:
-        df['performance'] = "N/A"
+    # Optional: Use Streamlit-AgGrid if available, fallback to st.dataframe otherwise.
+    # Either way only the current page is sent; sorting and paging happen here.
+    def render_page(page_df):
+        try:
+            from st_aggrid import AgGrid
+            from st_aggrid.grid_options_builder import GridOptionsBuilder
+            gb = GridOptionsBuilder.from_dataframe(page_df)
+            gb.configure_side_bar()
+            gb.configure_default_column(editable=False, groupable=True)
+            grid_options = gb.build()
+            AgGrid(page_df, gridOptions=grid_options, enable_enterprise_modules=False)
+        except ImportError:
+            st.dataframe(page_df)
 
-    # Optional: Use Streamlit-AgGrid if available, fallback to st.dataframe otherwise
-    try:
-        from st_aggrid import AgGrid
-        from st_aggrid.grid_options_builder import GridOptionsBuilder
-        gb = GridOptionsBuilder.from_dataframe(df)
-        gb.configure_pagination(paginationAutoPageSize=True)
-        gb.configure_side_bar()
-        gb.configure_default_column(editable=False, groupable=True)
-        grid_options = gb.build()
-        AgGrid(df, gridOptions=grid_options, enable_enterprise_modules=False)
-    except ImportError:
-        st.dataframe(df)
+    paged_table(df, key="performance_table", render=render_page)
 
     st.markdown("""
     - **Fast**: Lower processing times (better performers)<br>
     - **Slow**: Higher processing times (need focus)<br>
     """)
 
-def calendar_heatmap_inflow_outflow(schemes_df: pd.DataFrame):
+@timed()
+def calendar_heatmap_inflow_outflow(schemes_df: pd.DataFrame, cache_key=None):
     """
     Calendar heatmap for scheme inflow counts per day.
     """
@@ -173,7 +425,7 @@ def calendar_heatmap_inflow_outflow(schemes_df: pd.DataFrame):
         st.info("No scheme data available for Calendar Heatmap.")
         return
 
-    inflow_counts = schemes_df.groupby('creationDate').size().reset_index(name='count')
+    inflow_counts = prep_inflow_counts(schemes_df, cache_key=cache_key)
 
     try:
         import calplot
@@ -213,25 +465,31 @@ def big_button(label, key, width="56px", height="44px", font_size="2.1rem"):
     # This returns None; just for layout.
     return False
 
-def histogram_avg_time_bins(schemes_df: pd.DataFrame, workflow_df: pd.DataFrame):
-    avg_time_df = workflow_df.groupby("scheme_id")['time_taken'].mean().reset_index()
-    avg_time_df.rename(columns={'time_taken': 'avg_time_taken'}, inplace=True)
-    merged = schemes_df.merge(avg_time_df, on="scheme_id")
-    times = merged['avg_time_taken'].dropna()
+@timed()
+def histogram_avg_time_bins(schemes_df: pd.DataFrame, workflow_df: pd.DataFrame, cache_key=None, facts=None):
+    engine = prep_avg_time_bins(schemes_df, workflow_df, facts, cache_key=cache_key)
 
-    if times.empty:
+    if not len(engine):
         st.info("No data available for average processing time histogram.")
         return
 
-    min_time = int(np.floor(times.min()))
-    max_time = int(np.ceil(times.max()))
+    min_time, max_time = engine.bounds()
     bins_key = "histogram_bin_count"
     range_key = "histogram_range"
 
     if bins_key not in st.session_state:
         st.session_state[bins_key] = 15
-    if range_key not in st.session_state:
-        st.session_state[range_key] = (min_time, max_time)
+    # The bins text box is keyed on "bins_val"; seed it once instead of passing
+    # value=, since app.keep_widget_state re-assigns the key on every rerun.
+    if "bins_val" not in st.session_state:
+        st.session_state["bins_val"] = str(st.session_state[bins_key])
+    # The timespan slider is keyed on range_key; keep its value inside the
+    # current bounds, which move whenever the filters change.
+    lo, hi = st.session_state.get(range_key, (min_time, max_time))
+    lo, hi = max(lo, min_time), min(hi, max_time)
+    if min_time < max_time and lo > hi:
+        lo, hi = min_time, max_time
+    st.session_state[range_key] = (lo, hi)
 
     # Title above the number of bins input box
     st.markdown("<div style='font-weight:600; font-size:1.1rem; margin-bottom:4px;'>Number of bins</div>", unsafe_allow_html=True)
@@ -239,7 +497,6 @@ def histogram_avg_time_bins(schemes_df: pd.DataFrame, workflow_df: pd.DataFrame)
     # Number of bins input textbox
     bins_val = st.text_input(
         label="",
-        value=str(st.session_state[bins_key]),
         max_chars=3,
         key="bins_val",
         help="Enter number of bins between 5 and 100",
@@ -252,17 +509,11 @@ def histogram_avg_time_bins(schemes_df: pd.DataFrame, workflow_df: pd.DataFrame)
             st.session_state[bins_key] = manual_val
     num_bins = st.session_state[bins_key]
 
-    # Timespan slider below the chart
+    # Slider state is read before the chart, so the histogram is computed once per rerun
     hist_range = st.session_state[range_key]
-
-    # Compute visible data based on hist_range
-    visible_times = times[(times >= hist_range[0]) & (times <= hist_range[1])] if hist_range[0] < hist_range[1] else times
-    hist, bins = np.histogram(visible_times, bins=num_bins, range=hist_range)
+    bins, hist, offsets = engine.histogram(hist_range[0], hist_range[1], num_bins)
     bin_centers = (bins[:-1] + bins[1:]) / 2
 
-    merged_visible = merged[(merged['avg_time_taken'] >= hist_range[0]) & (merged['avg_time_taken'] <= hist_range[1])]
-    bin_indices = np.digitize(merged_visible['avg_time_taken'], bins, right=False) - 1
-
     # Plot histogram
     fig = px.bar(
         x=bin_centers,
@@ -276,45 +527,38 @@ def histogram_avg_time_bins(schemes_df: pd.DataFrame, workflow_df: pd.DataFrame)
         xaxis_title="Average Processing Time (hrs, per scheme)",
         yaxis_title="Number of Schemes",
         bargap=0.15,
-        xaxis=dict(range=[hist_range[0], hist_range[1]], tickformat="d"),
+        xaxis=dict(range=[bins[0], bins[-1]], tickformat="d"),
         font=dict(color="#eee"),
         height=375,
     )
     st.plotly_chart(fig, use_container_width=True, config={'displayModeBar': True})
 
     # Display timespan selector slider below the chart
-    new_hist_range = st.slider(
-        "Select timespan range for histogram (hrs):",
-        min_value=min_time,
-        max_value=max_time,
-        value=hist_range,
-        step=1,
-        format="%d"
-    )
-    st.session_state[range_key] = new_hist_range
-
-    # Update histogram and bin scheme lists according to new selections
-    visible_times = times[(times >= new_hist_range[0]) & (times <= new_hist_range[1])]
-    hist, bins = np.histogram(visible_times, bins=num_bins, range=new_hist_range)
-    bin_centers = (bins[:-1] + bins[1:]) / 2
-
-    merged_visible = merged[
-        (merged['avg_time_taken'] >= new_hist_range[0]) & (merged['avg_time_taken'] <= new_hist_range[1])
-    ]
-    bin_indices = np.digitize(merged_visible['avg_time_taken'], bins, right=False) - 1
-    schemes_by_bin = {i: merged_visible[bin_indices == i] for i in range(num_bins)}
+    if min_time < max_time:
+        st.slider(
+            "Select timespan range for histogram (hrs):",
+            min_value=min_time,
+            max_value=max_time,
+            step=1,
+            format="%d",
+            key=range_key,
+        )
 
     bin_labels = [
         f"{bins[i]:.0f} - {bins[i+1]:.0f} hrs ({hist[i]} schemes)" for i in range(num_bins)
     ]
 
+    selected_key = "histogram_selected_bin"
+    if st.session_state.get(selected_key, 0) >= num_bins:
+        st.session_state.pop(selected_key)
     selected_bin = st.selectbox(
         "Select a bin to view scheme details",
         options=list(range(num_bins)),
-        format_func=lambda i: bin_labels[i]
+        format_func=lambda i: bin_labels[i],
+        key=selected_key,
     )
 
-    selected_schemes = schemes_by_bin[selected_bin]
+    selected_schemes = engine.bin_schemes(offsets, selected_bin)
     st.markdown(f"### Schemes in Bin {bin_labels[selected_bin]}")
     if selected_schemes.empty:
         st.write("No schemes in this bin.")
@@ -324,4 +568,4 @@ def histogram_avg_time_bins(schemes_df: pd.DataFrame, workflow_df: pd.DataFrame)
         base_cols = ['scheme_id','short_description', 'avg_time_taken', 'createdBy', 'plant', 'category', 'department_at_time']
         show_cols = (['scheme_id', title_col] + base_cols[1:]) if title_col else base_cols
         show_cols = [c for c in show_cols if c in selected_schemes.columns]
-        st.dataframe(selected_schemes[show_cols].reset_index(drop=True))
\ No newline at end of file
+        paged_table(selected_schemes[show_cols], key="histogram_table")
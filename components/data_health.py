@@ -1,7 +1,33 @@
 # File: components/data_health.py
 import streamlit as st
+import pandas as pd
 
-def display_data_health(health_metrics: dict):
+from utils.health import slice_health
+from utils.instrumentation import timed
+from components.charts import memoized_prep
+
+# User-friendly labels for the metric keys written by utils/health.py
+METRIC_LABELS = {
+    "schemes_missing_scheme_id": "Schemes Missing Scheme ID",
+    "schemes_missing_creationDate": "Schemes Missing Creation Date",
+    "schemes_missing_category": "Schemes Missing Category",
+    "schemes_missing_department": "Schemes Missing Department",
+    "workflow_missing_scheme_id": "Workflow Entries Missing Scheme ID",
+    "workflow_missing_forwarded_at": "Workflow Entries Missing Forward Date",
+    "workflow_missing_time_taken": "Workflow Entries Missing Time Taken",
+    "attachments_missing_scheme_id": "Attachments Missing Scheme ID",
+    "attachments_missing_fileName": "Attachments Missing File Name",
+    "schemes_duplicate_scheme_id": "Duplicate Scheme IDs",
+    "workflow_duplicate_rows": "Duplicate Workflow Entries",
+    "attachments_duplicate_rows": "Duplicate Attachment Entries",
+    "schemes_aging_gt_180": "Schemes Aging Over 180 Days",
+    "schemes_without_workflow": "Schemes Without Workflow Entries",
+}
+
+HEALTH_STATE_KEYS = ["health_history_metrics", "health_selection"]
+
+@timed()
+def display_data_health(health_metrics: dict, history: pd.DataFrame = None):
     """
     Display key data quality and health checks in the dashboard.
 
@@ -15,6 +41,8 @@ def display_data_health(health_metrics: dict):
         - duplicates, etc.
 
     Adapt keys/labels as per your preprocessing output.
+    `history` holds one snapshot per preprocessing run (data_health_history.csv);
+    when given, the change since the previous run and a trend are shown.
     """
 
     if not health_metrics:
@@ -23,33 +51,24 @@ def display_data_health(health_metrics: dict):
 
     st.markdown("### ⚠️ Data Quality & Health Summary")
 
-    # Prepare a user-friendly mapping between metric keys and descriptive labels
-    metric_labels = {
-        "schemes_missing_scheme_id": "Schemes Missing Scheme ID",
-        "schemes_missing_creationDate": "Schemes Missing Creation Date",
-        "schemes_missing_category": "Schemes Missing Category",
-        "schemes_missing_department": "Schemes Missing Department",
-        "workflow_missing_scheme_id": "Workflow Entries Missing Scheme ID",
-        "workflow_missing_forwarded_at": "Workflow Entries Missing Forward Date",
-        "workflow_missing_time_taken": "Workflow Entries Missing Time Taken",
-        "attachments_missing_scheme_id": "Attachments Missing Scheme ID",
-        "attachments_missing_fileName": "Attachments Missing File Name",
-        "schemes_duplicate_scheme_id": "Duplicate Scheme IDs",
-        "workflow_duplicate_rows": "Duplicate Workflow Entries",
-        "attachments_duplicate_rows": "Duplicate Attachment Entries",
-        "schemes_aging_gt_180": "Schemes Aging Over 180 Days",
-    }
-
-    # Convert the health_metrics dict to a list of (label, count) tuples
-    health_items = [(metric_labels.get(k, k), v) for k, v in health_metrics.items()]
+    # Convert the health_metrics dict to a list of (key, label, count) tuples
+    health_items = [(k, METRIC_LABELS.get(k, k), v) for k, v in health_metrics.items()]
 
     # Sort so that highest counts appear on top (optional)
-    health_items.sort(key=lambda x: (x[1] if isinstance(x[1], (int, float)) else 0), reverse=True)
+    health_items.sort(key=lambda x: (x[2] if isinstance(x[2], (int, float)) else 0), reverse=True)
 
     # Display in a table-like format
-    st.table(
-        {"Metric": [item[0] for item in health_items], "Count": [item[1] for item in health_items]}
-    )
+    table = {"Metric": [item[1] for item in health_items], "Count": [item[2] for item in health_items]}
+    if history is not None and len(history) > 1:
+        previous = history.iloc[-2]
+        table["Change Since Previous Run"] = [
+            item[2] - previous[item[0]] if item[0] in previous and pd.notna(previous[item[0]]) else None
+            for item in health_items
+        ]
+    st.table(table)
+
+    if history is not None and not history.empty:
+        display_health_history(history)
 
     # Additional actionable messages
     if health_metrics.get("schemes_aging_gt_180", 0) > 0:
@@ -68,3 +87,38 @@ def display_data_health(health_metrics: dict):
 
     # You can expand this section with custom suggestions or links to documentation
 
+
+def display_health_history(history: pd.DataFrame):
+    """Trend of selected health counts over the recorded preprocessing runs."""
+    last = history.iloc[-1]
+    st.caption(f"Last preprocessing run: {last['run_at']} ({last['mode']}), {len(history)} runs recorded.")
+    metrics = [c for c in METRIC_LABELS if c in history]
+    with st.expander("📉 Health History", expanded=False):
+        selected = st.multiselect(
+            "Metrics",
+            metrics,
+            default=[m for m in metrics if history[m].iloc[-1] > 0][:4],
+            format_func=lambda m: METRIC_LABELS[m],
+            key="health_history_metrics",
+        )
+        if selected:
+            st.line_chart(history.set_index("run_at")[selected].rename(columns=METRIC_LABELS))
+
+@timed()
+@memoized_prep
+def prep_selection_health(schemes_df, workflow_df, attachments_df) -> dict:
+    return slice_health(schemes_df, workflow_df, attachments_df)
+
+@timed()
+def display_selection_health(schemes_df, workflow_df, attachments_df, cache_key=None):
+    """
+    On request, health counts of the rows selected by the sidebar filters,
+    computed from the filtered rows only (see utils.health.slice_health).
+    """
+    if not st.toggle("Check the filtered selection", key="health_selection"):
+        return
+    metrics = prep_selection_health(schemes_df, workflow_df, attachments_df, cache_key=cache_key)
+    st.table({
+        "Metric": [METRIC_LABELS.get(k, k) for k in metrics],
+        "Count in Selection": list(metrics.values()),
+    })
@@ -0,0 +1,32 @@
+# File: components/debug_panel.py
+import streamlit as st
+import pandas as pd
+
+def display_rerun_timings(rerun):
+    """
+    Sidebar panel with the timings recorded during this rerun (see
+    utils.instrumentation). Nested calls are indented under their caller.
+    """
+    if rerun is None:
+        return
+    data = rerun.to_dict()
+    with st.sidebar.expander("⏱️ Rerun Timings", expanded=False):
+        st.caption(f"Total {data['total_seconds'] * 1000:,.0f} ms over {len(data['records'])} timed calls")
+        if not data["records"]:
+            return
+        records = pd.DataFrame(data["records"])
+        table = pd.DataFrame({
+            "Step": [" " * d + n for d, n in zip(records["depth"], records["name"])],
+            "ms": (records["seconds"] * 1000).round(1),
+            "Rows in": records["rows_in"].astype("Int64"),
+            "Rows out": records["rows_out"].astype("Int64"),
+            "Δ RSS (MB)": records["rss_delta_mb"],
+        })
+        st.dataframe(table, hide_index=True, use_container_width=True)
+        st.download_button(
+            "Download JSON",
+            rerun.to_json(),
+            file_name="rerun_timings.json",
+            mime="application/json",
+            key="rerun_timings_download",
+        )
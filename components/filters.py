@@ -2,16 +2,22 @@
 import streamlit as st
 import pandas as pd
 
-def sidebar_filters(schemes_df: pd.DataFrame, workflow_df: pd.DataFrame) -> dict:
+from utils.filter_index import FilterIndex
+from utils.instrumentation import timed
+
+@timed()
+def sidebar_filters(schemes_df: pd.DataFrame, workflow_df: pd.DataFrame, index: FilterIndex = None) -> dict:
     st.sidebar.header("Filters")
 
     # Ensure creationDate is datetime
     if not pd.api.types.is_datetime64_any_dtype(schemes_df['creationDate']):
         schemes_df['creationDate'] = pd.to_datetime(schemes_df['creationDate'], errors='coerce')
 
+    if index is None:
+        index = FilterIndex(schemes_df, workflow_df)
+
     # Calculate overall date range
-    min_date = schemes_df['creationDate'].min()
-    max_date = schemes_df['creationDate'].max()
+    min_date, max_date = index.scheme_dates.bounds()
 
     # Date presets
     date_options = {
@@ -46,103 +52,52 @@ def sidebar_filters(schemes_df: pd.DataFrame, workflow_df: pd.DataFrame) -> dict
 
     selected_date_range = (pd.to_datetime(date_start), pd.to_datetime(date_end))
 
-    # Helper for safely getting sorted unique values
-    def get_sorted_unique(df_col):
-        try:
-            unique_vals = df_col.dropna().unique()
-            return sorted(unique_vals) if len(unique_vals) > 0 else ["UNKNOWN"]
-        except Exception:
-            return ["UNKNOWN"]
+    # Option lists come from the filter index; fall back to UNKNOWN when empty
+    def or_unknown(values):
+        return values if len(values) > 0 else ["UNKNOWN"]
 
     # =============== Filter Mode: WORKFLOW PATH ===============
     if filter_mode == "Workflow Path":
-        workflow_df = workflow_df.copy()
-
-        # Ensure datetime
-        if 'forwarded_at' in workflow_df.columns:
-            workflow_df['forwarded_at'] = pd.to_datetime(workflow_df['forwarded_at'], errors='coerce')
-
         # Department filter
-        departments = get_sorted_unique(workflow_df['department'])
+        departments = or_unknown(index.workflow_values('department'))
         selected_departments = st.sidebar.multiselect("Department", departments, default=[])
 
         # Filter users based on selected departments
-        if selected_departments:
-            filtered_users_df = workflow_df[workflow_df['department'].isin(selected_departments)]
-        else:
-            filtered_users_df = workflow_df
-
-        users = get_sorted_unique(filtered_users_df['user'])
+        users_mask = index.workflow_bitmap(department=selected_departments)
+        users = or_unknown(index.workflow_values('user', users_mask))
         selected_users = st.sidebar.multiselect("User", users, default=[])
 
-        # Apply filters on workflow_df
-        wf_filtered = workflow_df.copy()
-        if selected_departments:
-            wf_filtered = wf_filtered[wf_filtered['department'].isin(selected_departments)]
-        if selected_users:
-            wf_filtered = wf_filtered[wf_filtered['user'].isin(selected_users)]
-        if 'forwarded_at' in wf_filtered.columns:
-            wf_filtered = wf_filtered[
-                (wf_filtered['forwarded_at'] >= selected_date_range[0]) &
-                (wf_filtered['forwarded_at'] <= selected_date_range[1])
-            ]
-
-        # Get relevant scheme IDs
-        relevant_scheme_ids = wf_filtered['scheme_id'].dropna().unique()
-        schemes_df = schemes_df[schemes_df['scheme_id'].isin(relevant_scheme_ids)]
-
-        # Filter categories based on resulting schemes
-        filtered_categories_df = schemes_df
-        categories = get_sorted_unique(filtered_categories_df['category'])
+        # Filter categories based on the schemes reached by the selected steps
+        wf_mask = index.workflow_bitmap(*selected_date_range, department=selected_departments, user=selected_users)
+        categories = or_unknown(index.scheme_values('category', index.schemes_touched(wf_mask)))
         selected_categories = st.sidebar.multiselect("Category", categories, default=[])
 
-        if selected_categories:
-            schemes_df = schemes_df[schemes_df['category'].isin(selected_categories)]
-
     # =============== Filter Mode: CREATION INFO ===============
     else:
-        # Filter schemes by creationDate
-        schemes_df = schemes_df[
-            (schemes_df['creationDate'] >= selected_date_range[0]) &
-            (schemes_df['creationDate'] <= selected_date_range[1])
-        ]
-
-        # Department filter
-        departments = get_sorted_unique(schemes_df['department_at_time'])
+        # Department filter, from schemes created in the date range
+        departments = or_unknown(index.scheme_values('department_at_time', index.scheme_bitmap(*selected_date_range)))
         selected_departments = st.sidebar.multiselect("Department", departments, default=[])
 
         # Filter users based on selected departments
-        if selected_departments:
-            filtered_users_df = schemes_df[schemes_df['department_at_time'].isin(selected_departments)]
-        else:
-            filtered_users_df = schemes_df
-
-        users = get_sorted_unique(filtered_users_df['createdBy'])
+        users_mask = index.scheme_bitmap(*selected_date_range, department_at_time=selected_departments)
+        users = or_unknown(index.scheme_values('createdBy', users_mask))
         selected_users = st.sidebar.multiselect("User", users, default=[])
 
-        # Apply department filter
-        if selected_departments:
-            schemes_df = schemes_df[schemes_df['department_at_time'].isin(selected_departments)]
-        # Apply user filter
-        if selected_users:
-            schemes_df = schemes_df[schemes_df['createdBy'].isin(selected_users)]
-
         # Category filter based on filtered schemes
-        filtered_categories_df = schemes_df
-        categories = get_sorted_unique(filtered_categories_df['category'])
+        categories_mask = index.scheme_bitmap(
+            *selected_date_range, department_at_time=selected_departments, createdBy=selected_users
+        )
+        categories = or_unknown(index.scheme_values('category', categories_mask))
         selected_categories = st.sidebar.multiselect("Category", categories, default=[])
 
-        if selected_categories:
-            schemes_df = schemes_df[schemes_df['category'].isin(selected_categories)]
-
-    # Return dictionary of applied filters and filtered dataset
+    # Return dictionary of applied filters and the rows they select
     filters = {
         "filter_mode": filter_mode,
         "date_range": selected_date_range,
         "categories": selected_categories,
         "departments": selected_departments,
         "users": selected_users,
-        "filtered_schemes_df": schemes_df
     }
+    filters["selection"] = index.resolve(filters)
 
     return filters
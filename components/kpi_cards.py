@@ -3,6 +3,8 @@ import pandas as pd
 import random
 import hashlib
 
+from utils.instrumentation import timed
+
 def safe_id(label, idx):
     h = hashlib.sha1(label.encode("utf-8")).hexdigest()[:6]
     return f"card{idx}_{h}"
@@ -77,26 +79,47 @@ def styled_kpi_card(label, value, icon, bg_rgba, bg_rgba_hover, card_id):
         unsafe_allow_html=True
     )
 
-def display_kpi_cards(schemes_df, workflow_df, attachments_df):
-    total_schemes = schemes_df['scheme_id'].nunique()
-    avg_processing_time = workflow_df['time_taken'].mean()
-    avg_processing_time_str = f"{avg_processing_time:.2f}" if not pd.isna(avg_processing_time) else "N/A"
-    aging_over_180 = schemes_df[schemes_df['aging_bucket'] == '> 180 days']['scheme_id'].nunique()
-    total_attachments = len(attachments_df)
-    avg_attachments_per_scheme = (total_attachments / total_schemes) if total_schemes > 0 else 0
+@timed()
+def compute_kpis(schemes_df, workflow_df, attachments_df, known=None):
+    """
+    KPI card values for the filtered frames. Values already in `known` (e.g.
+    answered from the daily cubes in utils.cube) are kept and not recomputed.
+    """
+    kpis = dict(known or {})
+    if 'total_schemes' not in kpis:
+        kpis['total_schemes'] = schemes_df['scheme_id'].nunique()
+    if 'avg_processing_time' not in kpis:
+        kpis['avg_processing_time'] = workflow_df['time_taken'].mean()
+    if 'aging_over_180' not in kpis:
+        kpis['aging_over_180'] = schemes_df[schemes_df['aging_bucket'] == '> 180 days']['scheme_id'].nunique()
+    if 'total_attachments' not in kpis:
+        kpis['total_attachments'] = len(attachments_df)
+    if 'avg_attachments_per_scheme' not in kpis:
+        total_schemes = kpis['total_schemes']
+        kpis['avg_attachments_per_scheme'] = (kpis['total_attachments'] / total_schemes) if total_schemes > 0 else 0
 
-    if len(attachments_df) > 0 and len(workflow_df) > 0:
-        wf_by_scheme = workflow_df.groupby('scheme_id')['time_taken'].sum()
-        attach_by_scheme = attachments_df.groupby('scheme_id').size()
-        merged = pd.DataFrame({'wf_time': wf_by_scheme, 'num_attach': attach_by_scheme})
-        merged = merged[merged['num_attach'] > 0]
-        merged['time_per_attachment'] = merged['wf_time'] / merged['num_attach']
-        avg_time_per_attachment = merged['time_per_attachment'].mean()
-    else:
-        avg_time_per_attachment = 0
+    if 'avg_time_per_attachment' not in kpis:
+        if len(attachments_df) > 0 and len(workflow_df) > 0:
+            wf_by_scheme = workflow_df.groupby('scheme_id', observed=True)['time_taken'].sum()
+            attach_by_scheme = attachments_df.groupby('scheme_id', observed=True).size()
+            merged = pd.DataFrame({'wf_time': wf_by_scheme, 'num_attach': attach_by_scheme})
+            merged = merged[merged['num_attach'] > 0]
+            merged['time_per_attachment'] = merged['wf_time'] / merged['num_attach']
+            kpis['avg_time_per_attachment'] = merged['time_per_attachment'].mean()
+        else:
+            kpis['avg_time_per_attachment'] = 0
 
-    unique_generators = schemes_df['createdBy'].nunique()
-    unique_participators = workflow_df['user'].nunique()
+    if 'unique_generators' not in kpis:
+        kpis['unique_generators'] = schemes_df['createdBy'].nunique()
+    if 'unique_participators' not in kpis:
+        kpis['unique_participators'] = workflow_df['user'].nunique()
+    return kpis
+
+@timed()
+def display_kpi_cards(schemes_df, workflow_df, attachments_df, kpis=None):
+    kpis = compute_kpis(schemes_df, workflow_df, attachments_df, kpis)
+    avg_processing_time = kpis['avg_processing_time']
+    avg_processing_time_str = f"{avg_processing_time:.2f}" if not pd.isna(avg_processing_time) else "N/A"
 
     card_palettes = [
         ("rgba(54, 98, 165, 0.15)",  "rgba(54, 98, 165, 0.33)"),
@@ -111,14 +134,14 @@ def display_kpi_cards(schemes_df, workflow_df, attachments_df):
     assigned_palettes = random.sample(card_palettes, len(card_palettes))
 
     card_data = [
-        ("Total Schemes", total_schemes, "📄"),
+        ("Total Schemes", kpis['total_schemes'], "📄"),
         ("Avg Processing Time (hrs)", avg_processing_time_str, "⏳"),
-        ("Schemes Aging >180 Days", aging_over_180, "⌛"),
-        ("Total Attachments", total_attachments, "📎"),
-        ("Avg Attachments/Scheme", f"{avg_attachments_per_scheme:.2f}", "🗂️"),
-        ("Avg Time per Attachment (hrs)", f"{avg_time_per_attachment:.2f}", "⏱️"),
-        ("Unique Scheme Creators", unique_generators, "🧑‍💻"),
-        ("Unique Users in Flowpath", unique_participators, "🔗"),
+        ("Schemes Aging >180 Days", kpis['aging_over_180'], "⌛"),
+        ("Total Attachments", kpis['total_attachments'], "📎"),
+        ("Avg Attachments/Scheme", f"{kpis['avg_attachments_per_scheme']:.2f}", "🗂️"),
+        ("Avg Time per Attachment (hrs)", f"{kpis['avg_time_per_attachment']:.2f}", "⏱️"),
+        ("Unique Scheme Creators", kpis['unique_generators'], "🧑‍💻"),
+        ("Unique Users in Flowpath", kpis['unique_participators'], "🔗"),
     ]
 
     cols1 = st.columns(4)
@@ -0,0 +1,139 @@
+# File: components/reports.py
+
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.calculations import holding_intervals
+from utils.instrumentation import timed
+from components.export_utils import make_export_buttons
+from components.tables import paged_table
+
+REPORT_GROUPS = {"User": "user", "Department": "department"}
+
+# --- Annual Report Engine ---
+# Every workflow step is a holding interval [forwarded_at, next step). For a
+# holder and calendar year, counting distinct schemes:
+#   carried_over = schemes held at the start of the year (brought forward)
+#   received     = schemes that came to the holder during the year and were
+#                  not already held at its start
+#   processed    = schemes held during the year and passed on by its end
+#   pending      = schemes held at the end of the year
+# so carried_over + received - processed = pending. A scheme is held through
+# at most one interval at a time, so carried_over and pending count intervals;
+# received and processed look at the holder's previous/next interval of the
+# same scheme, so a scheme that comes back within the year counts once. All
+# holders and years are computed together: the counts go into a (holders x
+# years) grid and pending is the running sum along the years.
+
+def annual_report(workflow_df: pd.DataFrame, by: str = "user", version=None) -> pd.DataFrame:
+    """Received/processed/carried over/pending schemes per `by` value and year."""
+    intervals = holding_intervals(workflow_df, version)
+    columns = ["year", by, "received", "processed", "carried_over", "pending"]
+    if intervals.empty:
+        return pd.DataFrame(columns=columns)
+
+    holders, names = pd.factorize(intervals[by].astype(object).fillna("Unknown"), sort=True)
+    schemes, _ = pd.factorize(intervals["scheme_id"])
+    start_year = intervals["start"].dt.year.to_numpy()
+    end_year = intervals["end"].dt.year.to_numpy()   # NaN while still held
+    first = int(start_year.min())
+    last = int(max(start_year.max(), np.nanmax(end_year) if (~np.isnan(end_year)).any() else first))
+    n_years = last - first + 1
+
+    # Each holder's intervals of a scheme in time order
+    order = np.lexsort((intervals["start"].to_numpy(), schemes, holders))
+    holders, schemes, start_year, end_year = holders[order], schemes[order], start_year[order], end_year[order]
+    same_prev = np.zeros(len(order), dtype=bool)
+    same_prev[1:] = (holders[1:] == holders[:-1]) & (schemes[1:] == schemes[:-1])
+    same_next = np.append(same_prev[1:], False)
+    # Received: no earlier interval of the scheme was still held into this year
+    new = ~same_prev | (np.append(np.inf, end_year[:-1]) < start_year)
+    # Processed: closed, and the holder doesn't get the scheme back in the same year
+    passed = ~np.isnan(end_year) & (~same_next | (np.append(start_year[1:], 0) > end_year))
+
+    received = np.zeros((len(names), n_years), dtype=np.int64)
+    processed = np.zeros((len(names), n_years), dtype=np.int64)
+    np.add.at(received, (holders[new], start_year[new] - first), 1)
+    np.add.at(processed, (holders[passed], end_year[passed].astype(int) - first), 1)
+    pending = np.cumsum(received - processed, axis=1)
+    carried_over = np.concatenate([np.zeros((len(names), 1), dtype=np.int64), pending[:, :-1]], axis=1)
+
+    report = pd.DataFrame({
+        "year": np.tile(np.arange(first, last + 1), len(names)),
+        by: np.repeat(np.asarray(names), n_years),
+        "received": received.ravel(),
+        "processed": processed.ravel(),
+        "carried_over": carried_over.ravel(),
+        "pending": pending.ravel(),
+    })
+    # Drop holder-years with no activity at all
+    active = report[["received", "processed", "carried_over", "pending"]].any(axis=1)
+    return report[active].sort_values(["year", by], kind="stable").reset_index(drop=True)[columns]
+
+# --- Report Cache ---
+# Reports cover the whole event stream, so one result per dataset version
+# (utils.data_loader.dataset_version) and grouping serves every session.
+
+_reports = OrderedDict()
+_reports_lock = threading.Lock()
+MAX_REPORTS = 4
+
+@timed()
+def get_annual_report(workflow_df: pd.DataFrame, by: str = "user", version=None) -> pd.DataFrame:
+    if version is None:
+        return annual_report(workflow_df, by)
+    key = (version, by)
+    with _reports_lock:
+        report = _reports.get(key)
+        if report is not None:
+            _reports.move_to_end(key)
+            return report
+    report = annual_report(workflow_df, by, version)
+    with _reports_lock:
+        _reports[key] = report
+        while len(_reports) > MAX_REPORTS:
+            _reports.popitem(last=False)
+    return report
+
+# --- Rendering ---
+
+@timed()
+def display_annual_reports(workflow_df: pd.DataFrame, version=None):
+    """
+    Annual received/processed/carried over/pending table with export.
+    Uses the full workflow history so holding periods are complete.
+    """
+    if workflow_df.empty:
+        st.info("No workflow data available for annual reports.")
+        return
+
+    c1, c2 = st.columns(2)
+    group_label = c1.radio("Report by", list(REPORT_GROUPS), horizontal=True, key="report_group")
+    by = REPORT_GROUPS[group_label]
+    report = get_annual_report(workflow_df, by, version)
+    if report.empty:
+        st.info("No holding periods found in the workflow data.")
+        return
+
+    years = sorted(report["year"].unique(), reverse=True)
+    year = c2.selectbox("Year", ["All Years"] + years, key="report_year")
+    shown = report if year == "All Years" else report[report["year"] == year]
+
+    totals = shown[["received", "processed"]].sum()
+    m1, m2, m3, m4 = st.columns(4)
+    m1.metric("Received", int(totals["received"]))
+    m2.metric("Processed", int(totals["processed"]))
+    if year != "All Years":
+        m3.metric("Carried Over", int(shown["carried_over"].sum()))
+        m4.metric("Pending", int(shown["pending"].sum()))
+
+    paged_table(shown.reset_index(drop=True), key="report_table")
+    st.caption(
+        "Schemes counted once per holder and year. Received: came in during the year (not already held at its start). "
+        "Processed: held during the year and passed on by its end. Carried over: held at the start of the year. "
+        "Pending: still held at the end of the year. Carried over + received − processed = pending."
+    )
+    make_export_buttons(shown, label_prefix=f"Export {group_label} Report")
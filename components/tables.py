@@ -0,0 +1,69 @@
+# File: components/tables.py
+
+import numpy as np
+import pandas as pd
+import streamlit as st
+
+from utils.instrumentation import timed
+
+PAGE_SIZES = [25, 50, 100, 250]
+
+def table_state_keys(key):
+    """Widget keys used by paged_table(key=...), for keeping state while hidden."""
+    return [f"{key}_{name}" for name in ("sort", "descending", "search_col", "search", "page_size", "page")]
+
+@timed()
+def paged_table(df: pd.DataFrame, key: str, rows=None, index=None, render=None):
+    """
+    Paginated table with server-side sort, search and page windows.
+
+    Only the visible page of rows is sent to the browser. `rows` selects
+    positions of `df` (all rows if None). When `index` (the FilterIndex built
+    on `df` as its schemes table) is given, the row count, sort order and
+    search come from its dictionary-encoded columns instead of materialising
+    the selected frame. `render` draws the page (st.dataframe by default).
+    """
+    rows = np.arange(len(df)) if rows is None else np.asarray(rows)
+    columns = list(df.columns)
+
+    c1, c2, c3, c4 = st.columns([3, 1, 2, 3])
+    sort_col = c1.selectbox("Sort by", ["(none)"] + columns, key=f"{key}_sort")
+    descending = c2.toggle("Descending", key=f"{key}_descending")
+    search_col = c3.selectbox("Search in", columns, key=f"{key}_search_col")
+    search = c4.text_input("Contains", key=f"{key}_search").strip()
+
+    if search:
+        if index is not None:
+            rows = rows[index.scheme_column(search_col).match(search)[rows]]
+        else:
+            values = df[search_col].iloc[rows].astype(str)
+            rows = rows[values.str.contains(search, case=False, regex=False).to_numpy()]
+
+    if sort_col != "(none)":
+        if index is not None:
+            ranks = index.scheme_column(sort_col).ranks(descending)
+            rows = rows[np.argsort(ranks[rows], kind="stable")]
+        else:
+            values = df[sort_col].iloc[rows].reset_index(drop=True)
+            order = values.sort_values(ascending=not descending, kind="stable", na_position="last").index
+            rows = rows[order.to_numpy()]
+
+    # Page window
+    size_key = f"{key}_page_size"
+    if size_key not in st.session_state:
+        st.session_state[size_key] = PAGE_SIZES[1]
+    page_size = st.session_state[size_key]
+    n_pages = max(1, -(-len(rows) // page_size))
+    page_key = f"{key}_page"
+    if st.session_state.get(page_key, 1) > n_pages:
+        st.session_state[page_key] = n_pages
+    page = st.session_state.get(page_key, 1)
+    start = (page - 1) * page_size
+    page_df = df.iloc[rows[start:start + page_size]].reset_index(drop=True)
+
+    (render or st.dataframe)(page_df)
+
+    c1, c2, c3 = st.columns([2, 1, 3])
+    c1.number_input(f"Page (of {n_pages})", min_value=1, max_value=n_pages, step=1, key=page_key)
+    c2.selectbox("Rows per page", PAGE_SIZES, key=size_key)
+    c3.caption(f"Rows {start + min(1, len(page_df))}–{start + len(page_df)} of {len(rows)}")
@@ -3,14 +3,38 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime, timedelta
 
+from utils.cube import scheme_step_totals
+from utils.facts import build_scheme_facts, latest_steps
+from utils.preprocessing import clean_and_enrich
+
+PAGE_SIZE = 50
+DESIGNATION = "designation_at_time"
+
 # Load data
-workflow = pd.read_csv("workflow.csv", parse_dates=['forwarded_at'])
-attachments = pd.read_csv("attachments.csv")
-schemes = pd.read_csv("schemes.csv", parse_dates=['creationDate'])
+# The three tables are kept separate: metrics come from one row of facts per
+# scheme (the utils.facts table that preprocessing writes, aligned with the
+# first row of each scheme), and detail rows are joined only for the page
+# being displayed.
+@st.cache_data
+def load_data():
+    workflow = pd.read_csv("workflow.csv", parse_dates=['forwarded_at'])
+    attachments = pd.read_csv("attachments.csv")
+    schemes = pd.read_csv("schemes.csv", parse_dates=['creationDate'])
+    schemes, workflow, attachments = clean_and_enrich(schemes, workflow, attachments)
+
+    table = build_scheme_facts(schemes, scheme_step_totals(workflow), attachments.groupby("scheme_id").size(),
+                               latest_steps(workflow))
+    first = schemes.drop_duplicates("scheme_id").reset_index(drop=True)
+    facts = pd.concat([first, table.drop(columns=[c for c in table.columns if c in first.columns])], axis=1)
+    # Designation may be recorded per workflow step; keep only the distinct
+    # (scheme, designation) pairs needed for filtering and the detail page
+    if DESIGNATION in workflow.columns and DESIGNATION not in schemes.columns:
+        designations = workflow[["scheme_id", DESIGNATION]].dropna().drop_duplicates()
+    else:
+        designations = None
+    return facts, attachments[["scheme_id", "fileName"]], designations
 
-# Merge all on scheme_id
-merged = schemes.merge(workflow, on="scheme_id", how="left")
-merged = merged.merge(attachments, on="scheme_id", how="left")
+facts, attachments, designations = load_data()
 
 # Sidebar filters
 st.sidebar.header("Filters")
@@ -28,8 +52,8 @@ if date_filter_type == "Custom":
     end_date = st.sidebar.date_input("End Date", value=now)
 else:
     if date_filter_type == "All Time":
-        start_date = schemes["creationDate"].min()
-        end_date = schemes["creationDate"].max()
+        start_date = facts["creationDate"].min()
+        end_date = facts["creationDate"].max()
     elif "Month" in date_filter_type:
         months = int(date_filter_type.split()[1])
         start_date = now - pd.DateOffset(months=months)
@@ -39,28 +63,39 @@ else:
         start_date = now - pd.DateOffset(years=years)
         end_date = now
 
-# Filter by date range
-filtered = merged[(merged["creationDate"] >= pd.to_datetime(start_date)) & (merged["creationDate"] <= pd.to_datetime(end_date))]
+# Filter by date range (all filters select schemes, never joined rows)
+mask = (facts["creationDate"] >= pd.to_datetime(start_date)) & (facts["creationDate"] <= pd.to_datetime(end_date))
 
 # Optional Filters
-plants = st.sidebar.multiselect("Plant", options=sorted(merged["plant"].dropna().unique()), default=None)
-categories = st.sidebar.multiselect("Category", options=sorted(merged["category"].dropna().unique()), default=None)
-designations = st.sidebar.multiselect("Designation", options=sorted(merged["designation_at_time"].dropna().unique()), default=None)
+plants = st.sidebar.multiselect("Plant", options=sorted(facts["plant"].dropna().unique()), default=None)
+categories = st.sidebar.multiselect("Category", options=sorted(facts["category"].dropna().unique()), default=None)
+if designations is not None:
+    designation_options = designations[DESIGNATION].unique()
+elif DESIGNATION in facts.columns:
+    designation_options = facts[DESIGNATION].dropna().unique()
+else:
+    designation_options = []
+selected_designations = st.sidebar.multiselect("Designation", options=sorted(designation_options), default=None)
 
 if plants:
-    filtered = filtered[filtered["plant"].isin(plants)]
+    mask &= facts["plant"].isin(plants)
 if categories:
-    filtered = filtered[filtered["category"].isin(categories)]
-if designations:
-    filtered = filtered["designation"].isin(designations)
+    mask &= facts["category"].isin(categories)
+if selected_designations:
+    if designations is not None:
+        matching = designations.loc[designations[DESIGNATION].isin(selected_designations), "scheme_id"]
+        mask &= facts["scheme_id"].isin(matching)
+    else:
+        mask &= facts[DESIGNATION].isin(selected_designations)
+
+filtered = facts[mask]
 
 # --- Dashboard --- #
 st.title("🧠 Scheme Monitoring Dashboard")
 
 col1, col2, col3 = st.columns(3)
 col1.metric("Total Schemes", filtered["scheme_id"].nunique())
-col2.metric("Total Attachments", filtered["fileName"].nunique())
-st.write("Filtered columns:", filtered.columns.tolist())
+col2.metric("Total Attachments", int(filtered["attachments"].sum()))
 col3.metric("Users Involved", filtered["createdBy"].nunique())
 
 st.markdown("---")
@@ -76,6 +111,18 @@ st.subheader("📊 Schemes by Category")
 category_counts = filtered["category"].value_counts()
 st.bar_chart(category_counts)
 
-# Table preview
+# Table preview, one page of schemes at a time
 st.subheader("📋 Filtered Scheme Details")
-st.dataframe(filtered[["scheme_id", "plant", "category", "creationDate", "createdBy", "designation_at_time", "fileName"]].drop_duplicates())
+n_pages = max(1, -(-len(filtered) // PAGE_SIZE))
+page = st.number_input(f"Page (of {n_pages})", min_value=1, max_value=n_pages, value=1, step=1)
+page_facts = filtered.iloc[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]
+
+detail_cols = ["scheme_id", "plant", "category", "creationDate", "createdBy",
+               "steps", "time_taken_sum", "last_action_date", "attachments"]
+details = page_facts[[c for c in detail_cols + [DESIGNATION] if c in page_facts.columns]]
+if designations is not None:
+    details = details.merge(designations[designations["scheme_id"].isin(page_facts["scheme_id"])], on="scheme_id", how="left")
+page_files = attachments[attachments["scheme_id"].isin(page_facts["scheme_id"])]
+details = details.merge(page_files, on="scheme_id", how="left").drop_duplicates()
+st.caption(f"Schemes {(page - 1) * PAGE_SIZE + min(1, len(page_facts))}–{(page - 1) * PAGE_SIZE + len(page_facts)} of {len(filtered)}")
+st.dataframe(details.reset_index(drop=True))
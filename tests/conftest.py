@@ -0,0 +1,48 @@
+import os
+import pandas as pd
+import pytest
+
+from benchmarks.synthetic_data import generate
+from utils import data_loader, preprocessing
+from utils.storage import FORMATS, resolve_table, read_table
+
+# Workflow rows of the synthetic exports the tests run on
+TEST_ROWS = 5_000
+
+# Outputs that legitimately differ between runs (run times, batch-local duplicate counts)
+RUN_FILES = ("data_health", "data_health_history")
+
+@pytest.fixture(scope="session")
+def raw_dir(tmp_path_factory):
+    """Synthetic raw exports shared by every test."""
+    path = tmp_path_factory.mktemp("raw")
+    generate(str(path), TEST_ROWS, seed=1)
+    return str(path)
+
+@pytest.fixture(scope="session")
+def output_dir(raw_dir, tmp_path_factory):
+    """Parquet outputs of a full rebuild of the synthetic exports."""
+    path = tmp_path_factory.mktemp("outputs")
+    preprocessing.main(raw_dir, str(path), "parquet")
+    return str(path)
+
+@pytest.fixture
+def loaded(output_dir, monkeypatch):
+    """Point the dashboard loaders at `output_dir` (with an empty cache)."""
+    monkeypatch.setattr(data_loader, "DATA_DIR", output_dir)
+    monkeypatch.setattr(data_loader, "DATA_FORMAT", "parquet")
+    data_loader.clear_cache()
+    yield data_loader
+    data_loader.clear_cache()
+
+def output_tables(outdir, fmt):
+    return sorted(os.path.splitext(name)[0] for name in os.listdir(outdir) if name.endswith(FORMATS[fmt]))
+
+def assert_same_outputs(left, right, fmt, skip=RUN_FILES):
+    """Every table written to `right` is also in `left`, with equal values."""
+    names = [name for name in output_tables(right, fmt) if name not in skip]
+    assert names
+    for name in names:
+        a = read_table(resolve_table(left, name, fmt)[0], fmt)
+        b = read_table(resolve_table(right, name, fmt)[0], fmt)
+        pd.testing.assert_frame_equal(a, b, check_categorical=False, obj=name)
@@ -0,0 +1,39 @@
+import gc
+import weakref
+import pandas as pd
+
+from utils import calculations
+from utils.calculations import determine_pending_owners, pending_owner_trend
+
+def pending_by_filtering(workflow, as_of):
+    """Latest step of each scheme on or before `as_of`, by filtering and sorting (ties keep row order)."""
+    filtered = workflow[workflow["forwarded_at"] <= as_of]
+    return filtered.sort_values("forwarded_at", kind="stable").groupby("scheme_id", observed=True).tail(1)
+
+def test_pending_owners_match_filtering(loaded, monkeypatch):
+    monkeypatch.setattr(calculations, "_timelines", type(calculations._timelines)())
+    workflow = loaded.load_workflow()
+    start, end = workflow["forwarded_at"].min(), workflow["forwarded_at"].max()
+    dates = [start - pd.Timedelta(days=1), start, *pd.date_range(start, end, periods=5)[1:-1], end]
+
+    for as_of in dates:
+        expected = pending_by_filtering(workflow, as_of)[["scheme_id", "user", "department", "forwarded_at"]]
+        owners = determine_pending_owners(workflow, as_of, version="test")
+        pd.testing.assert_frame_equal(owners.sort_index(), expected.sort_index())
+
+    trend = pending_owner_trend(workflow, dates, version="test")
+    for as_of in dates:
+        expected = pending_by_filtering(workflow, as_of)["department"].value_counts()
+        counts = trend.loc[as_of]
+        pd.testing.assert_series_equal(counts[counts > 0].sort_index(), expected[expected > 0].sort_index(),
+                                       check_names=False, check_index_type=False, check_categorical=False)
+
+def test_cached_timeline_does_not_keep_the_frame(loaded, monkeypatch):
+    monkeypatch.setattr(calculations, "_timelines", type(calculations._timelines)())
+    workflow = loaded.load_workflow().copy()
+    ref = weakref.ref(workflow)
+    determine_pending_owners(workflow, workflow["forwarded_at"].max(), version="test")
+    assert "test" in calculations._timelines
+    del workflow
+    gc.collect()
+    assert ref() is None
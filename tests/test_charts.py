@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from components.charts import AvgTimeBins
+
+def scheme_bins(n=400, seed=0):
+    """AvgTimeBins over per-scheme averages with many values on whole and half hours, some missing."""
+    rng = np.random.default_rng(seed)
+    means = rng.integers(0, 100, n) / 2
+    means[rng.random(n) < 0.05] = np.nan
+    schemes = pd.DataFrame({"scheme_id": np.arange(n)})
+    return AvgTimeBins(schemes, None, means), means
+
+@pytest.mark.parametrize("lo, hi, num_bins", [
+    (0, 50, 5), (0, 50, 15), (3, 17, 7), (10.5, 12, 100), (20, 20, 5), (-5, 3, 8),
+])
+def test_histogram_matches_numpy(lo, hi, num_bins):
+    engine, means = scheme_bins()
+    values = means[~np.isnan(means)]
+
+    edges, counts, offsets = engine.histogram(lo, hi, num_bins)
+    expected_counts, expected_edges = np.histogram(values, bins=num_bins, range=(lo, hi))
+    np.testing.assert_allclose(edges, expected_edges)
+    np.testing.assert_array_equal(counts, expected_counts)
+
+    # Each bin's schemes are those np.digitize puts there (the last bin is closed)
+    inside = (values >= edges[0]) & (values <= edges[-1])
+    ids = np.flatnonzero(~np.isnan(means))[inside]
+    bins = np.minimum(np.digitize(values[inside], edges) - 1, num_bins - 1)
+    for i in range(num_bins):
+        selected = engine.bin_schemes(offsets, i)
+        assert sorted(selected["scheme_id"]) == sorted(ids[bins == i])
+        np.testing.assert_array_equal(selected["avg_time_taken"], means[selected["scheme_id"]])
+
+def test_single_value():
+    schemes = pd.DataFrame({"scheme_id": [1, 2, 3]})
+    workflow = pd.DataFrame({"scheme_id": [1, 1, 2, 4], "time_taken": [4.0, 6.0, 5.0, 9.0]})
+    engine = AvgTimeBins(schemes, workflow)
+
+    lo, hi = engine.bounds()
+    edges, counts, offsets = engine.histogram(lo, hi, 5)
+    expected_counts, expected_edges = np.histogram([5.0, 5.0], bins=5, range=(lo, hi))
+    np.testing.assert_allclose(edges, expected_edges)
+    np.testing.assert_array_equal(counts, expected_counts)
+    assert sorted(engine.bin_schemes(offsets, int(np.argmax(counts)))["scheme_id"]) == [1, 2]
@@ -0,0 +1,42 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.cube import SCHEME_CUBE, WORKFLOW_CUBE, cube_answers, get_cube_index
+from utils.filter_index import FilterIndex
+from components.kpi_cards import compute_kpis
+from components.charts import prep_avg_processing_time
+
+WORKFLOW_COLUMNS = ["scheme_id", "user", "department", "forwarded_at", "time_taken", "next_department"]
+
+@pytest.mark.parametrize("mode", ["Creation Info", "Workflow Path"])
+@pytest.mark.parametrize("months", [None, 7])
+@pytest.mark.parametrize("n_departments", [0, 1, 3])
+def test_cube_answers_match_rows(loaded, mode, months, n_departments):
+    schemes, workflow = loaded.load_schemes(), loaded.load_workflow(columns=WORKFLOW_COLUMNS)
+    attachments = loaded.load_attachments(columns=["scheme_id", "fileName"])
+    index = FilterIndex(schemes, workflow, attachments)
+    start, end = index.scheme_dates.bounds()
+    if months:  # boundaries inside a day, so partial days come from the rows
+        start, end = end - pd.DateOffset(months=months) + pd.Timedelta(hours=7), end - pd.Timedelta(hours=3)
+    filters = {
+        "filter_mode": mode,
+        "date_range": (start, end),
+        "categories": [],
+        "departments": list(workflow["department"].value_counts().index[:n_departments].astype(str)),
+        "users": [],
+    }
+    selection = index.resolve(filters)
+    f_schemes, f_workflow = schemes.iloc[selection["schemes"]], workflow.iloc[selection["workflow"]]
+    rows = compute_kpis(f_schemes, f_workflow, attachments.iloc[selection["attachments"]])
+
+    kpis, monthly = cube_answers(filters, index, get_cube_index(loaded.load_scheme_cube(), SCHEME_CUBE),
+                                 get_cube_index(loaded.load_workflow_cube(), WORKFLOW_CUBE),
+                                 schemes, workflow, attachments)
+    assert kpis
+    for name, value in kpis.items():
+        assert np.isclose(value, rows[name], equal_nan=True), name
+    if monthly is not None:
+        expected = prep_avg_processing_time(f_workflow).set_index("month")["time_taken"]
+        pd.testing.assert_series_equal(monthly.set_index("month")["time_taken"].dropna(), expected.dropna(),
+                                       check_dtype=False, check_index_type=False, check_freq=False, rtol=1e-5)
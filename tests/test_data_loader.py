@@ -0,0 +1,22 @@
+import pandas as pd
+
+from utils import data_loader
+from utils.filter_index import ColumnIndex
+
+def test_vocabulary_appends_without_recoding(monkeypatch):
+    monkeypatch.setattr(data_loader, "_vocabularies", {})
+    first = data_loader.compact_frame(pd.DataFrame({"department": ["DEPT_B", "DEPT_D", "DEPT_B"]}))
+    codes = first["department"].cat.codes.tolist()
+    second = data_loader.compact_frame(pd.DataFrame({"next_department": ["DEPT_A", "DEPT_D", "DEPT_C"]}))
+
+    # Codes handed out before keep their meaning in the extended vocabulary
+    assert first["department"].cat.codes.tolist() == codes
+    vocabulary = second["next_department"].cat.categories
+    assert list(vocabulary[:2]) == ["DEPT_B", "DEPT_D"]
+    assert list(vocabulary[first["department"].cat.codes]) == ["DEPT_B", "DEPT_D", "DEPT_B"]
+    assert list(second["next_department"].astype(object)) == ["DEPT_A", "DEPT_D", "DEPT_C"]
+
+    # Value order for sorting and option lists is still alphabetical
+    index = ColumnIndex(second["next_department"])
+    assert index.present() == ["DEPT_A", "DEPT_C", "DEPT_D"]
+    assert list(index.ranks()) == [0, 3, 2]
@@ -0,0 +1,74 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.filter_index import FilterIndex
+
+def random_tables(seed=0, n_schemes=300, n_workflow=1500, n_attachments=600):
+    """Small tables with duplicate scheme rows, missing values and workflow/attachment ids absent from schemes."""
+    rng = np.random.default_rng(seed)
+    day = np.datetime64("2024-01-01T00:00:00", "ns")
+    hours = lambda n: rng.integers(0, 24 * 365, n).astype("timedelta64[h]")
+    schemes = pd.DataFrame({
+        "scheme_id": rng.integers(0, 250, n_schemes),
+        "creationDate": day + hours(n_schemes),
+        "category": rng.choice(["CAT_A", "CAT_B", "CAT_C", None], n_schemes),
+        "department_at_time": rng.choice(["D1", "D2", "D3"], n_schemes),
+        "createdBy": rng.choice(["U1", "U2", "U3", "U4"], n_schemes),
+    })
+    workflow = pd.DataFrame({
+        "scheme_id": rng.integers(0, 280, n_workflow),  # 250..279 are not in schemes
+        "forwarded_at": day + hours(n_workflow),
+        "department": rng.choice(["D1", "D2", "D3", None], n_workflow),
+        "user": rng.choice(["U1", "U2", "U3", "U4", "U5"], n_workflow),
+    })
+    attachments = pd.DataFrame({"scheme_id": rng.integers(0, 280, n_attachments)})
+    return schemes, workflow, attachments
+
+def filter_rows(schemes, workflow, attachments, filters):
+    """The selection of `filters` with plain masks and isin (row positions per table)."""
+    start, end = filters["date_range"]
+    if filters["filter_mode"] == "Creation Info":
+        mask = schemes["creationDate"].between(start, end)
+        for col, values in (("category", filters["categories"]), ("department_at_time", filters["departments"]),
+                            ("createdBy", filters["users"])):
+            if values:
+                mask &= schemes[col].isin(values)
+        workflow_mask = workflow["scheme_id"].isin(schemes.loc[mask, "scheme_id"])
+    else:
+        workflow_mask = workflow["forwarded_at"].between(start, end)
+        for col, values in (("department", filters["departments"]), ("user", filters["users"])):
+            if values:
+                workflow_mask &= workflow[col].isin(values)
+        mask = schemes["scheme_id"].isin(workflow.loc[workflow_mask, "scheme_id"])
+        if filters["categories"]:
+            mask &= schemes["category"].isin(filters["categories"])
+            workflow_mask &= workflow["scheme_id"].isin(schemes.loc[mask, "scheme_id"])
+    attachment_mask = attachments["scheme_id"].isin(schemes.loc[mask, "scheme_id"])
+    return {"schemes": np.flatnonzero(mask), "workflow": np.flatnonzero(workflow_mask),
+            "attachments": np.flatnonzero(attachment_mask)}
+
+FULL = (pd.Timestamp("2023-01-01"), pd.Timestamp("2026-01-01"))
+PART = (pd.Timestamp("2024-03-10 06:00"), pd.Timestamp("2024-08-20 18:30"))
+
+@pytest.mark.parametrize("mode", ["Creation Info", "Workflow Path"])
+@pytest.mark.parametrize("date_range, categories, departments, users", [
+    (FULL, [], [], []),
+    (PART, [], [], []),
+    (PART, ["CAT_A", "CAT_C"], [], []),
+    (FULL, ["CAT_B"], ["D2"], ["U1", "U3"]),
+    (PART, [], ["D1", "D3"], ["U2"]),
+    (FULL, ["NO_SUCH_CATEGORY"], [], []),              # selects nothing
+    (PART, [], ["D1"], ["NO_SUCH_USER"]),              # selects nothing
+    ((PART[1], PART[0]), [], [], []),                  # empty date range
+])
+def test_resolve_matches_masks(mode, date_range, categories, departments, users):
+    schemes, workflow, attachments = random_tables()
+    filters = {"filter_mode": mode, "date_range": date_range, "categories": categories,
+               "departments": departments, "users": users}
+
+    selection = FilterIndex(schemes, workflow, attachments).resolve(filters)
+    expected = filter_rows(schemes, workflow, attachments, filters)
+
+    for table, rows in expected.items():
+        np.testing.assert_array_equal(selection[table], rows, err_msg=table)
@@ -0,0 +1,33 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.health import DuplicateCounter
+
+def chunks(seed=0, n_chunks=6, rows=500):
+    """Raw-like chunks with duplicates inside and across chunks, and missing values."""
+    rng = np.random.default_rng(seed)
+    for _ in range(n_chunks):
+        yield pd.DataFrame({
+            "scheme_id": rng.integers(0, 300, rows),
+            "user": rng.choice(["U1", "U2", "U3", None], rows),
+            "time_taken": rng.choice([1.0, 2.5, np.nan], rows),
+        })
+
+@pytest.mark.parametrize("close", [False, True])
+def test_duplicate_counter_spills_to_disk(close):
+    frames = list(chunks())
+    counter = DuplicateCounter(partitions=8, max_buffered=700)
+    for frame in frames:
+        counter.add(frame)
+    spill_dir = counter._spill_dir
+    assert spill_dir is not None and os.listdir(spill_dir)
+
+    if close:  # e.g. the pass failed before count() was reached
+        counter.close()
+        counter.close()
+    else:
+        assert counter.count() == pd.concat(frames, ignore_index=True).duplicated().sum()
+    assert not os.path.exists(spill_dir)
+    assert counter._spill_dir is None
@@ -0,0 +1,52 @@
+import os
+import pytest
+
+from utils import preprocessing
+from tests.conftest import assert_same_outputs
+
+def split_exports(raw_dir, old_dir, new_dir, keep=0.8):
+    """Write the first `keep` of every raw CSV to `old_dir` and all of it, plus a late step of scheme 0, to `new_dir`."""
+    for fname in preprocessing.RAW_FILES.values():
+        with open(os.path.join(raw_dir, fname)) as f:
+            lines = f.readlines()
+        with open(os.path.join(old_dir, fname), "w") as f:
+            f.writelines(lines[:int(len(lines) * keep)])
+        with open(os.path.join(new_dir, fname), "w") as f:
+            f.writelines(lines)
+            if fname == "workflow.csv":
+                f.write("0,01-01-2031 10:00,USER_00001,DEPT_01,5.0\n")
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet"])
+def test_incremental_matches_full_rebuild(raw_dir, tmp_path, fmt):
+    old_raw, new_raw, incremental, full = (tmp_path / d for d in ("old_raw", "new_raw", "incremental", "full"))
+    for d in (old_raw, new_raw, incremental, full):
+        d.mkdir()
+    split_exports(raw_dir, old_raw, new_raw)
+
+    preprocessing.main(str(old_raw), str(incremental), fmt)
+    preprocessing.main(str(new_raw), str(incremental), fmt, incremental=True)
+    preprocessing.main(str(new_raw), str(full), fmt)
+
+    assert_same_outputs(str(incremental), str(full), fmt)
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet"])
+def test_streaming_matches_full_rebuild(raw_dir, tmp_path, fmt):
+    streaming, full = tmp_path / "streaming", tmp_path / "full"
+    streaming.mkdir()
+    full.mkdir()
+
+    preprocessing.main(raw_dir, str(streaming), fmt, streaming=True, chunksize=700)
+    preprocessing.main(raw_dir, str(full), fmt)
+
+    assert_same_outputs(str(streaming), str(full), fmt)
+
+@pytest.mark.parametrize("fmt", ["csv", "parquet"])
+def test_parallel_matches_full_rebuild(raw_dir, tmp_path, fmt):
+    parallel, full = tmp_path / "parallel", tmp_path / "full"
+    parallel.mkdir()
+    full.mkdir()
+
+    preprocessing.main(raw_dir, str(parallel), fmt, parallel=True, workers=2)
+    preprocessing.main(raw_dir, str(full), fmt)
+
+    assert_same_outputs(str(parallel), str(full), fmt)
@@ -0,0 +1,19 @@
+import pytest
+
+from utils import preprocessing
+from utils.query_backend import parity_check
+
+pytest.importorskip("duckdb")
+
+@pytest.fixture(scope="module")
+def csv_output_dir(raw_dir, tmp_path_factory):
+    path = tmp_path_factory.mktemp("csv_outputs")
+    preprocessing.main(raw_dir, str(path), "csv")
+    return str(path)
+
+@pytest.mark.parametrize("fmt", ["parquet", "csv"])
+def test_duckdb_matches_pandas(loaded, request, fmt):
+    """Every KPI and chart aggregation agrees between the backends for the sidebar filter presets."""
+    # parity_check points the loaders at data_dir; the `loaded` fixture restores them afterwards
+    data_dir = request.getfixturevalue("output_dir" if fmt == "parquet" else "csv_output_dir")
+    assert parity_check(data_dir, fmt) == []
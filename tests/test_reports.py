@@ -0,0 +1,40 @@
+import pandas as pd
+
+from components.reports import annual_report
+
+def steps(*rows):
+    return pd.DataFrame(rows, columns=["scheme_id", "user", "department", "forwarded_at"]).astype({"forwarded_at": "datetime64[ns]"})
+
+def test_annual_report_counts_schemes():
+    workflow = steps(
+        # A goes back to U1 within 2020 and is passed on in 2021
+        ("A", "U1", "D1", "2020-03-01"), ("A", "U2", "D2", "2020-06-01"),
+        ("A", "U1", "D1", "2020-09-01"), ("A", "U2", "D2", "2021-02-01"),
+        # B is forwarded from U1 to U1, then held until 2022
+        ("B", "U1", "D1", "2019-12-01"), ("B", "U1", "D1", "2020-05-01"), ("B", "U2", "D2", "2022-01-01"),
+    )
+    expected = pd.DataFrame([
+        (2019, "U1", 1, 0, 0, 1),
+        (2020, "U1", 1, 0, 1, 2),
+        (2020, "U2", 1, 1, 0, 0),
+        (2021, "U1", 0, 1, 2, 1),
+        (2021, "U2", 1, 0, 0, 1),
+        (2022, "U1", 0, 1, 1, 0),
+        (2022, "U2", 1, 0, 1, 2),
+    ], columns=["year", "user", "received", "processed", "carried_over", "pending"])
+
+    report = annual_report(workflow, "user")
+    pd.testing.assert_frame_equal(report.astype({"user": object}), expected, check_dtype=False)
+
+def test_annual_report_balances(loaded):
+    workflow = loaded.load_workflow(columns=["scheme_id", "user", "department", "forwarded_at"])
+    for by in ("user", "department"):
+        report = annual_report(workflow, by)
+        assert not report.empty
+        assert (report["carried_over"] + report["received"] - report["processed"] == report["pending"]).all()
+        assert (report[["received", "processed", "carried_over", "pending"]] >= 0).all().all()
+        # Received schemes are distinct: at most one per holder, scheme and year
+        intervals = workflow.dropna(subset=["forwarded_at"])
+        distinct = intervals.groupby([intervals["forwarded_at"].dt.year, by], observed=True)["scheme_id"].nunique()
+        received = report.set_index(["year", by])["received"]
+        assert (received <= distinct.reindex(received.index, fill_value=0).to_numpy()).all()
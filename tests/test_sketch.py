@@ -0,0 +1,40 @@
+import pandas as pd
+import pytest
+
+from utils.filter_index import FilterIndex
+from utils.sketch import approx_distinct, build_workflow_sketch, merge_sketches, whole_months
+
+WORKFLOW_COLUMNS = ["scheme_id", "user", "department", "forwarded_at", "time_taken", "next_department"]
+
+@pytest.mark.parametrize("mode", ["Creation Info", "Workflow Path"])
+@pytest.mark.parametrize("months", [None, 7, 0])
+def test_approx_distinct_within_error(loaded, mode, months):
+    schemes, workflow = loaded.load_schemes(), loaded.load_workflow(columns=WORKFLOW_COLUMNS)
+    index = FilterIndex(schemes, workflow)
+    start, end = index.scheme_dates.bounds()
+    if months is not None:  # boundaries inside a month, so some days are hashed from the rows
+        start, end = end - pd.DateOffset(months=months, days=20) + pd.Timedelta(hours=7), end - pd.Timedelta(hours=3)
+    filters = {"filter_mode": mode, "date_range": (start, end), "categories": [], "departments": [], "users": []}
+    selection = index.resolve(filters)
+    exact = {
+        "unique_generators": schemes.iloc[selection["schemes"]]["createdBy"].nunique(),
+        "total_schemes": workflow.iloc[selection["workflow"]]["scheme_id"].nunique(),
+        "unique_participators": workflow.iloc[selection["workflow"]]["user"].nunique(),
+    }
+    approx = approx_distinct(filters, index, loaded.load_scheme_sketch(), loaded.load_workflow_sketch(),
+                             schemes, workflow)
+    assert approx
+    for name, value in approx.items():
+        assert abs(value - exact[name]) <= max(0.05 * exact[name], 2), name
+
+def test_merged_chunks_equal_whole_sketch(loaded):
+    workflow = loaded.load_workflow(columns=WORKFLOW_COLUMNS)
+    chunks = [build_workflow_sketch(workflow.iloc[i:i + 700]) for i in range(0, len(workflow), 700)]
+    pd.testing.assert_frame_equal(merge_sketches(*chunks), build_workflow_sketch(workflow), check_categorical=False)
+
+def test_whole_months():
+    first, stop, partials = whole_months(pd.Timestamp("2024-01-15 10:00"), pd.Timestamp("2024-04-01 00:00"))
+    assert (first, stop) == (pd.Timestamp("2024-02-01"), pd.Timestamp("2024-04-01"))
+    assert partials == [(pd.Timestamp("2024-01-15 10:00"), first, False), (stop, pd.Timestamp("2024-04-01"), True)]
+    first, stop, partials = whole_months(pd.Timestamp("2024-02-01"), pd.Timestamp("2024-02-29 23:59:59.999999999"))
+    assert (first, stop, partials) == (pd.Timestamp("2024-02-01"), pd.Timestamp("2024-03-01"), [])
@@ -1,8 +1,11 @@
+import threading
+from collections import OrderedDict
+import numpy as np
 import pandas as pd
 
 def average_processing_time(workflow_df):
     return (
-        workflow_df.groupby(['user', 'department'])['time_taken']
+        workflow_df.groupby(['user', 'department'], observed=True)['time_taken']
         .mean()
         .reset_index()
         .rename(columns={"time_taken": "avg_processing_time"})
@@ -10,7 +13,7 @@ def average_processing_time(workflow_df):
 
 def average_attachments_per_user(attachments_df):
     return (
-        attachments_df.groupby(['user', 'department'])['fileName']
+        attachments_df.groupby(['user', 'department'], observed=True)['fileName']
         .count()
         .reset_index()
         .rename(columns={"fileName": "total_attachments"})
@@ -24,15 +27,121 @@ def aging_buckets(schemes_df, cutoff_date):
         labels=["< 90 days", "90–180 days", "> 180 days"]
     )
 
-def determine_pending_owners(workflow_df, as_of_date):
-    filtered = workflow_df[workflow_df["forwarded_at"] <= as_of_date]
-    latest_step = filtered.sort_values("forwarded_at").groupby("scheme_id").tail(1)
-    return latest_step[["scheme_id", "user", "department", "forwarded_at"]]
+# --- Owner as of date ---
+# Workflow steps sorted by (scheme, forwarded_at) with a composite integer key,
+# so "latest step of every scheme on or before D" is one searchsorted over all
+# schemes, and a batch of dates is one searchsorted over (dates x schemes).
+# The timeline holds only positions, so the frame it was built from is passed
+# back in to look the owners up.
 
-def classify_aging_buckets(schemes_df, workflow_df, end_date):
+class OwnerTimeline:
+    """Sorted workflow steps answering latest-owner-as-of-date lookups."""
+
+    def __init__(self, workflow_df):
+        times = workflow_df["forwarded_at"].to_numpy(dtype="datetime64[ns]").view("int64")
+        valid = np.flatnonzero(~pd.isna(workflow_df["forwarded_at"]).to_numpy())
+        codes, keys = pd.factorize(workflow_df["scheme_id"].iloc[valid])
+        self.keys = pd.Index(keys)
+
+        # Dense time rank, so scheme_code * (n_times + 1) + rank fits in int64
+        self.times = np.unique(times[valid])
+        self.stride = len(self.times) + 1
+        ranks = np.searchsorted(self.times, times[valid])
+        composite = codes.astype(np.int64) * self.stride + ranks
+        order = np.argsort(composite, kind="stable")  # ties keep workflow row order
+        self.composite = composite[order]
+        self.rows = valid[order]                      # workflow positions in sorted order
+        # First sorted position of every scheme (per-scheme offsets)
+        self.starts = np.searchsorted(self.composite, np.arange(len(keys), dtype=np.int64) * self.stride)
+
+    def positions(self, as_of):
+        """
+        Workflow row position of each scheme's latest step on or before `as_of`
+        (-1 where the scheme has no step yet), aligned with `self.keys`.
+        A list of dates gives a (dates x schemes) array.
+        """
+        dates = pd.to_datetime(pd.Index(np.atleast_1d(as_of))).to_numpy(dtype="datetime64[ns]").view("int64")
+        limit = np.searchsorted(self.times, dates, side="right")  # steps with rank < limit qualify
+        bases = np.arange(len(self.keys), dtype=np.int64) * self.stride
+        last = np.searchsorted(self.composite, bases[None, :] + limit[:, None], side="left") - 1
+        found = last >= self.starts[None, :]
+        result = np.where(found, self.rows[np.maximum(last, 0)], -1)
+        return result if np.ndim(as_of) else result[0]
+
+    def owners(self, workflow_df, as_of, columns=None):
+        """Latest step (rows of `workflow_df`) of every scheme as of `as_of`."""
+        pos = self.positions(as_of)
+        frame = workflow_df if columns is None else workflow_df[columns]
+        return frame.iloc[pos[pos >= 0]]
+
+    def owners_batch(self, workflow_df, dates, columns=None):
+        """Latest steps as of each date in `dates`, stacked with an `as_of` column."""
+        dates = pd.to_datetime(pd.Index(dates))
+        pos = self.positions(list(dates))
+        date_idx, _ = np.nonzero(pos >= 0)
+        frame = workflow_df if columns is None else workflow_df[columns]
+        owners = frame.iloc[pos[pos >= 0]].reset_index(drop=True)
+        owners.insert(0, "as_of", dates[date_idx])
+        return owners
+
+# --- Timeline Cache ---
+# Timelines are positional, so they are only valid for the exact frame they
+# were built from; the dataset version from utils.data_loader identifies it.
+
+_timelines = OrderedDict()
+_timelines_lock = threading.Lock()
+MAX_TIMELINES = 2
+
+def owner_timeline(workflow_df, version=None):
+    """Return the OwnerTimeline for a dataset version's workflow, building it on first use."""
+    if version is None:
+        return OwnerTimeline(workflow_df)
+    with _timelines_lock:
+        timeline = _timelines.get(version)
+        if timeline is not None:
+            _timelines.move_to_end(version)
+            return timeline
+    timeline = OwnerTimeline(workflow_df)
+    with _timelines_lock:
+        _timelines[version] = timeline
+        while len(_timelines) > MAX_TIMELINES:
+            _timelines.popitem(last=False)
+    return timeline
+
+def holding_intervals(workflow_df, version=None):
+    """
+    Holding period of every workflow step: the holder (user, department)
+    holds the scheme from its forwarded_at until the scheme's next step.
+    `end` is NaT for each scheme's latest step (still held). Rows keep the
+    workflow index; steps without forwarded_at are dropped.
+    """
+    timeline = owner_timeline(workflow_df, version)
+    rows = timeline.rows
+    scheme = timeline.composite // timeline.stride
+    start = timeline.times[timeline.composite % timeline.stride]
+    has_next = np.zeros(len(rows), dtype=bool)
+    has_next[:-1] = scheme[1:] == scheme[:-1]
+    end = np.full(len(rows), np.iinfo(np.int64).min)  # NaT
+    end[:-1][has_next[:-1]] = start[1:][has_next[:-1]]
+
+    keep = np.sort(rows)
+    order = np.argsort(rows)  # back to workflow row order
+    frame = workflow_df.iloc[keep][["scheme_id", "user", "department"]]
+    return frame.assign(start=start[order].view("datetime64[ns]"), end=end[order].view("datetime64[ns]"))
+
+def determine_pending_owners(workflow_df, as_of_date, version=None):
+    owners = owner_timeline(workflow_df, version).owners(workflow_df, as_of_date)
+    return owners[["scheme_id", "user", "department", "forwarded_at"]]
+
+def pending_owner_trend(workflow_df, dates, by="department", version=None):
+    """Count of pending schemes per `by` value at each as-of date (dates x values)."""
+    owners = owner_timeline(workflow_df, version).owners_batch(workflow_df, dates, columns=[by])
+    counts = owners.groupby(["as_of", by], observed=True).size().unstack(fill_value=0)
+    return counts.reindex(pd.to_datetime(pd.Index(dates)), fill_value=0)
+
+def classify_aging_buckets(schemes_df, workflow_df, end_date, version=None):
     # Find the latest owner as of end_date
-    latest = workflow_df[workflow_df["forwarded_at"] <= end_date]
-    latest = latest.sort_values("forwarded_at").groupby("scheme_id").tail(1)
+    latest = owner_timeline(workflow_df, version).owners(workflow_df, end_date)
 
     # Merge with schemes to get creation date
     pending = latest.merge(schemes_df[["scheme_id", "creationDate"]], on="scheme_id", how="left")
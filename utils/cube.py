@@ -0,0 +1,284 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+try:
+    from utils.filter_index import CREATION_MODES
+    from utils.instrumentation import timed
+except ImportError:  # imported by utils/preprocessing.py run as a script
+    from filter_index import CREATION_MODES
+    from instrumentation import timed
+
+# --- Daily Cubes ---
+# Pre-aggregated tables with one row per day and dimension combination.
+# A date-range query sums the cells of the whole days in the range; rows on
+# days only partly inside it are aggregated on the fly with the same builder,
+# so results equal aggregating the filtered rows.
+#
+# The only dimension is the department, as in the sketches (utils.sketch):
+# with user and category dimensions most cells held a single row, and the
+# cubes were nearly as large as the tables they summarize. Category and user
+# selections and the distinct user counts are answered from the rows.
+
+SCHEME_CUBE = "cube_schemes"
+WORKFLOW_CUBE = "cube_workflow"
+SCHEME_CUBE_DIMS = ["department_at_time"]
+WORKFLOW_CUBE_DIMS = ["department"]
+AGING_OVER_180 = "> 180 days"
+
+def scheme_step_totals(workflow):
+    """Per-scheme workflow totals (steps, time_taken_sum, time_taken_count); chunks can be added."""
+    return workflow.groupby('scheme_id', observed=True).agg(
+        steps=('scheme_id', 'size'),
+        time_taken_sum=('time_taken', 'sum'),
+        time_taken_count=('time_taken', 'count'),
+    )
+
+def build_scheme_cube(schemes, step_totals, attachment_counts):
+    """
+    Scheme cube keyed by (creation_date, department_at_time).
+
+    `step_totals` is `scheme_step_totals(workflow)` and `attachment_counts` the
+    attachment rows per scheme_id. Cells hold scheme counts, schemes aging over
+    180 days, attachments, workflow time sums/counts, and the sum/count of
+    per-scheme workflow time per attachment. A scheme_id listed more than once
+    is counted once, on its first row.
+    """
+    schemes = schemes.dropna(subset=['creationDate']).drop_duplicates('scheme_id')
+    totals = step_totals.reindex(schemes['scheme_id'])
+    cells = scheme_cell_rows(
+        schemes, totals['steps'].fillna(0).to_numpy(), totals['time_taken_sum'].fillna(0).to_numpy(),
+        totals['time_taken_count'].fillna(0).to_numpy(),
+        attachment_counts.reindex(schemes['scheme_id']).fillna(0).to_numpy(),
+    )
+    return cells.groupby(['creation_date'] + SCHEME_CUBE_DIMS, dropna=False, observed=True, sort=True).sum().reset_index()
+
+def scheme_cell_rows(schemes, steps, time_sum, time_count, files):
+    """One ungrouped scheme cube cell per row of `schemes`, from per-row totals."""
+    rated = (files > 0) & (steps > 0)
+    return pd.DataFrame({
+        'creation_date': schemes['creationDate'].dt.normalize().to_numpy(),
+        **{dim: schemes[dim].to_numpy() for dim in SCHEME_CUBE_DIMS},
+        'schemes': 1,
+        'aging_gt_180': (schemes['aging_bucket'] == AGING_OVER_180).to_numpy().astype('int64'),
+        'attachments': files.astype('int64'),
+        'steps': steps.astype('int64'),
+        'time_taken_sum': time_sum,
+        'time_taken_count': time_count.astype('int64'),
+        'time_per_attachment_sum': np.where(rated, time_sum / np.where(rated, files, 1), 0.0),
+        'time_per_attachment_count': rated.astype('int64'),
+    })
+
+def build_workflow_cube(workflow):
+    """
+    Workflow cube keyed by (forwarded_date, department). Cells hold step
+    counts and time_taken sums/counts.
+    """
+    cells = workflow_cell_rows(workflow[workflow['forwarded_at'].notna()])
+    return cells.groupby(['forwarded_date'] + WORKFLOW_CUBE_DIMS, dropna=False, observed=True, sort=True).sum().reset_index()
+
+def workflow_cell_rows(workflow):
+    """One ungrouped workflow cube cell per row of `workflow`."""
+    time_taken = pd.to_numeric(workflow['time_taken'], errors='coerce').to_numpy(dtype=float)
+    return pd.DataFrame({
+        'forwarded_date': workflow['forwarded_at'].dt.normalize().to_numpy(),
+        'department': workflow['department'].to_numpy(),
+        'steps': 1,
+        'time_taken_sum': np.nan_to_num(time_taken),
+        'time_taken_count': (~np.isnan(time_taken)).astype('int64'),
+    })
+
+def add_cubes(*cubes):
+    """Sum partial cubes of the same kind (e.g. one per chunk)."""
+    cubes = [c for c in cubes if c is not None and not c.empty]
+    if not cubes:
+        return None
+    keys = [c for c in cubes[0].columns if c in ('creation_date', 'forwarded_date') or c in SCHEME_CUBE_DIMS + WORKFLOW_CUBE_DIMS]
+    return pd.concat(cubes, ignore_index=True).groupby(keys, dropna=False, observed=True, sort=True).sum().reset_index()
+
+# --- Cube Queries ---
+
+def whole_days(start, end):
+    """
+    Split [start, end] into whole days [first, stop) and the partial
+    intervals left over at either end, as (first, stop, partials) where each
+    partial is (lo, hi, hi_inclusive).
+    """
+    start, end = pd.Timestamp(start), pd.Timestamp(end)
+    first = start.ceil('D')
+    stop = (end + pd.Timedelta(1, 'ns')).floor('D')
+    if stop <= first:
+        return first, first, [(start, end, True)]
+    partials = []
+    if start < first:
+        partials.append((start, first, False))
+    if stop <= end:
+        partials.append((stop, end, True))
+    return first, stop, partials
+
+class CubeIndex:
+    """
+    Cells of a daily cube sorted by (dimension key, day), where the key
+    combines the codes of every dimension. The cells of one key over a day
+    range are contiguous, so a selection is one binary search per selected
+    combination of dimension values instead of a scan of the cells.
+    """
+
+    def __init__(self, cube, date_col, dims):
+        self.cube = cube
+        self.date_col = date_col
+        self.dims = dims
+        self.values = {}
+        key = np.zeros(len(cube), dtype=np.int64)
+        for dim in dims:
+            values = cube[dim].astype('category')  # a no-op for dictionary-encoded cubes
+            self.values[dim] = values.cat.categories
+            key = key * (len(self.values[dim]) + 1) + values.cat.codes.to_numpy().astype(np.int64) + 1  # 0: missing
+        days = cube[date_col].to_numpy(dtype='datetime64[D]').view('int64')
+        self.day0 = int(days.min()) if len(days) else 0
+        self.n_days = int(days.max()) - self.day0 + 1 if len(days) else 0
+        composite = key * self.n_days + (days - self.day0)
+        self.order = np.argsort(composite, kind='stable')
+        self.sorted = composite[self.order]
+
+    def _day(self, ts):
+        return int(np.clip(pd.Timestamp(ts).to_datetime64().astype('datetime64[D]').view('int64') - self.day0,
+                           0, self.n_days))
+
+    def cells(self, first, stop, **selected):
+        """Cells of whole days [first, stop) matching the non-empty dimension selections."""
+        if not any(selected.values()):
+            days = self.cube[self.date_col]  # cubes are stored sorted by day
+            return self.cube.iloc[days.searchsorted(first):days.searchsorted(stop)]
+        keys = np.zeros(1, dtype=np.int64)
+        for dim in self.dims:
+            vocab = self.values[dim]
+            if selected.get(dim):
+                codes = vocab.get_indexer(list(selected[dim]))
+                codes = np.unique(codes[codes >= 0]) + 1
+            else:
+                codes = np.arange(len(vocab) + 1)
+            keys = (keys[:, None] * (len(vocab) + 1) + codes[None, :]).ravel()
+        lo = np.searchsorted(self.sorted, keys * self.n_days + self._day(first))
+        hi = np.searchsorted(self.sorted, keys * self.n_days + self._day(stop))
+        lengths = hi - lo
+        starts = np.repeat(lo - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+        return self.cube.iloc[np.sort(self.order[np.arange(lengths.sum()) + starts])]
+
+def scheme_cells(filters, index, cube, schemes, workflow, attachments):
+    """
+    Scheme cube cells for a creation-mode filter. Schemes on partial days
+    are added as one cell each, with their totals taken from the index groups.
+    """
+    selected = dict(department_at_time=filters["departments"])
+    first, stop, partials = whole_days(*filters["date_range"])
+    parts = [cube.cells(first, stop, **selected)]
+    rows = [index.scheme_dates.rows(lo, hi, inclusive) for lo, hi, inclusive in partials]
+    rows = index.scheme_rows_matching(np.concatenate(rows), **selected) if rows else []
+    if len(rows):
+        # A scheme_id listed more than once is counted once, as in build_scheme_cube
+        codes, first_rows = np.unique(index.scheme_codes[rows], return_index=True)
+        rows = rows[first_rows]
+        steps = index.workflow_by_key.take(codes)
+        slot = np.searchsorted(codes, index.workflow_codes[steps])
+        time_taken = pd.to_numeric(workflow['time_taken'].iloc[steps], errors='coerce').to_numpy(dtype=float)
+        files = np.zeros(len(codes), dtype=np.int64)
+        if index.attachments_by_key is not None:
+            offsets = index.attachments_by_key.offsets
+            files = np.where(codes >= 0, offsets[codes + 2] - offsets[codes + 1], 0)
+        parts.append(scheme_cell_rows(
+            schemes.iloc[rows], np.bincount(slot, minlength=len(codes)),
+            np.bincount(slot, weights=np.nan_to_num(time_taken), minlength=len(codes)),
+            np.bincount(slot, weights=~np.isnan(time_taken), minlength=len(codes)), files,
+        ))
+    return pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+
+def workflow_cells(filters, index, cube, schemes, workflow):
+    """Workflow cube cells for a workflow-mode filter; rows on partial days are one cell each."""
+    selected = dict(department=filters["departments"])
+    first, stop, partials = whole_days(*filters["date_range"])
+    parts = [cube.cells(first, stop, **selected)]
+    rows = [index.workflow_dates.rows(lo, hi, inclusive) for lo, hi, inclusive in partials]
+    rows = index.workflow_rows_matching(np.concatenate(rows), department=filters["departments"]) if rows else []
+    if len(rows):
+        parts.append(workflow_cell_rows(workflow.iloc[rows]))
+    return pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+
+def kpis_from_scheme_cells(cells):
+    """KPI card values answerable from scheme cube cells (see components.kpi_cards)."""
+    total_schemes = int(cells['schemes'].sum())
+    total_attachments = int(cells['attachments'].sum())
+    time_count = cells['time_taken_count'].sum()
+    rated = cells['time_per_attachment_count'].sum()
+    return {
+        "total_schemes": total_schemes,
+        "avg_processing_time": cells['time_taken_sum'].sum() / time_count if time_count else np.nan,
+        "aging_over_180": int(cells['aging_gt_180'].sum()),
+        "total_attachments": total_attachments,
+        "avg_attachments_per_scheme": total_attachments / total_schemes if total_schemes > 0 else 0,
+        "avg_time_per_attachment": (cells['time_per_attachment_sum'].sum() / rated if rated else np.nan)
+        if total_attachments > 0 and cells['steps'].sum() > 0 else 0,
+    }
+
+def kpis_from_workflow_cells(cells):
+    """KPI card values answerable from workflow cube cells."""
+    time_count = cells['time_taken_count'].sum()
+    return {"avg_processing_time": cells['time_taken_sum'].sum() / time_count if time_count else np.nan}
+
+def monthly_time_from_cells(cells):
+    """Monthly mean time_taken (month, time_taken) from workflow cube cells."""
+    month = cells['forwarded_date'].dt.to_period('M').dt.to_timestamp().rename('month')
+    sums = cells[['time_taken_sum', 'time_taken_count']].groupby(month).sum()
+    mean = sums['time_taken_sum'] / sums['time_taken_count'].where(sums['time_taken_count'] > 0)
+    return mean.rename('time_taken').reset_index()
+
+@timed()
+def cube_answers(filters, index, scheme_cube, workflow_cube, schemes, workflow, attachments):
+    """
+    KPI values and the monthly time trend answerable from the cubes for a
+    `sidebar_filters` dict, as (kpis, monthly). The cubes are CubeIndex
+    objects (see get_cube_index). Creation-mode filters use the scheme cube,
+    workflow-mode filters the workflow cube; whatever a cube can't answer
+    (category and user selections, distinct users) is left out (kpis) or
+    None (monthly).
+    """
+    if filters["categories"] or filters["users"] or any(pd.isna(d) for d in filters["date_range"]):
+        return {}, None
+    if filters["filter_mode"] in CREATION_MODES:
+        if scheme_cube is None:
+            return {}, None
+        return kpis_from_scheme_cells(scheme_cells(filters, index, scheme_cube, schemes, workflow, attachments)), None
+    if workflow_cube is None:
+        return {}, None
+    cells = workflow_cells(filters, index, workflow_cube, schemes, workflow)
+    return kpis_from_workflow_cells(cells), monthly_time_from_cells(cells)
+
+# --- Shared Cube Index Cache ---
+# Like the FilterIndex, a CubeIndex is built once per dataset version.
+
+_cube_indexes = OrderedDict()
+_cube_indexes_lock = threading.Lock()
+MAX_CUBE_INDEXES = 4
+
+@timed()
+def get_cube_index(cube, name, version=None):
+    """CubeIndex of the `name` cube (SCHEME_CUBE or WORKFLOW_CUBE), or None if it wasn't built."""
+    if cube is None:
+        return None
+    if version is not None:
+        with _cube_indexes_lock:
+            result = _cube_indexes.get((version, name))
+            if result is not None:
+                _cube_indexes.move_to_end((version, name))
+                return result
+    if name == SCHEME_CUBE:
+        result = CubeIndex(cube, 'creation_date', SCHEME_CUBE_DIMS)
+    else:
+        result = CubeIndex(cube, 'forwarded_date', WORKFLOW_CUBE_DIMS)
+    if version is not None:
+        with _cube_indexes_lock:
+            _cube_indexes[(version, name)] = result
+            while len(_cube_indexes) > MAX_CUBE_INDEXES:
+                _cube_indexes.popitem(last=False)
+    return result
@@ -1,85 +1,459 @@
+import hashlib
+import multiprocessing
 import os
+import sys
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
 import pandas as pd
 
+from utils.storage import resolve_table, read_table
+from utils.instrumentation import timed
+from utils.refresh import RAW_DIR, active_data_dir
+
 # --- Configuration ---
 DATA_DIR = r"D:\Automation\python\schemes_dashboard\data"
 
+# Storage format to read ("csv", "parquet", "feather", "arrow"); "auto" picks the newest file
+DATA_FORMAT = os.environ.get("SCHEMES_DATA_FORMAT", "auto")
+
+# Memory budget for the shared table cache (override with SCHEMES_CACHE_MB)
+CACHE_MAX_BYTES = int(os.environ.get("SCHEMES_CACHE_MB", "1024")) * 1024 * 1024
+
+# --- Shared Table Cache ---
+# One cache per server process, shared by every Streamlit session. Entries are
+# keyed on (path, mtime, size): when preprocessing.py rewrites a file the key
+# changes, the next load re-reads it and the stale entry is dropped.
+
+_cache = OrderedDict()          # key -> (object, size in bytes), in LRU order
+_cache_bytes = 0
+_cache_lock = threading.Lock()
+_load_locks = {}                # key -> lock held while that key is being read
+
+def _file_signature(fpath):
+    stat = os.stat(fpath)
+    return (os.path.abspath(fpath), stat.st_mtime_ns, stat.st_size)
+
+def _object_size(obj):
+    if isinstance(obj, pd.DataFrame):
+        return int(obj.memory_usage(index=True, deep=True).sum())
+    return sys.getsizeof(obj)
+
+def _copy_on_write():
+    # Always on from pandas 3, where the option is deprecated
+    return int(pd.__version__.split(".")[0]) >= 3 or pd.get_option("mode.copy_on_write")
+
+def _share(obj):
+    """
+    Return a copy of a cached object for one caller. Frames are shallow copies
+    when copy-on-write is enabled (app.py turns it on), since any in-place
+    edit then copies the affected columns first; otherwise they are deep
+    copies, so the buffers held by the cache are never modified.
+    """
+    if isinstance(obj, pd.DataFrame):
+        return obj.copy(deep=not _copy_on_write())
+    if isinstance(obj, dict):
+        return dict(obj)
+    return obj
+
+def _evict(key):
+    global _cache_bytes
+    _, size = _cache.pop(key)
+    _cache_bytes -= size
+
+def _store(key, obj):
+    global _cache_bytes
+    path = key[0][0]
+    for stale in [k for k in _cache if k[0][0] == path and k[0] != key[0]]:
+        _evict(stale)
+    size = _object_size(obj)
+    if size > CACHE_MAX_BYTES:
+        return
+    _cache[key] = (obj, size)
+    _cache_bytes += size
+    while _cache_bytes > CACHE_MAX_BYTES:
+        _evict(next(iter(_cache)))
+
+def _lookup(key):
+    entry = _cache.get(key)
+    if entry is None:
+        return None
+    _cache.move_to_end(key)
+    return entry[0]
+
+def _cached_read(fpath, reader, variant=()):
+    """
+    Read `fpath` with `reader(fpath)` through the shared cache.
+
+    `variant` distinguishes different reads of the same file (e.g. raw vs.
+    parsed). Concurrent sessions asking for the same missing key wait for a
+    single read instead of parsing the file in parallel.
+    """
+    key = (_file_signature(fpath), variant)
+    with _cache_lock:
+        obj = _lookup(key)
+        if obj is not None:
+            return _share(obj)
+        load_lock = _load_locks.setdefault(key, threading.Lock())
+
+    with load_lock:
+        with _cache_lock:
+            obj = _lookup(key)
+        if obj is None:
+            try:
+                obj = reader(fpath)
+                with _cache_lock:
+                    # Only cache if the file was not rewritten while we read it
+                    if _file_signature(fpath) == key[0]:
+                        _store(key, obj)
+            finally:
+                with _cache_lock:
+                    _load_locks.pop(key, None)
+    return _share(obj)
+
+def evict_directory(directory):
+    """Drop every cached table read from `directory` (e.g. a retired dataset version)."""
+    prefix = os.path.join(os.path.abspath(directory), "")
+    with _cache_lock:
+        for key in [k for k in _cache if k[0][0].startswith(prefix)]:
+            _evict(key)
+
+def set_cache_budget(max_mb):
+    """Change the cache memory budget (MB), evicting entries if needed."""
+    global CACHE_MAX_BYTES
+    with _cache_lock:
+        CACHE_MAX_BYTES = int(max_mb * 1024 * 1024)
+        while _cache and _cache_bytes > CACHE_MAX_BYTES:
+            _evict(next(iter(_cache)))
+
+def clear_cache():
+    """Drop every cached table."""
+    with _cache_lock:
+        for key in list(_cache):
+            _evict(key)
+
+def cache_info():
+    """Current cache usage, for debugging and monitoring."""
+    with _cache_lock:
+        return {
+            "entries": len(_cache),
+            "bytes": _cache_bytes,
+            "max_bytes": CACHE_MAX_BYTES,
+            "files": [os.path.basename(k[0][0]) for k in _cache],
+        }
+
+# --- Compact In-memory Representation ---
+# The cleaned tables are dictionary-encoded once after reading: repeated text
+# columns become categoricals whose categories are one vocabulary per group,
+# shared by every table and session of the process (department codes mean the
+# same in schemes, workflow and attachments), and numeric columns are
+# downcast. Filters then compare integer codes instead of hashing strings.
+# Values first seen in a later table are appended to the vocabulary (not
+# sorted in), so the codes of tables already loaded keep their meaning; the
+# categories are therefore not in sorted order.
+
+VOCABULARY_GROUPS = {
+    "scheme_id": "scheme_id",
+    "department_at_time": "department", "department": "department", "next_department": "department",
+    "createdBy": "user", "user": "user", "next_user": "user",
+    "category": "category", "plant": "plant", "fileName": "fileName",
+}
+
+_vocabularies = {}              # group -> CategoricalDtype
+_vocabulary_lock = threading.Lock()
+
+def _shared_dtype(group, values):
+    """The group's shared CategoricalDtype, with any new entries of `values` appended."""
+    with _vocabulary_lock:
+        dtype = _vocabularies.get(group)
+        if dtype is None:
+            dtype = pd.CategoricalDtype(values.sort_values())
+            _vocabularies[group] = dtype
+        elif not values.isin(dtype.categories).all():
+            dtype = pd.CategoricalDtype(dtype.categories.append(values.difference(dtype.categories)))
+            _vocabularies[group] = dtype
+        return dtype
+
+def compact_frame(df, keep_buffers=False):
+    """
+    Dictionary-encode the vocabulary columns of `df` and downcast its numeric
+    columns. With `keep_buffers` (memory-mapped "arrow" tables) only text
+    columns are encoded; numeric columns and categoricals are left as the
+    views of the mapped file they are.
+    """
+    for col in df.columns:
+        values = df[col]
+        group = VOCABULARY_GROUPS.get(col)
+        categorical = isinstance(values.dtype, pd.CategoricalDtype)
+        if keep_buffers and (categorical or group is None):
+            continue
+        if group is not None:
+            uniques = values.cat.categories if categorical else pd.Index(values.dropna().unique())
+            df[col] = values.astype(_shared_dtype(group, uniques))
+        elif pd.api.types.is_float_dtype(values):
+            df[col] = pd.to_numeric(values, downcast="float")
+        elif pd.api.types.is_integer_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            df[col] = pd.to_numeric(values, downcast="integer")
+    return df
+
+# --- Dataset Snapshot ---
+# With background refreshes (utils.refresh) DATA_DIR holds versioned builds
+# and a pointer to the active one. A rerun pins the active directory once, so
+# every table it loads comes from the same build even if a new version is
+# published halfway through; the next rerun picks the new version up.
+
+_pinned = threading.local()
+
+def data_dir():
+    """Directory this thread reads tables from: its pinned dataset, else the active one."""
+    directory = getattr(_pinned, "directory", None)
+    return directory if directory is not None else active_data_dir(DATA_DIR)
+
+def pin_dataset(directory=None):
+    """Pin this thread to `directory` (default: the active dataset) and return it."""
+    _pinned.directory = directory or active_data_dir(DATA_DIR)
+    return _pinned.directory
+
+@contextmanager
+def pinned_dataset(directory=None):
+    """Context manager form of pin_dataset; restores the previous pin on exit."""
+    previous = getattr(_pinned, "directory", None)
+    try:
+        yield pin_dataset(directory)
+    finally:
+        _pinned.directory = previous
+
+def dataset_version():
+    """
+    Short identifier of the cleaned dataset on disk.
+
+    Derived from the same (path, mtime, size) signatures as the cache keys, so
+    it changes whenever preprocessing rewrites a table.
+    """
+    signatures = []
+    for name in ("schemes_cleaned", "workflow_cleaned", "attachments_cleaned"):
+        fpath, _ = resolve_table(data_dir(), name, DATA_FORMAT)
+        if os.path.exists(fpath):
+            signatures.append(_file_signature(fpath))
+    return hashlib.sha1(repr(signatures).encode("utf-8")).hexdigest()[:12]
+
 # --- Core Loaders ---
 
-def load_schemes(clean=True):
+def _columns_key(columns):
+    return tuple(columns) if columns is not None else None
+
+def _load_table(name, columns=None, compact=False):
+    """
+    Load a cleaned/summary table in whichever storage format is configured;
+    `compact` dictionary-encodes it (see compact_frame) before it is cached.
+    """
+    fpath, fmt = resolve_table(data_dir(), name, DATA_FORMAT)
+    variant = (fmt, _columns_key(columns), compact)
+
+    def read(path):
+        df = _parse_csv(path, columns) if fmt == "csv" and _in_load_pool() else read_table(path, fmt, columns)
+        return compact_frame(df, keep_buffers=fmt == "arrow") if compact else df
+
+    return _cached_read(fpath, read, variant)
+
+@timed()
+def load_schemes(clean=True, columns=None):
     """Load (cleaned) schemes data with enriched columns for dashboard."""
-    fname = "schemes_cleaned.csv" if clean else "schemes.csv"
-    fpath = os.path.join(DATA_DIR, fname)
-    df = pd.read_csv(fpath, parse_dates=["creationDate"])
-    if clean and "last_action_date" in df.columns:
-        df["last_action_date"] = pd.to_datetime(df["last_action_date"])
-    return df
+    if clean:
+        return _load_table("schemes_cleaned", columns, compact=True)
+    fpath = os.path.join(RAW_DIR or DATA_DIR, "schemes.csv")
+    return _cached_read(
+        fpath,
+        lambda path: pd.read_csv(path, usecols=columns, parse_dates=["creationDate"]),
+        ("raw", _columns_key(columns)),
+    )
 
-def load_workflow(clean=True):
+@timed()
+def load_workflow(clean=True, columns=None):
     """Load (cleaned) workflow data."""
-    fname = "workflow_cleaned.csv" if clean else "workflow.csv"
-    fpath = os.path.join(DATA_DIR, fname)
-    df = pd.read_csv(fpath, parse_dates=["forwarded_at"])
-    return df
+    if clean:
+        return _load_table("workflow_cleaned", columns, compact=True)
+    fpath = os.path.join(RAW_DIR or DATA_DIR, "workflow.csv")
+    return _cached_read(
+        fpath,
+        lambda path: pd.read_csv(path, usecols=columns, parse_dates=["forwarded_at"]),
+        ("raw", _columns_key(columns)),
+    )
 
-def load_attachments(clean=True):
+@timed()
+def load_attachments(clean=True, columns=None):
     """Load (cleaned) attachments data."""
-    fname = "attachments_cleaned.csv" if clean else "attachments.csv"
-    fpath = os.path.join(DATA_DIR, fname)
-    df = pd.read_csv(fpath)
-    return df
+    if clean:
+        return _load_table("attachments_cleaned", columns, compact=True)
+    fpath = os.path.join(RAW_DIR or DATA_DIR, "attachments.csv")
+    return _cached_read(
+        fpath,
+        lambda path: pd.read_csv(path, usecols=columns),
+        ("raw", _columns_key(columns)),
+    )
 
 # --- Summary & Pre-aggregated Tables ---
 
 def load_summary_by_user():
     """Loads user-level summary for KPI/leaderboard use."""
-    fpath = os.path.join(DATA_DIR, "summary_by_user.csv")
-    return pd.read_csv(fpath)
+    return _load_table("summary_by_user")
 
 def load_summary_by_department():
     """Loads department-level summary."""
-    fpath = os.path.join(DATA_DIR, "summary_by_department.csv")
-    return pd.read_csv(fpath)
+    return _load_table("summary_by_department")
 
 def load_summary_by_category():
     """Loads category-level summary."""
-    fpath = os.path.join(DATA_DIR, "summary_by_category.csv")
-    return pd.read_csv(fpath)
+    return _load_table("summary_by_category")
 
 def load_summary_attachments_by_user():
     """Loads attachment summary per user/department."""
-    fpath = os.path.join(DATA_DIR, "summary_attachments_by_user.csv")
-    return pd.read_csv(fpath)
+    return _load_table("summary_attachments_by_user")
+
+@timed()
+def load_summary_transitions():
+    """
+    Loads daily department -> next_department transition counts (department
+    codes shared with the workflow table), or None if the outputs predate them.
+    """
+    return _load_optional_table("summary_transitions", compact=True)
+
+def _load_optional_table(name, compact=False):
+    """Load a pre-aggregated table, or None if the outputs predate it."""
+    fpath, _ = resolve_table(data_dir(), name, DATA_FORMAT)
+    if not os.path.exists(fpath):
+        return None
+    return _load_table(name, compact=compact)
+
+@timed()
+def load_scheme_cube():
+    """Loads the daily scheme cube (see utils.cube), or None if not built yet."""
+    return _load_optional_table("cube_schemes")
+
+@timed()
+def load_workflow_cube():
+    """Loads the daily workflow cube (see utils.cube), or None if not built yet."""
+    return _load_optional_table("cube_workflow")
+
+@timed()
+def load_scheme_sketch():
+    """Loads the monthly creator sketches (see utils.sketch), or None if not built yet."""
+    return _load_optional_table("sketch_schemes")
+
+@timed()
+def load_workflow_sketch():
+    """Loads the monthly scheme/user sketches (see utils.sketch), or None if not built yet."""
+    return _load_optional_table("sketch_workflow")
 
+@timed()
+def load_scheme_facts():
+    """Loads the per-scheme fact table (see utils.facts), or None if not built yet."""
+    return _load_optional_table("scheme_facts")
+
+@timed()
+def load_health_history():
+    """
+    Loads the health snapshot of every preprocessing run (oldest first), or
+    None if the outputs predate the history.
+    """
+    fpath = os.path.join(data_dir(), "data_health_history.csv")
+    if not os.path.exists(fpath):
+        return None
+    return _cached_read(fpath, lambda path: pd.read_csv(path, parse_dates=["run_at"]))
+
+@timed()
 def load_health_metrics():
     """Loads CSV with key data health/quality metrics for display in dashboard."""
-    fpath = os.path.join(DATA_DIR, "data_health.csv")
-    s = pd.read_csv(fpath, index_col=0, header=None)
-    s = s.squeeze("columns")  # Convert to Series if possible
-    return s.to_dict()
+    fpath = os.path.join(data_dir(), "data_health.csv")
+
+    def read(path):
+        s = pd.read_csv(path, index_col=0, header=None)
+        s = s.squeeze("columns")  # Convert to Series if possible
+        return s.to_dict()
+
+    return _cached_read(fpath, read)
+
+# --- Concurrent Loading ---
+# load_tables_async starts loaders on a shared thread pool and returns their
+# futures, so a cold start takes as long as the slowest table instead of the
+# sum of all of them. Parquet/Feather/Arrow readers release the GIL and run
+# on the threads; pandas CSV parsing holds it, so pooled reads of CSV tables
+# are parsed on a process pool (SCHEMES_CSV_PROCESSES, 0 parses on the
+# threads) and only dictionary-encoded here. Loaders run pinned to the
+# caller's dataset directory.
+
+LOAD_THREADS = int(os.environ.get("SCHEMES_LOAD_THREADS", "8"))
+# CSV parse processes; by default one per spare core, up to 4 (none on a single core)
+CSV_PROCESSES = int(os.environ.get("SCHEMES_CSV_PROCESSES", str(min(4, (os.cpu_count() or 1) - 1))))
+
+_pools = {}
+_pools_lock = threading.Lock()
+_load_worker = threading.local()
+
+def _pool(kind):
+    with _pools_lock:
+        pool = _pools.get(kind)
+        if pool is None:
+            if kind == "threads":
+                pool = ThreadPoolExecutor(LOAD_THREADS, thread_name_prefix="table-loader")
+            else:
+                # Spawned, not forked: the server process is multi-threaded
+                pool = ProcessPoolExecutor(CSV_PROCESSES, mp_context=multiprocessing.get_context("spawn"))
+            _pools[kind] = pool
+        return pool
+
+def _in_load_pool():
+    return getattr(_load_worker, "active", False)
+
+def _parse_csv(path, columns):
+    """Parse a CSV table on the process pool, or on this thread if it is disabled or broken."""
+    if CSV_PROCESSES > 0:
+        try:
+            return _pool("processes").submit(read_table, path, "csv", columns).result()
+        except BrokenProcessPool:
+            with _pools_lock:
+                _pools.pop("processes", None)
+    return read_table(path, "csv", columns)
+
+def _run_loader(directory, loader):
+    _load_worker.active = True
+    try:
+        with pinned_dataset(directory):
+            return loader()
+    finally:
+        _load_worker.active = False
+
+def load_tables_async(loaders):
+    """
+    Start every loader of `loaders` (name -> callable without arguments, e.g.
+    `functools.partial(load_workflow, columns=[...])`) concurrently and return
+    name -> Future of its result.
+    """
+    directory = data_dir()
+    return {name: _pool("threads").submit(_run_loader, directory, loader) for name, loader in loaders.items()}
 
 # --- Unified Loader for Dashboard App ---
 
+PRIMARY_LOADERS = {
+    "schemes": load_schemes,
+    "workflow": load_workflow,
+    "attachments": load_attachments,
+    "summary_by_user": load_summary_by_user,
+    "summary_by_department": load_summary_by_department,
+    "summary_by_category": load_summary_by_category,
+    "summary_attachments_by_user": load_summary_attachments_by_user,
+    "data_health": load_health_metrics,
+}
+
+def load_all_data_async():
+    """All primary tables as name -> Future, loaded concurrently."""
+    return load_tables_async(PRIMARY_LOADERS)
+
 def load_all_data():
     """Convenience loader for dashboard: returns all primary tables."""
-    schemes = load_schemes()
-    workflow = load_workflow()
-    attachments = load_attachments()
-    summary_user = load_summary_by_user()
-    summary_dept = load_summary_by_department()
-    summary_cat = load_summary_by_category()
-    summary_attach_user = load_summary_attachments_by_user()
-    health_metrics = load_health_metrics()
-    return {
-        "schemes": schemes,
-        "workflow": workflow,
-        "attachments": attachments,
-        "summary_by_user": summary_user,
-        "summary_by_department": summary_dept,
-        "summary_by_category": summary_cat,
-        "summary_attachments_by_user": summary_attach_user,
-        "data_health": health_metrics
-    }
+    return {name: future.result() for name, future in load_all_data_async().items()}
 
 # --- Usage Example (for testing or dev) ---
 if __name__ == "__main__":
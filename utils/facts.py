@@ -0,0 +1,180 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+try:
+    from utils.cube import AGING_OVER_180
+    from utils.instrumentation import timed
+except ImportError:  # imported by utils/preprocessing.py run as a script
+    from cube import AGING_OVER_180
+    from instrumentation import timed
+
+# --- Per-scheme Fact Table ---
+# One row per scheme_id, in the order the ids first appear in the cleaned
+# schemes table: workflow steps, time_taken sum/count/mean, attachments, the
+# last owner (user of the latest step), last_action_date and aging bucket.
+# Like the scheme cube, a scheme_id listed more than once takes the dates and
+# bucket of its first row.
+#
+# That order is the order of FilterIndex.scheme_keys, so the scheme codes of
+# a selection index the fact arrays directly: the KPI cards and per-scheme
+# charts become reductions over the selected codes instead of groupbys over
+# the filtered workflow and attachments.
+
+SCHEME_FACTS = "scheme_facts"
+
+def latest_steps(workflow):
+    """(forwarded_at, user) of each scheme's latest step, ties going to the later row."""
+    steps = workflow[['scheme_id', 'forwarded_at', 'user']].sort_values('forwarded_at', kind='stable')
+    return steps.drop_duplicates('scheme_id', keep='last').set_index('scheme_id')
+
+def build_scheme_facts(schemes, step_totals, attachment_counts, last_steps):
+    """
+    Fact table of the cleaned `schemes`. `step_totals` is
+    `scheme_step_totals(workflow)`, `attachment_counts` the attachment rows per
+    scheme_id and `last_steps` is `latest_steps(workflow)`.
+    """
+    first = schemes.drop_duplicates('scheme_id').reset_index(drop=True)
+    ids = first['scheme_id']
+    totals = step_totals.reindex(ids)
+    time_sum = totals['time_taken_sum'].fillna(0).to_numpy(dtype=float)
+    time_count = totals['time_taken_count'].fillna(0).to_numpy(dtype='int64')
+    return pd.DataFrame({
+        'scheme_id': ids,
+        'steps': totals['steps'].fillna(0).to_numpy(dtype='int64'),
+        'time_taken_sum': time_sum,
+        'time_taken_count': time_count,
+        'time_taken_mean': np.divide(time_sum, time_count, out=np.full(len(ids), np.nan), where=time_count > 0),
+        'attachments': attachment_counts.reindex(ids).fillna(0).to_numpy(dtype='int64'),
+        'last_user': last_steps['user'].reindex(ids).to_numpy(),
+        'last_action_date': first['last_action_date'],
+        'aging_bucket': first['aging_bucket'],
+    })
+
+# --- Fact Queries ---
+
+class SchemeFacts:
+    """
+    The fact table as arrays indexed by FilterIndex scheme codes, plus each
+    workflow step's time_taken for selections that only take some of a
+    scheme's steps.
+    """
+
+    def __init__(self, facts, index, workflow):
+        self.scheme_codes = index.scheme_codes
+        self.workflow_codes = index.workflow_codes
+        self.steps = facts['steps'].to_numpy(dtype=np.int64)
+        self.time_sum = facts['time_taken_sum'].to_numpy(dtype=float)
+        self.time_count = facts['time_taken_count'].to_numpy(dtype=np.int64)
+        self.time_mean = facts['time_taken_mean'].to_numpy(dtype=float)
+        self.attachments = facts['attachments'].to_numpy(dtype=np.int64)
+        self.aging_over_180 = (facts['aging_bucket'] == AGING_OVER_180).to_numpy(dtype=bool)
+        time_taken = workflow['time_taken'].to_numpy(dtype=float)
+        self.step_time = np.nan_to_num(time_taken)
+        self.step_timed = ~np.isnan(time_taken)
+
+    @staticmethod
+    def aligned(facts, index):
+        """Whether `facts` has exactly one row per scheme key of `index`, in key order."""
+        return len(facts) == len(index.scheme_keys) and np.array_equal(
+            facts['scheme_id'].to_numpy(dtype=object), index.scheme_keys.to_numpy(dtype=object)
+        )
+
+    def select(self, selection, whole_schemes):
+        """
+        Facts of a FilterIndex selection. `whole_schemes` says the selected
+        workflow rows are every step of the selected schemes (creation-date
+        filters), so step totals come straight from the table.
+        """
+        return FactSelection(self, selection, whole_schemes)
+
+class FactSelection:
+    """KPI values and per-scheme means of one selection, from SchemeFacts."""
+
+    def __init__(self, facts, selection, whole_schemes):
+        self.facts = facts
+        self.scheme_rows = selection["schemes"]
+        self.workflow_rows = selection["workflow"]
+        self.whole_schemes = whole_schemes
+        self.codes = np.unique(facts.scheme_codes[self.scheme_rows])
+        self._totals = None
+
+    def totals(self):
+        """(steps, time_taken sum, time_taken count) of the selected steps, by scheme code."""
+        if self._totals is None:
+            f = self.facts
+            if self.whole_schemes:
+                self._totals = f.steps, f.time_sum, f.time_count
+            else:
+                codes = f.workflow_codes[self.workflow_rows]
+                known = codes >= 0
+                codes, rows = codes[known], self.workflow_rows[known]
+                n = len(f.steps)
+                self._totals = (
+                    np.bincount(codes, minlength=n),
+                    np.bincount(codes, weights=f.step_time[rows], minlength=n),
+                    np.bincount(codes, weights=f.step_timed[rows], minlength=n),
+                )
+        return self._totals
+
+    def kpis(self):
+        """KPI card values (see components.kpi_cards.compute_kpis)."""
+        f, codes = self.facts, self.codes
+        steps, time_sum, time_count = (a[codes] for a in self.totals())
+        files = f.attachments[codes]
+        total_schemes, total_attachments = len(codes), int(files.sum())
+        kpis = {
+            "total_schemes": total_schemes,
+            "aging_over_180": int(f.aging_over_180[codes].sum()),
+            "total_attachments": total_attachments,
+            "avg_attachments_per_scheme": total_attachments / total_schemes if total_schemes > 0 else 0,
+        }
+        if total_attachments > 0 and len(self.workflow_rows) > 0:
+            rated = (files > 0) & (steps > 0)
+            kpis["avg_time_per_attachment"] = (time_sum[rated] / files[rated]).mean() if rated.any() else np.nan
+        else:
+            kpis["avg_time_per_attachment"] = 0
+        if self.whole_schemes:
+            count = time_count.sum()
+            kpis["avg_processing_time"] = time_sum.sum() / count if count else np.nan
+        return kpis
+
+    def scheme_means(self):
+        """Mean time_taken over the selected steps of each selected scheme row (NaN if none)."""
+        steps, time_sum, time_count = self.totals()
+        if self.whole_schemes:
+            means = self.facts.time_mean
+        else:
+            means = np.divide(time_sum, time_count, out=np.full(len(time_sum), np.nan), where=time_count > 0)
+        return means[self.facts.scheme_codes[self.scheme_rows]]
+
+# --- Shared Facts Cache ---
+
+_facts = OrderedDict()
+_facts_lock = threading.Lock()
+MAX_FACTS = 2
+
+@timed()
+def get_scheme_facts(facts, index, workflow, version=None):
+    """
+    SchemeFacts of a dataset version, built on first use; None if the table
+    is missing or doesn't match the loaded schemes (outputs predating it).
+    """
+    if facts is None or 'time_taken' not in workflow:
+        return None
+    if version is not None:
+        with _facts_lock:
+            result = _facts.get(version)
+            if result is not None:
+                _facts.move_to_end(version)
+                return result
+    if not SchemeFacts.aligned(facts, index):
+        return None
+    result = SchemeFacts(facts, index, workflow)
+    if version is not None:
+        with _facts_lock:
+            _facts[version] = result
+            while len(_facts) > MAX_FACTS:
+                _facts.popitem(last=False)
+    return result
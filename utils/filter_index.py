@@ -0,0 +1,296 @@
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+try:
+    from utils.instrumentation import timed
+except ImportError:  # imported by utils/preprocessing.py run as a script
+    from instrumentation import timed
+
+# Columns that get a dictionary-encoded value index, per table
+SCHEME_FILTER_COLUMNS = ["category", "department_at_time", "createdBy"]
+WORKFLOW_FILTER_COLUMNS = ["department", "user"]
+
+CREATION_MODES = ("Creation Info", "creationInfo")
+
+
+class ColumnIndex:
+    """Dictionary-encoded column with the row positions of every value."""
+
+    def __init__(self, values):
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            # Already dictionary-encoded (see utils.data_loader): reuse its codes,
+            # renumbered in value order if the vocabulary was appended to
+            codes, vocab = values.cat.codes.to_numpy(), values.cat.categories
+            if not vocab.is_monotonic_increasing:
+                order = vocab.argsort()
+                renumber = np.empty(len(vocab) + 1, dtype=np.int64)
+                renumber[0] = -1
+                renumber[order + 1] = np.arange(len(vocab))
+                codes, vocab = renumber[codes.astype(np.int64) + 1], vocab[order]
+        else:
+            try:
+                codes, vocab = pd.factorize(values, sort=True)  # missing values get code -1
+            except TypeError:  # mixed types that don't compare; order them as text
+                codes, vocab = pd.factorize(values.where(values.isna(), values.astype(str)), sort=True)
+        self.vocab = pd.Index(vocab)
+        self.codes = codes.astype(np.int32)
+        self.n_rows = len(codes)
+        # Rows grouped by code (CSR layout); code c owns rows[offsets[c + 1]:offsets[c + 2]]
+        self.rows = np.argsort(self.codes, kind="stable")
+        counts = np.bincount(self.codes + 1, minlength=len(vocab) + 1)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    def bitmap(self, values):
+        """Boolean row bitmap of rows holding any of `values`."""
+        mask = np.zeros(self.n_rows, dtype=bool)
+        codes = self.vocab.get_indexer(list(values))
+        for code in codes[codes >= 0]:
+            mask[self.rows[self.offsets[code + 1]:self.offsets[code + 2]]] = True
+        return mask
+
+    def match(self, text):
+        """Boolean row bitmap of rows whose value contains `text` (case-insensitive)."""
+        hits = np.zeros(len(self.vocab) + 1, dtype=bool)
+        hits[1:] = self.vocab.astype(str).str.contains(text, case=False, regex=False)
+        return hits[self.codes + 1]
+
+    def ranks(self, descending=False):
+        """Sort key per row (equal values share a rank); missing values rank last."""
+        n = len(self.vocab)
+        ranks = n - 1 - self.codes if descending else self.codes.copy()
+        ranks[self.codes < 0] = n
+        return ranks
+
+    def contains(self, rows, values):
+        """Boolean mask over `rows` of those holding any of `values`."""
+        codes = self.vocab.get_indexer(list(values))
+        return np.isin(self.codes[rows], codes[codes >= 0])
+
+    def present(self, mask=None):
+        """Sorted values occurring in the rows selected by `mask`."""
+        codes = self.codes if mask is None else self.codes[mask]
+        seen = np.bincount(codes + 1, minlength=len(self.vocab) + 1)[1:] > 0
+        return list(self.vocab[seen])
+
+
+class DateIndex:
+    """Row positions sorted by date, for range lookups by binary search."""
+
+    def __init__(self, values):
+        ns = values.to_numpy(dtype="datetime64[ns]").view("int64")
+        valid = np.flatnonzero(~pd.isna(values).to_numpy())
+        self.n_rows = len(ns)
+        self.order = valid[np.argsort(ns[valid], kind="stable")]
+        self.sorted = ns[self.order]
+
+    def bounds(self):
+        if not len(self.sorted):
+            return pd.NaT, pd.NaT
+        return pd.Timestamp(self.sorted[0]), pd.Timestamp(self.sorted[-1])
+
+    def bitmap(self, start, end):
+        """Boolean row bitmap of rows with start <= date <= end."""
+        lo = np.searchsorted(self.sorted, pd.Timestamp(start).value, side="left")
+        hi = np.searchsorted(self.sorted, pd.Timestamp(end).value, side="right")
+        mask = np.zeros(self.n_rows, dtype=bool)
+        mask[self.order[lo:hi]] = True
+        return mask
+
+    def rows(self, start, end, inclusive=True):
+        """Sorted row positions with start <= date <= end (date < end if not inclusive)."""
+        lo = np.searchsorted(self.sorted, pd.Timestamp(start).value, side="left")
+        hi = np.searchsorted(self.sorted, pd.Timestamp(end).value, side="right" if inclusive else "left")
+        return np.sort(self.order[lo:hi])
+
+
+class GroupIndex:
+    """Row ranges of a table grouped by scheme code (scheme_id -> rows)."""
+
+    def __init__(self, codes, n_codes):
+        self.rows = np.argsort(codes, kind="stable")
+        counts = np.bincount(codes + 1, minlength=n_codes + 1)
+        self.offsets = np.concatenate([[0], np.cumsum(counts)])
+
+    def take(self, codes):
+        """Row positions (in table order) of every scheme in `codes`."""
+        codes = codes[codes >= 0]
+        starts = self.offsets[codes + 1]
+        lengths = self.offsets[codes + 2] - starts
+        total = int(lengths.sum())
+        if total == 0:
+            return np.empty(0, dtype=np.int64)
+        # Concatenate the ranges [start, start + length) without a Python loop
+        shift = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+        return np.sort(self.rows[shift + np.arange(total)])
+
+
+class FilterIndex:
+    """
+    Filter engine shared by the sidebar and the dashboard.
+
+    Built once per dataset version: date columns are sorted for binary search,
+    filter columns are dictionary-encoded with per-value row bitmaps, and
+    workflow/attachment rows are grouped by scheme. A filter request is then
+    resolved by intersecting bitmaps instead of scanning the frames.
+    """
+
+    def __init__(self, schemes, workflow, attachments=None):
+        self.n_schemes = len(schemes)
+        self.n_workflow = len(workflow)
+        self.scheme_dates = DateIndex(schemes["creationDate"])
+        self.workflow_dates = DateIndex(workflow["forwarded_at"])
+        self.schemes = schemes  # kept for columns indexed on demand (see scheme_column)
+        self.scheme_columns = {c: ColumnIndex(schemes[c]) for c in SCHEME_FILTER_COLUMNS if c in schemes}
+        self.workflow_columns = {c: ColumnIndex(workflow[c]) for c in WORKFLOW_FILTER_COLUMNS if c in workflow}
+
+        # Scheme codes shared by all tables; ids missing from schemes get -1
+        self.scheme_codes, scheme_keys = pd.factorize(schemes["scheme_id"])
+        self.scheme_keys = pd.Index(scheme_keys)
+        self.workflow_codes = self.scheme_keys.get_indexer(workflow["scheme_id"])
+        n_keys = len(self.scheme_keys)
+        self.schemes_by_key = GroupIndex(self.scheme_codes, n_keys)
+        self.workflow_by_key = GroupIndex(self.workflow_codes, n_keys)
+        self.attachments_by_key = None
+        if attachments is not None:
+            self.attachments_by_key = GroupIndex(self.scheme_keys.get_indexer(attachments["scheme_id"]), n_keys)
+
+    # --- Building blocks ---
+
+    def scheme_bitmap(self, start, end, **selected):
+        """Schemes created in [start, end] matching every non-empty column selection."""
+        mask = self.scheme_dates.bitmap(start, end)
+        for col, values in selected.items():
+            if values and col in self.scheme_columns:
+                mask &= self.scheme_columns[col].bitmap(values)
+        return mask
+
+    def workflow_bitmap(self, start=None, end=None, **selected):
+        """Workflow steps in [start, end] (no date limit if None) matching the selections."""
+        if start is None:
+            mask = np.ones(self.n_workflow, dtype=bool)
+        else:
+            mask = self.workflow_dates.bitmap(start, end)
+        for col, values in selected.items():
+            if values and col in self.workflow_columns:
+                mask &= self.workflow_columns[col].bitmap(values)
+        return mask
+
+    def scheme_rows_matching(self, rows, **selected):
+        """The scheme `rows` matching every non-empty column selection."""
+        for col, values in selected.items():
+            if values and col in self.scheme_columns:
+                rows = rows[self.scheme_columns[col].contains(rows, values)]
+        return rows
+
+    def workflow_rows_matching(self, rows, **selected):
+        """The workflow `rows` matching every non-empty column selection."""
+        for col, values in selected.items():
+            if values and col in self.workflow_columns:
+                rows = rows[self.workflow_columns[col].contains(rows, values)]
+        return rows
+
+    def scheme_column(self, col):
+        """ColumnIndex for any schemes column, built on first use (table sort/search)."""
+        if col not in self.scheme_columns:
+            self.scheme_columns[col] = ColumnIndex(self.schemes[col])
+        return self.scheme_columns[col]
+
+    def scheme_values(self, col, mask=None):
+        return self.scheme_columns[col].present(mask)
+
+    def workflow_values(self, col, mask=None):
+        return self.workflow_columns[col].present(mask)
+
+    def schemes_touched(self, workflow_mask):
+        """Bitmap of schemes with at least one of the selected workflow steps."""
+        codes = np.unique(self.workflow_codes[workflow_mask])
+        mask = np.zeros(self.n_schemes, dtype=bool)
+        mask[self.schemes_by_key.take(codes)] = True
+        return mask
+
+    # --- Filter resolution ---
+
+    @timed()
+    def resolve(self, filters):
+        """
+        Row positions selected by a `sidebar_filters` dict.
+
+        Returns a dict of positional row arrays for "schemes", "workflow" and
+        (if the index was built with attachments) "attachments".
+        """
+        start, end = filters["date_range"]
+        if filters["filter_mode"] in CREATION_MODES:
+            scheme_mask = self.scheme_bitmap(
+                start, end,
+                category=filters["categories"],
+                department_at_time=filters["departments"],
+                createdBy=filters["users"],
+            )
+            scheme_rows = np.flatnonzero(scheme_mask)
+            workflow_rows = self.workflow_by_key.take(np.unique(self.scheme_codes[scheme_rows]))
+        else:
+            workflow_mask = self.workflow_bitmap(start, end, department=filters["departments"], user=filters["users"])
+            scheme_mask = self.schemes_touched(workflow_mask)
+            if filters["categories"] and "category" in self.scheme_columns:
+                scheme_mask &= self.scheme_columns["category"].bitmap(filters["categories"])
+                kept = np.zeros(len(self.scheme_keys) + 1, dtype=bool)
+                kept[self.scheme_codes[scheme_mask] + 1] = True
+                workflow_mask &= kept[self.workflow_codes + 1]
+            scheme_rows = np.flatnonzero(scheme_mask)
+            workflow_rows = np.flatnonzero(workflow_mask)
+
+        selection = {"schemes": scheme_rows, "workflow": workflow_rows}
+        if self.attachments_by_key is not None:
+            selection["attachments"] = self.attachments_by_key.take(np.unique(self.scheme_codes[scheme_rows]))
+        return selection
+
+
+# --- Shared Index Cache ---
+# Indexes are positional, so they are only valid for the exact frames they
+# were built from; the dataset version from utils.data_loader identifies them.
+
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+MAX_INDEXES = 2
+
+@timed()
+def get_filter_index(schemes, workflow, attachments=None, version=None):
+    """Return the FilterIndex for a dataset version, building it on first use."""
+    if version is None:
+        return FilterIndex(schemes, workflow, attachments)
+    with _indexes_lock:
+        index = _indexes.get(version)
+        if index is not None:
+            _indexes.move_to_end(version)
+            return index
+    index = FilterIndex(schemes, workflow, attachments)
+    with _indexes_lock:
+        _indexes[version] = index
+        while len(_indexes) > MAX_INDEXES:
+            _indexes.popitem(last=False)
+    return index
+
+
+def filter_fingerprint(filters, version):
+    """
+    Stable key for a filter state on a dataset version.
+
+    Two reruns with the same fingerprint select exactly the same rows, so
+    anything derived from the filtered frames can be reused between them.
+    Returns None when there is no version to tie the key to.
+    """
+    if version is None:
+        return None
+    start, end = filters["date_range"]
+    state = (
+        version,
+        "creation" if filters["filter_mode"] in CREATION_MODES else "workflow",
+        str(pd.Timestamp(start)), str(pd.Timestamp(end)),
+        tuple(sorted(map(str, filters["categories"]))),
+        tuple(sorted(map(str, filters["departments"]))),
+        tuple(sorted(map(str, filters["users"]))),
+    )
+    return hashlib.sha1(repr(state).encode()).hexdigest()[:16]
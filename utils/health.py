@@ -0,0 +1,208 @@
+import os
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+
+# --- Data Health ---
+# Health counts are accumulated by HealthAudit while the raw rows are cleaned
+# (one chunk at a time in streaming mode, the whole table otherwise), so no
+# separate audit pass is made. Duplicate rows are found from 64-bit row
+# fingerprints rather than by comparing full rows; past a bounded buffer the
+# fingerprints spill to disk partitions (see DuplicateCounter).
+#
+# Every preprocessing run writes the latest counts to data_health.csv and
+# appends them as one snapshot to data_health_history.csv. slice_health
+# computes the counts that can be checked on cleaned rows for any selection.
+
+HEALTH_FILE = "data_health.csv"
+HISTORY_FILE = "data_health_history.csv"
+MAX_SNAPSHOTS = 1000
+
+# Raw columns that identify a row for duplicate detection
+WORKFLOW_KEY_COLUMNS = ["scheme_id", "forwarded_at", "user", "department", "time_taken"]
+ATTACHMENT_KEY_COLUMNS = ["scheme_id", "fileName", "user", "department"]
+
+def fingerprints(df):
+    """64-bit hash of every row (equal rows hash equal)."""
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+def count_duplicates(df):
+    """Rows that repeat an earlier row, as DataFrame.duplicated().sum()."""
+    hashes = fingerprints(df)
+    return int(len(hashes) - len(np.unique(hashes)))
+
+class DuplicateCounter:
+    """
+    Count duplicate rows across chunks from 64-bit row fingerprints.
+
+    Fingerprints stay in memory up to `max_buffered`; past that they are
+    spilled to `partitions` temporary files split by hash value, and each
+    partition is de-duplicated on its own. `count()` removes the spill files;
+    callers that may not reach it call `close()` in a finally block.
+    """
+
+    def __init__(self, partitions=64, max_buffered=4_000_000):
+        self.partitions = partitions
+        self.max_buffered = max_buffered
+        self._buffer = []
+        self._buffered = 0
+        self._spill_dir = None
+
+    def add(self, df):
+        hashes = fingerprints(df)
+        self._buffer.append(hashes)
+        self._buffered += len(hashes)
+        if self._buffered > self.max_buffered:
+            self._spill()
+
+    def _spill(self):
+        if self._spill_dir is None:
+            self._spill_dir = tempfile.mkdtemp(prefix="fingerprints_")
+        hashes = np.concatenate(self._buffer) if self._buffer else np.empty(0, dtype=np.uint64)
+        self._buffer, self._buffered = [], 0
+        part = (hashes % self.partitions).astype(np.int64)
+        order = np.argsort(part, kind="stable")
+        bounds = np.cumsum(np.bincount(part, minlength=self.partitions))
+        for p, chunk in enumerate(np.split(hashes[order], bounds[:-1])):
+            if len(chunk):
+                with open(os.path.join(self._spill_dir, f"{p}.bin"), "ab") as f:
+                    chunk.tofile(f)
+
+    def count(self):
+        """Number of rows that repeat an earlier row (as DataFrame.duplicated)."""
+        if self._spill_dir is None:
+            hashes = np.concatenate(self._buffer) if self._buffer else np.empty(0, dtype=np.uint64)
+            return int(len(hashes) - len(np.unique(hashes)))
+        self._spill()
+        total = 0
+        for name in os.listdir(self._spill_dir):
+            hashes = np.fromfile(os.path.join(self._spill_dir, name), dtype=np.uint64)
+            total += len(hashes) - len(np.unique(hashes))
+        self.close()
+        return int(total)
+
+    def close(self):
+        """Remove the spill files, if any (safe to call more than once)."""
+        if self._spill_dir is not None:
+            shutil.rmtree(self._spill_dir, ignore_errors=True)
+            self._spill_dir = None
+
+# --- Raw Row Audits ---
+
+def audit_schemes(schemes):
+    return {
+        'schemes_missing_scheme_id': schemes['scheme_id'].isnull().sum(),
+        'schemes_missing_creationDate': schemes['creationDate'].isnull().sum(),
+        'schemes_missing_category': schemes['category'].isnull().sum(),
+        'schemes_missing_department': schemes['department_at_time'].isnull().sum(),
+    }
+
+def audit_workflow(workflow):
+    return {
+        'workflow_missing_scheme_id': workflow['scheme_id'].isnull().sum(),
+        'workflow_missing_forwarded_at': workflow['forwarded_at'].isnull().sum(),
+        'workflow_missing_time_taken': workflow['time_taken'].isnull().sum() if 'time_taken' in workflow.columns else np.nan,
+    }
+
+def audit_attachments(attachments):
+    return {
+        'attachments_missing_scheme_id': attachments['scheme_id'].isnull().sum(),
+        'attachments_missing_fileName': attachments['fileName'].isnull().sum(),
+    }
+
+def add_counts(totals, counts):
+    for k, v in counts.items():
+        totals[k] = totals.get(k, 0) + v
+    return totals
+
+class HealthAudit:
+    """
+    Health counts of raw rows fed to it chunk by chunk (or as whole tables),
+    in the same pass that cleans them.
+    """
+
+    def __init__(self):
+        self.schemes, self.workflow, self.attachments = {}, {}, {}
+        self.scheme_ids = DuplicateCounter()
+        self.workflow_rows = DuplicateCounter()
+        self.attachment_rows = DuplicateCounter()
+        self.aging_gt_180 = 0
+
+    def add_schemes(self, schemes):
+        add_counts(self.schemes, audit_schemes(schemes))
+        self.scheme_ids.add(schemes[['scheme_id']])
+
+    def add_workflow(self, workflow):
+        add_counts(self.workflow, audit_workflow(workflow))
+        self.workflow_rows.add(workflow)
+
+    def add_attachments(self, attachments):
+        add_counts(self.attachments, audit_attachments(attachments))
+        self.attachment_rows.add(attachments)
+
+    def add_aging(self, count):
+        self.aging_gt_180 += int(count)
+
+    def result(self):
+        health = {**self.schemes, **self.workflow, **self.attachments}
+        health['schemes_duplicate_scheme_id'] = self.scheme_ids.count()
+        health['workflow_duplicate_rows'] = self.workflow_rows.count()
+        health['attachments_duplicate_rows'] = self.attachment_rows.count()
+        health['schemes_aging_gt_180'] = self.aging_gt_180
+        return health
+
+    def close(self):
+        """Remove any duplicate fingerprints spilled to disk (when `result()` is not reached)."""
+        for counter in (self.scheme_ids, self.workflow_rows, self.attachment_rows):
+            counter.close()
+
+# --- Snapshots ---
+
+def save_health(data_health, outdir, mode="full", rows=None):
+    """Write the latest counts and append them to the snapshot history."""
+    # Both files are replaced atomically, so the dashboard never reads a partial file
+    fpath = os.path.join(outdir, HEALTH_FILE)
+    tmp = fpath + ".tmp"
+    pd.Series(data_health).to_csv(tmp)
+    os.replace(tmp, fpath)
+    snapshot = {
+        "run_at": pd.Timestamp.now().isoformat(timespec="seconds"),
+        "mode": mode,
+        **{f"rows_{k}": v for k, v in (rows or {}).items()},
+        **data_health,
+    }
+    fpath = os.path.join(outdir, HISTORY_FILE)
+    history = pd.DataFrame([snapshot])
+    if os.path.exists(fpath):
+        history = pd.concat([pd.read_csv(fpath), history], ignore_index=True).tail(MAX_SNAPSHOTS)
+    tmp = fpath + ".tmp"
+    history.to_csv(tmp, index=False)
+    os.replace(tmp, fpath)
+
+# --- Health of a Selection ---
+
+def slice_health(schemes, workflow, attachments):
+    """
+    Health counts of already cleaned (and possibly filtered) rows: labels
+    that were missing and set to UNKNOWN, schemes without workflow steps,
+    steps without time_taken, duplicate steps and attachments, and aging
+    schemes. Costs one pass over the given rows only.
+    """
+    health = {}
+    if 'category' in schemes:
+        health['schemes_missing_category'] = int((schemes['category'] == "UNKNOWN").sum())
+    if 'department_at_time' in schemes:
+        health['schemes_missing_department'] = int((schemes['department_at_time'] == "UNKNOWN").sum())
+    health['schemes_duplicate_scheme_id'] = count_duplicates(schemes[['scheme_id']])
+    if 'last_action_date' in schemes:
+        health['schemes_without_workflow'] = int(schemes['last_action_date'].isna().sum())
+    if 'aging_days' in schemes:
+        health['schemes_aging_gt_180'] = int(schemes['aging_days'].gt(180).sum())
+    if 'time_taken' in workflow:
+        health['workflow_missing_time_taken'] = int(workflow['time_taken'].isna().sum())
+    keys = [c for c in WORKFLOW_KEY_COLUMNS if c in workflow]
+    health['workflow_duplicate_rows'] = count_duplicates(workflow[keys])
+    keys = [c for c in ATTACHMENT_KEY_COLUMNS if c in attachments]
+    health['attachments_duplicate_rows'] = count_duplicates(attachments[keys])
+    return health
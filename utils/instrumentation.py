@@ -0,0 +1,153 @@
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# --- Hot-path Instrumentation ---
+# `@timed()` (functions) and `span(name)` (blocks) record wall time, rows in
+# and out and the process RSS change of each call made during a dashboard
+# rerun. Recording is per thread: app.main starts a Rerun on the script
+# thread with start_rerun() and collects it with finish_rerun(), so prep jobs
+# pre-warmed on background threads are not attributed to the rerun.
+#
+# With SCHEMES_PROFILE unset `timed` returns functions undecorated and a span
+# costs one thread-local lookup. SCHEMES_PROFILE=1 records every rerun and
+# shows the debug timing panel in the sidebar; SCHEMES_PROFILE_LOG=path also
+# appends each rerun as one JSON line to that file.
+
+PROFILE = os.environ.get("SCHEMES_PROFILE", "0") == "1"
+PROFILE_LOG = os.environ.get("SCHEMES_PROFILE_LOG")
+
+_local = threading.local()
+_log_lock = threading.Lock()
+
+def current_rss():
+    """Resident set size of the process in bytes, or None where unavailable."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+    except ImportError:
+        return None
+    return psutil.Process().memory_info().rss
+
+def count_rows(value):
+    """Rows in a frame or array, or in a tuple/dict of them; None for anything else."""
+    if isinstance(value, (tuple, list, dict)):
+        counts = [count_rows(v) for v in (value.values() if isinstance(value, dict) else value)]
+        return sum(counts) if counts and None not in counts else None
+    if hasattr(value, "shape") and hasattr(value, "__len__"):
+        return len(value)
+    return None
+
+class Rerun:
+    """Timings recorded on one thread during one dashboard rerun."""
+
+    def __init__(self, label="rerun"):
+        self.label = label
+        self.started_at = time.time()
+        self.start = time.perf_counter()
+        self.total = None
+        self.records = []
+        self.depth = 0
+
+    def begin(self, name, rows_in=None):
+        record = {"name": name, "depth": self.depth, "rows_in": rows_in, "rows_out": None}
+        self.records.append(record)
+        self.depth += 1
+        record["_rss"] = current_rss()
+        record["_start"] = time.perf_counter()
+        return record
+
+    def end(self, record, rows_out=None):
+        record["seconds"] = time.perf_counter() - record.pop("_start")
+        rss_before, rss_after = record.pop("_rss"), current_rss()
+        record["rss_delta_mb"] = (
+            round((rss_after - rss_before) / 2**20, 2) if rss_before is not None and rss_after is not None else None
+        )
+        if record["rows_out"] is None:
+            record["rows_out"] = rows_out
+        self.depth -= 1
+
+    def finish(self):
+        self.total = time.perf_counter() - self.start
+        return self
+
+    def to_dict(self):
+        return {
+            "label": self.label,
+            "started_at": self.started_at,
+            "total_seconds": self.total,
+            "records": [r for r in self.records if "seconds" in r],
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), default=str)
+
+def start_rerun(label="rerun"):
+    """Start recording on this thread; returns the Rerun, or None when profiling is off."""
+    if not PROFILE:
+        _local.rerun = None
+        return None
+    _local.rerun = Rerun(label)
+    return _local.rerun
+
+def finish_rerun():
+    """Stop recording on this thread; returns the finished Rerun (or None) and logs it."""
+    rerun = getattr(_local, "rerun", None)
+    _local.rerun = None
+    if rerun is None:
+        return None
+    rerun.finish()
+    if PROFILE_LOG:
+        with _log_lock, open(PROFILE_LOG, "a", encoding="utf-8") as f:
+            f.write(rerun.to_json() + "\n")
+    return rerun
+
+@contextmanager
+def span(name, rows_in=None):
+    """
+    Time a block. Yields the record (a dict) so the block can set
+    record["rows_out"]; yields None when nothing is being recorded.
+    """
+    rerun = getattr(_local, "rerun", None)
+    if rerun is None:
+        yield None
+        return
+    record = rerun.begin(name, rows_in)
+    try:
+        yield record
+    finally:
+        rerun.end(record)
+
+def timed(name=None):
+    """
+    Decorator recording each call of the function in the current rerun.
+    Rows in are the rows of the frame arguments; rows out those of the result.
+    """
+    def decorate(func):
+        if not PROFILE:
+            return func
+        label = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            rerun = getattr(_local, "rerun", None)
+            if rerun is None:
+                return func(*args, **kwargs)
+            rows = [count_rows(a) for a in args]
+            rows = [r for r in rows if r is not None]
+            record = rerun.begin(label, sum(rows) if rows else None)
+            result = None
+            try:
+                result = func(*args, **kwargs)
+                return result
+            finally:
+                rerun.end(record, count_rows(result))
+        return wrapper
+    return decorate
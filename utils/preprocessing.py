@@ -1,139 +1,889 @@
+import argparse
+import io
+import json
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
 import pandas as pd
 import numpy as np
 import os
+from pandas.tseries.api import guess_datetime_format
+
+try:
+    from utils.storage import (
+        STORAGE_FORMAT, FORMATS, AGING_LABELS, CATEGORICAL_COLUMNS,
+        write_table, append_table, read_table, resolve_table, TableWriter,
+    )
+    from utils.cube import (
+        SCHEME_CUBE, WORKFLOW_CUBE,
+        scheme_step_totals, build_scheme_cube, build_workflow_cube, add_cubes,
+    )
+    from utils.sketch import (
+        SCHEME_SKETCH, WORKFLOW_SKETCH, build_scheme_sketch, build_workflow_sketch, merge_sketches,
+    )
+    from utils.health import (
+        HEALTH_FILE, HealthAudit, audit_schemes, audit_workflow, audit_attachments,
+        add_counts, count_duplicates, save_health,
+    )
+    from utils.facts import SCHEME_FACTS, build_scheme_facts, latest_steps
+except ImportError:  # run as a script: python utils/preprocessing.py
+    from storage import (
+        STORAGE_FORMAT, FORMATS, AGING_LABELS, CATEGORICAL_COLUMNS,
+        write_table, append_table, read_table, resolve_table, TableWriter,
+    )
+    from cube import (
+        SCHEME_CUBE, WORKFLOW_CUBE,
+        scheme_step_totals, build_scheme_cube, build_workflow_cube, add_cubes,
+    )
+    from sketch import (
+        SCHEME_SKETCH, WORKFLOW_SKETCH, build_scheme_sketch, build_workflow_sketch, merge_sketches,
+    )
+    from health import (
+        HEALTH_FILE, HealthAudit, audit_schemes, audit_workflow, audit_attachments,
+        add_counts, count_duplicates, save_health,
+    )
+    from facts import SCHEME_FACTS, build_scheme_facts, latest_steps
 
 # Adjust output directory as per your requirements
 OUTDIR = r"D:\Automation\python\schemes_dashboard\data"
 
+RAW_FILES = {"schemes": "schemes.csv", "workflow": "workflow.csv", "attachments": "attachments.csv"}
+
+# Watermarks of the last run (byte offset / row count per raw file)
+STATE_FILE = "preprocessing_state.json"
+
+# Rows per chunk in streaming mode (override with SCHEMES_CHUNK_ROWS)
+CHUNK_ROWS = int(os.environ.get("SCHEMES_CHUNK_ROWS", "250000"))
+
+# Per-step columns derived from each scheme's next workflow step
+TRANSITION_COLUMNS = ["next_user", "next_department", "dwell_hours"]
+TRANSITION_KEYS = ["transition_date", "department", "next_department"]
+
 # 1. Load Data
 def load_csvs(data_dir=OUTDIR):
-    schemes = pd.read_csv(
-        os.path.join(data_dir, "schemes.csv"),
-        parse_dates=["creationDate"],
-        dayfirst=True, infer_datetime_format=True,
-        dtype=str
-    )
-    workflow = pd.read_csv(
-        os.path.join(data_dir, "workflow.csv"),
-        parse_dates=["forwarded_at"],
-        dayfirst=True, infer_datetime_format=True,
-        dtype=str
-    )
+    schemes = pd.read_csv(os.path.join(data_dir, "schemes.csv"), dtype=str)
+    workflow = pd.read_csv(os.path.join(data_dir, "workflow.csv"), dtype=str)
     attachments = pd.read_csv(
         os.path.join(data_dir, "attachments.csv"),
         dtype=str
     )
+    parse_raw_dates(schemes, workflow)
     return schemes, workflow, attachments
 
+def parse_raw_dates(schemes, workflow):
+    # Dates are parsed after reading as text: combining dtype=str with
+    # parse_dates leaves epoch strings in the date columns on pandas 2.x
+    schemes["creationDate"] = parse_date_column(schemes["creationDate"])
+    workflow["forwarded_at"] = parse_date_column(workflow["forwarded_at"])
+
+def parse_date_column(values):
+    """
+    Parse day-first export dates with one format for the whole column.
+
+    The format is guessed from the first value. Year-first (ISO) values are
+    never day-first, which pandas would otherwise read as %Y-%d-%m.
+    """
+    return pd.to_datetime(values, format=infer_date_format(values), dayfirst=True, errors="coerce")
+
+def infer_date_format(values):
+    sample = values.dropna()
+    if sample.empty:
+        return None
+    first = str(sample.iloc[0]).strip()
+    return guess_datetime_format(first, dayfirst=not first[:4].isdigit())
+
 # 2. Data Audit & Health Checks
+# The counts themselves are defined in utils/health.py; `main` feeds the raw
+# tables to a HealthAudit inside clean_and_enrich instead of auditing them in
+# a separate pass.
 def audit_data(schemes, workflow, attachments):
-    health = {}
-    # Ensure correct types
-    # print(schemes)
-    schemes['creationDate'] = pd.to_datetime(schemes['creationDate'], errors='coerce')
-    workflow['forwarded_at'] = pd.to_datetime(workflow['forwarded_at'], errors='coerce')
-    # Health checks
-    health['schemes_missing_scheme_id'] = schemes['scheme_id'].isnull().sum()
-    health['schemes_missing_creationDate'] = schemes['creationDate'].isnull().sum()
-    health['schemes_missing_category'] = schemes['category'].isnull().sum()
-    health['schemes_missing_department'] = schemes['department_at_time'].isnull().sum()
-    health['workflow_missing_scheme_id'] = workflow['scheme_id'].isnull().sum()
-    health['workflow_missing_forwarded_at'] = workflow['forwarded_at'].isnull().sum()
-    health['workflow_missing_time_taken'] = workflow['time_taken'].isnull().sum() if 'time_taken' in workflow.columns else np.nan
-    health['attachments_missing_scheme_id'] = attachments['scheme_id'].isnull().sum()
-    health['attachments_missing_fileName'] = attachments['fileName'].isnull().sum()
-    # Duplicates
-    health['schemes_duplicate_scheme_id'] = schemes['scheme_id'].duplicated().sum()
-    health['workflow_duplicate_rows'] = workflow.duplicated().sum()
-    health['attachments_duplicate_rows'] = attachments.duplicated().sum()
-    # Proper aging using last workflow date
-    last_forw = workflow.groupby('scheme_id')['forwarded_at'].max().reset_index()
-    last_forw.rename(columns={'forwarded_at': 'last_action_date'}, inplace=True)
+    health = HealthAudit()
+    try:
+        health.add_schemes(schemes)
+        health.add_workflow(workflow)
+        health.add_attachments(attachments)
+        # Proper aging using last workflow date
+        health.add_aging(count_aging_gt_180(schemes, latest_action(workflow)))
+        return health.result()
+    finally:
+        health.close()
+
+def count_aging_gt_180(schemes, last_forw):
     merged = schemes.merge(last_forw, on='scheme_id', how='left')
     merged['aging_days'] = (merged['last_action_date'] - merged['creationDate']).dt.days
-    health['schemes_aging_gt_180'] = merged['aging_days'].dropna().gt(180).sum()
-    return health
+    return merged['aging_days'].dropna().gt(180).sum()
 
 # 3. Clean and Enrich Data
-def clean_and_enrich(schemes, workflow, attachments):
-    # Remove rows without essential keys
-    schemes = schemes.dropna(subset=['scheme_id', 'creationDate'])
-    # Type conversions
-    schemes['creationDate'] = pd.to_datetime(schemes['creationDate'], errors='coerce')
+def latest_action(workflow):
+    """Last forwarded_at per scheme, as a (scheme_id, last_action_date) frame."""
+    last_forw = workflow.groupby('scheme_id')['forwarded_at'].max().reset_index()
+    last_forw.rename(columns={'forwarded_at': 'last_action_date'}, inplace=True)
+    return last_forw
+
+def clean_workflow(workflow):
     workflow = workflow.dropna(subset=['scheme_id', 'forwarded_at'])
     workflow['forwarded_at'] = pd.to_datetime(workflow['forwarded_at'], errors='coerce')
     if 'time_taken' in workflow.columns:
-        workflow['time_taken'] = pd.to_numeric(workflow['time_taken'], errors='coerce')
+        workflow['time_taken'] = pd.to_numeric(workflow['time_taken'], errors='coerce').astype(float)
+    return workflow
 
-    # Compute last comment/action per scheme
-    last_forw = workflow.groupby('scheme_id')['forwarded_at'].max().reset_index()
-    last_forw.rename(columns={'forwarded_at': 'last_action_date'}, inplace=True)
+def clean_schemes(schemes, last_forw):
+    # Remove rows without essential keys
+    schemes = schemes.dropna(subset=['scheme_id', 'creationDate'])
+    schemes['creationDate'] = pd.to_datetime(schemes['creationDate'], errors='coerce')
     schemes = schemes.merge(last_forw, on='scheme_id', how='left')
+    schemes = assign_aging(schemes)
+
+    # Normalize categorical columns and keep them as categoricals so columnar
+    # formats store them dictionary-encoded
+    for col in CATEGORICAL_COLUMNS:
+        if col in schemes:
+            schemes[col] = normalize_labels(schemes[col]).astype("category")
+    return schemes
+
+def normalize_labels(values):
+    return values.astype(str).str.strip().str.upper().replace('NAN', np.nan).fillna("UNKNOWN")
+
+def clean_attachments(attachments):
+    return attachments.dropna(subset=['scheme_id', 'fileName'])
+
+def add_transitions(workflow):
+    """
+    Add next_user, next_department and dwell_hours (time until the next step)
+    to every workflow step; empty on each scheme's latest step.
+
+    One stable sort by (scheme_id, forwarded_at) and one shift; ties keep row
+    order and the rows are returned in their original order.
+    """
+    steps = workflow[['scheme_id', 'forwarded_at', 'user', 'department']].reset_index(drop=True)
+    steps = steps.sort_values(['scheme_id', 'forwarded_at'], kind='stable')
+    following = steps.shift(-1)
+    same_scheme = following['scheme_id'] == steps['scheme_id']
+    steps['next_user'] = following['user'].where(same_scheme)
+    steps['next_department'] = following['department'].where(same_scheme)
+    dwell = (following['forwarded_at'] - steps['forwarded_at']).dt.total_seconds() / 3600
+    steps['dwell_hours'] = dwell.where(same_scheme)
+    steps = steps.sort_index()
+    return workflow.assign(**{col: steps[col].to_numpy() for col in TRANSITION_COLUMNS})
+
+def clean_and_enrich(schemes, workflow, attachments, health=None):
+    """Clean the raw tables; if a HealthAudit is given, the raw rows are audited on the way."""
+    if health is not None:
+        health.add_workflow(workflow)
+    workflow = add_transitions(clean_workflow(workflow))
+    # Compute last comment/action per scheme
+    if health is not None:
+        health.add_schemes(schemes)
+    schemes = clean_schemes(schemes, latest_action(workflow))
+    if health is not None:
+        health.add_aging(schemes['aging_days'].gt(180).sum())
+        health.add_attachments(attachments)
+    attachments = clean_attachments(attachments)
+    return schemes, workflow, attachments
 
+def assign_aging(schemes):
     # Aging calculation: last_action_date - creationDate
     schemes['aging_days'] = (schemes['last_action_date'] - schemes['creationDate']).dt.days
     # Assign bucket based on aging_days
     schemes['aging_bucket'] = pd.cut(
         schemes['aging_days'],
         bins=[-1, 90, 180, float('inf')],
-        labels=["< 90 days", "90–180 days", "> 180 days"]
+        labels=AGING_LABELS
     )
-
-    # Normalize categorical columns
-    for col in ['department_at_time', 'plant', 'category']:
-        if col in schemes:
-            schemes[col] = schemes[col].astype(str).str.strip().str.upper().replace('NAN', np.nan).fillna("UNKNOWN")
-    attachments = attachments.dropna(subset=['scheme_id', 'fileName'])
-    return schemes, workflow, attachments
+    return schemes
 
 # 4. Pre-Aggregation & Summary Tables
-def generate_summary_tables(schemes, workflow, attachments, outdir=OUTDIR):
+def summarise_by_user(workflow):
+    by_user = workflow.groupby(['user', 'department'])['scheme_id'].nunique().reset_index()
+    by_user.rename(columns={'scheme_id': 'schemes_handled'}, inplace=True)
+    if 'time_taken' in workflow.columns:
+        by_user['avg_processing_time'] = workflow.groupby(['user', 'department'])['time_taken'].mean().values
+    return by_user
+
+def summarise_schemes_by(schemes, col):
+    summary = schemes.groupby(col, observed=True)['scheme_id'].nunique().reset_index()
+    summary.rename(columns={'scheme_id': 'schemes_handled'}, inplace=True)
+    return summary
+
+def summarise_attachments_by_user(attachments):
+    by_user_attach = attachments.groupby(['user', 'department'])['fileName'].count().reset_index()
+    by_user_attach.rename(columns={'fileName': 'total_attachments'}, inplace=True)
+    return by_user_attach
+
+def summarise_transitions(workflow):
+    """Department -> next_department step counts per day the step was forwarded."""
+    steps = workflow.dropna(subset=['next_department'])
+    day = steps['forwarded_at'].dt.normalize().rename('transition_date')
+    counts = steps.groupby([day, 'department', 'next_department']).size()
+    return counts.rename('transitions').reset_index()
+
+def add_transition_counts(*tables):
+    """Sum transition count tables, dropping groups that net to zero."""
+    tables = [t for t in tables if t is not None and not t.empty]
+    if not tables:
+        return pd.DataFrame(columns=TRANSITION_KEYS + ['transitions'])
+    total = pd.concat(tables).groupby(TRANSITION_KEYS)['transitions'].sum()
+    return total[total != 0].astype('int64').reset_index()
+
+def generate_summary_tables(schemes, workflow, attachments, outdir=OUTDIR, fmt=STORAGE_FORMAT):
     # By User
     if not workflow.empty:
-        by_user = workflow.groupby(['user', 'department'])['scheme_id'].nunique().reset_index()
-        by_user.rename(columns={'scheme_id': 'schemes_handled'}, inplace=True)
-        if 'time_taken' in workflow.columns:
-            by_user['avg_processing_time'] = workflow.groupby(['user', 'department'])['time_taken'].mean().values
-        by_user.to_csv(os.path.join(outdir, "summary_by_user.csv"), index=False)
+        write_table(summarise_by_user(workflow), outdir, "summary_by_user", fmt)
+        write_table(summarise_transitions(workflow), outdir, "summary_transitions", fmt)
     # By Department
     if not schemes.empty:
-        by_dept = schemes.groupby('department_at_time')['scheme_id'].nunique().reset_index()
-        by_dept.rename(columns={'scheme_id': 'schemes_handled'}, inplace=True)
-        by_dept.to_csv(os.path.join(outdir, "summary_by_department.csv"), index=False)
-        by_cat = schemes.groupby('category')['scheme_id'].nunique().reset_index()
-        by_cat.rename(columns={'scheme_id': 'schemes_handled'}, inplace=True)
-        by_cat.to_csv(os.path.join(outdir, "summary_by_category.csv"), index=False)
+        write_table(summarise_schemes_by(schemes, 'department_at_time'), outdir, "summary_by_department", fmt)
+        write_table(summarise_schemes_by(schemes, 'category'), outdir, "summary_by_category", fmt)
     # Attachments by User
     if not attachments.empty:
-        by_user_attach = attachments.groupby(['user', 'department'])['fileName'].count().reset_index()
-        by_user_attach.rename(columns={'fileName': 'total_attachments'}, inplace=True)
-        by_user_attach.to_csv(os.path.join(outdir, "summary_attachments_by_user.csv"), index=False)
+        write_table(summarise_attachments_by_user(attachments), outdir, "summary_attachments_by_user", fmt)
+
+def build_cubes(schemes, workflow, attachments):
+    """
+    Daily scheme and workflow cubes (see utils.cube), distinct-count sketches
+    (see utils.sketch) and the per-scheme fact table (see utils.facts), by
+    table name.
+    """
+    cubes = {}
+    if not schemes.empty:
+        step_totals, attachment_counts = scheme_step_totals(workflow), attachments.groupby('scheme_id').size()
+        cubes[SCHEME_CUBE] = build_scheme_cube(schemes, step_totals, attachment_counts)
+        cubes[SCHEME_SKETCH] = build_scheme_sketch(schemes)
+        cubes[SCHEME_FACTS] = build_scheme_facts(schemes, step_totals, attachment_counts, latest_steps(workflow))
+    if not workflow.empty:
+        cubes[WORKFLOW_CUBE] = build_workflow_cube(workflow)
+        cubes[WORKFLOW_SKETCH] = build_workflow_sketch(workflow)
+    return cubes
+
+def generate_cubes(schemes, workflow, attachments, outdir=OUTDIR, fmt=STORAGE_FORMAT):
+    for name, cube in build_cubes(schemes, workflow, attachments).items():
+        write_table(cube, outdir, name, fmt)
 
 # 5. Save Cleaned Data
-def save_clean_data(schemes, workflow, attachments, outdir=OUTDIR):
-    schemes.to_csv(os.path.join(outdir, "schemes_cleaned.csv"), index=False)
-    workflow.to_csv(os.path.join(outdir, "workflow_cleaned.csv"), index=False)
-    attachments.to_csv(os.path.join(outdir, "attachments_cleaned.csv"), index=False)
+def save_clean_data(schemes, workflow, attachments, outdir=OUTDIR, fmt=STORAGE_FORMAT):
+    write_table(schemes, outdir, "schemes_cleaned", fmt)
+    write_table(workflow, outdir, "workflow_cleaned", fmt)
+    write_table(attachments, outdir, "attachments_cleaned", fmt)
 
 # 6. Health Check Save
-def save_health_summary(data_health, outdir=OUTDIR):
-    pd.Series(data_health).to_csv(os.path.join(outdir, "data_health.csv"))
-
-# 7. Main Routine
-def main():
-    print(f"Loading data from {OUTDIR} ...")
-    schemes, workflow, attachments = load_csvs()
-    print("Auditing data...")
-    data_health = audit_data(schemes, workflow, attachments)
-    print("Cleaning and enriching...")
-    schemes_clean, workflow_clean, attachments_clean = clean_and_enrich(schemes, workflow, attachments)
+def save_health_summary(data_health, outdir=OUTDIR, mode="full", rows=None):
+    """Write data_health.csv and append the counts to the health history (see utils.health)."""
+    save_health(data_health, outdir, mode, rows)
+
+# 7. Incremental Refresh
+# The raw exports only grow by appending, so every run records how far it read
+# into each file. An incremental run parses only the bytes after that offset
+# and folds the new rows into the existing outputs.
+
+def raw_watermarks(data_dir=OUTDIR):
+    """End-of-file watermark (byte offset and header) of every raw CSV."""
+    marks = {}
+    for key, fname in RAW_FILES.items():
+        fpath = os.path.join(data_dir, fname)
+        with open(fpath, "rb") as f:
+            header = f.readline().decode("utf-8").strip()
+        marks[key] = {"offset": os.path.getsize(fpath), "header": header}
+    return marks
+
+def load_state(outdir=OUTDIR):
+    fpath = os.path.join(outdir, STATE_FILE)
+    if not os.path.exists(fpath):
+        return None
+    with open(fpath) as f:
+        return json.load(f)
+
+def save_state(marks, rows, last_forwarded_at, outdir=OUTDIR, fmt=STORAGE_FORMAT):
+    for key, count in rows.items():
+        marks[key]["rows"] = int(count)
+    state = {
+        "format": fmt,
+        "updated_at": pd.Timestamp.now().isoformat(timespec="seconds"),
+        "last_forwarded_at": None if pd.isna(last_forwarded_at) else pd.Timestamp(last_forwarded_at).isoformat(),
+        "files": marks,
+    }
+    with open(os.path.join(outdir, STATE_FILE), "w") as f:
+        json.dump(state, f, indent=2)
+
+def read_appended_rows(fpath, mark):
+    """
+    Parse the rows appended to a raw CSV since `mark` was recorded.
+
+    Returns (rows, new_mark), or None when the file was truncated or its header
+    changed, in which case only a full rebuild is safe.
+    """
+    with open(fpath, "rb") as f:
+        header = f.readline().decode("utf-8").strip()
+        if header != mark["header"] or os.path.getsize(fpath) < mark["offset"]:
+            return None
+        f.seek(mark["offset"])
+        data = f.read()
+    # Stop at the last complete line; a row still being written is picked up next run
+    end = data.rfind(b"\n") + 1
+    columns = pd.read_csv(io.StringIO(header), nrows=0).columns
+    if data[:end].strip():
+        rows = pd.read_csv(io.BytesIO(data[:end]), names=columns, header=None, dtype=str)
+    else:
+        rows = pd.DataFrame(columns=columns, dtype=str)
+    return rows, {"offset": mark["offset"] + end, "header": header, "rows": mark.get("rows", 0) + len(rows)}
+
+def replace_summary_rows(summary, fresh, keys):
+    """Replace the rows of `summary` for the groups present in `fresh`."""
+    if summary is None or summary.empty:
+        return fresh
+    stale = pd.MultiIndex.from_frame(summary[keys]).isin(pd.MultiIndex.from_frame(fresh[keys]))
+    merged = pd.concat([summary[~stale], fresh], ignore_index=True)
+    return merged.sort_values(keys, ignore_index=True)
+
+def refresh_transitions(workflow, new_workflow):
+    """
+    Append `new_workflow` to `workflow` and recompute the transitions of the
+    schemes that gained steps. Returns the combined workflow and the
+    transition counts of those schemes before and after, for patching the
+    transition summary.
+    """
+    affected = workflow['scheme_id'].isin(new_workflow['scheme_id'])
+    stale = summarise_transitions(workflow[affected])
+    combined = pd.concat([workflow, new_workflow[workflow.columns]], ignore_index=True)
+    touched = np.flatnonzero(combined['scheme_id'].isin(new_workflow['scheme_id']))
+    steps = add_transitions(combined.iloc[touched])
+    for col in TRANSITION_COLUMNS:
+        values = combined[col].to_numpy(dtype=float if col == 'dwell_hours' else object, copy=True)
+        values[touched] = steps[col].to_numpy()
+        combined[col] = values
+    return combined, stale, summarise_transitions(steps)
+
+def read_output(outdir, name, fmt, columns=None):
+    fpath, _ = resolve_table(outdir, name, fmt)
+    return read_table(fpath, fmt, columns) if os.path.exists(fpath) else None
+
+def load_health_summary(outdir=OUTDIR):
+    fpath = os.path.join(outdir, HEALTH_FILE)
+    if not os.path.exists(fpath):
+        return {}
+    return pd.read_csv(fpath, index_col=0).iloc[:, 0].to_dict()
+
+def run_incremental(data_dir=OUTDIR, outdir=OUTDIR, fmt=STORAGE_FORMAT):
+    """
+    Fold rows appended to the raw CSVs since the last run into the outputs.
+
+    last_action_date/aging are updated for the affected schemes and only the
+    summary groups touched by new rows are recomputed. Duplicate-row health
+    counts only cover duplicates within a batch; run a full rebuild to
+    recount duplicates across batches.
+    """
+    state = load_state(outdir)
+    if state is None or state.get("format") != fmt:
+        print("No previous run in this format; running a full rebuild...")
+        return main(data_dir, outdir, fmt)
+
+    new_rows, marks = {}, {}
+    for key, fname in RAW_FILES.items():
+        result = read_appended_rows(os.path.join(data_dir, fname), state["files"][key])
+        if result is None:
+            print(f"{fname} was rewritten since the last run; running a full rebuild...")
+            return main(data_dir, outdir, fmt)
+        new_rows[key], marks[key] = result
+    if all(df.empty for df in new_rows.values()):
+        print("No new rows since", state["updated_at"])
+        return
+
+    new_schemes, new_workflow, new_attachments = new_rows["schemes"], new_rows["workflow"], new_rows["attachments"]
+    print(f"Ingesting {len(new_schemes)} scheme, {len(new_workflow)} workflow "
+          f"and {len(new_attachments)} attachment rows from {data_dir} ...")
+    parse_raw_dates(new_schemes, new_workflow)
+    watermark = pd.Timestamp(state["last_forwarded_at"]) if state["last_forwarded_at"] else pd.NaT
+    if pd.notna(watermark):
+        backdated = (new_workflow["forwarded_at"] < watermark).sum()
+        if backdated:
+            print(f"Note: {backdated} new workflow rows are dated before the previous watermark {watermark}.")
+
+    schemes = read_output(outdir, "schemes_cleaned", fmt)
+    workflow = read_output(outdir, "workflow_cleaned", fmt)
+    if 'next_department' not in workflow.columns:
+        print("Cleaned workflow has no transition columns yet; running a full rebuild...")
+        return main(data_dir, outdir, fmt)
+
+    print("Auditing new rows...")
+    health_new = audit_data(new_schemes, new_workflow, new_attachments)
+    health_new['schemes_duplicate_scheme_id'] += new_schemes['scheme_id'].dropna().isin(schemes['scheme_id']).sum()
+
+    print("Cleaning and enriching new rows...")
+    new_schemes, new_workflow, new_attachments = clean_and_enrich(new_schemes, new_workflow, new_attachments)
+
+    # last_action_date only moves forward for schemes with new workflow rows;
+    # new schemes may also have earlier workflow rows already on file
+    updates = pd.concat([
+        new_workflow.groupby('scheme_id')['forwarded_at'].max(),
+        workflow[workflow['scheme_id'].isin(new_schemes['scheme_id'])].groupby('scheme_id')['forwarded_at'].max(),
+    ]).groupby(level=0).max()
+    schemes = pd.concat([schemes, new_schemes], ignore_index=True)
+    latest = schemes['scheme_id'].map(updates)
+    schemes['last_action_date'] = schemes['last_action_date'].where(
+        latest.isna() | (schemes['last_action_date'] >= latest), latest
+    )
+    schemes = assign_aging(schemes)
+    for col in CATEGORICAL_COLUMNS:
+        if col in schemes:
+            schemes[col] = schemes[col].astype("category")
+
     print("Saving cleaned data...")
-    save_clean_data(schemes_clean, workflow_clean, attachments_clean)
-    print("Generating summary tables...")
-    generate_summary_tables(schemes_clean, workflow_clean, attachments_clean)
+    write_table(schemes, outdir, "schemes_cleaned", fmt)
+    if not new_workflow.empty:
+        # Earlier steps of the affected schemes get new next steps, so the
+        # workflow table is rewritten rather than appended to
+        workflow, stale_transitions, fresh_transitions = refresh_transitions(workflow, new_workflow)
+        write_table(workflow, outdir, "workflow_cleaned", fmt)
+    append_table(new_attachments, outdir, "attachments_cleaned", fmt)
+
+    print("Updating summary tables...")
+    if not new_workflow.empty:
+        keys = new_workflow[['user', 'department']].drop_duplicates()
+        fresh = summarise_by_user(workflow.merge(keys, on=['user', 'department']))
+        by_user = replace_summary_rows(read_output(outdir, "summary_by_user", fmt), fresh, ['user', 'department'])
+        write_table(by_user, outdir, "summary_by_user", fmt)
+        transitions = add_transition_counts(
+            read_output(outdir, "summary_transitions", fmt),
+            stale_transitions.assign(transitions=-stale_transitions['transitions']),
+            fresh_transitions,
+        )
+        write_table(transitions, outdir, "summary_transitions", fmt)
+    if not new_schemes.empty:
+        for col, name in [('department_at_time', "summary_by_department"), ('category', "summary_by_category")]:
+            touched = schemes[schemes[col].isin(new_schemes[col].unique())]
+            summary = replace_summary_rows(read_output(outdir, name, fmt), summarise_schemes_by(touched, col), [col])
+            write_table(summary, outdir, name, fmt)
+    if not new_attachments.empty:
+        old = read_output(outdir, "summary_attachments_by_user", fmt)
+        fresh = summarise_attachments_by_user(new_attachments)
+        if old is not None:
+            fresh = (pd.concat([old, fresh]).groupby(['user', 'department'])['total_attachments']
+                     .sum().reset_index())
+        write_table(fresh, outdir, "summary_attachments_by_user", fmt)
+
+    # Aging of existing schemes can change, so the cubes are
+    # rebuilt from the updated tables (a grouping pass, no re-cleaning)
+    print("Building daily cubes and scheme facts...")
+    generate_cubes(schemes, workflow, read_output(outdir, "attachments_cleaned", fmt, ['scheme_id']), outdir, fmt)
+
     print("Saving health summary...")
-    save_health_summary(data_health)
-    print("Preprocessing complete. Outputs saved in:", OUTDIR)
+    data_health = load_health_summary(outdir)
+    for k, v in health_new.items():
+        data_health[k] = data_health.get(k, 0) + v
+    data_health['schemes_aging_gt_180'] = schemes['aging_days'].dropna().gt(180).sum()
+    save_health_summary(data_health, outdir, "incremental", {k: m["rows"] for k, m in marks.items()})
+
+    last_forwarded_at = pd.Series([watermark, new_workflow['forwarded_at'].max()]).max()
+    save_state(marks, {k: m["rows"] for k, m in marks.items()}, last_forwarded_at, outdir, fmt)
+    print("Incremental refresh complete. Outputs saved in:", outdir)
+
+# 8. Streaming Pipeline
+# Reads the raw CSVs in bounded chunks so peak memory follows the chunk size,
+# not the size of the exports. Cleaned rows go straight to the output files;
+# between chunks only per-key aggregates are kept (per scheme, per user and
+# per cube cell), each updated in place rather than re-built from the rows.
+
+class WorkflowSpill:
+    """
+    Per-scheme results of a workflow that arrives in chunks.
+
+    A scheme's steps can straddle chunks, so cleaned chunks are spilled to disk
+    in order and their (scheme_id, forwarded_at, user, department, time_taken)
+    rows are spilled again into `partitions` files split by a hash of
+    scheme_id. Each partition then holds whole schemes, in row order, and is
+    processed on its own: step transitions, each scheme's last action, step
+    totals and latest step, and the schemes handled per user. Transitions are
+    written by row number into memory-mapped arrays and joined back onto the
+    chunks as they are re-read in their original order.
+    """
+
+    def __init__(self, partitions=16):
+        self.partitions = partitions
+        self._dir = tempfile.mkdtemp(prefix="transitions_")
+        self._chunks = 0
+        self._rows = 0
+        self._names = pd.Index([], dtype=object)  # users and departments seen
+
+    def add(self, chunk):
+        """Spill a cleaned workflow chunk."""
+        chunk.to_pickle(os.path.join(self._dir, f"chunk_{self._chunks}.pkl"))
+        columns = ['scheme_id', 'forwarded_at', 'user', 'department', 'time_taken']
+        steps = chunk[[c for c in columns if c in chunk.columns]].reset_index(drop=True)
+        steps['row'] = np.arange(self._rows, self._rows + len(chunk))
+        names = pd.Index(pd.unique(steps[['user', 'department']].to_numpy().ravel())).dropna()
+        self._names = self._names.append(names.difference(self._names))
+        for p, part in enumerate(hash_partitions(steps, ['scheme_id'], self.partitions)):
+            if len(part):
+                part.to_pickle(os.path.join(self._dir, f"part_{p}_{self._chunks}.pkl"))
+        self._chunks += 1
+        self._rows += len(chunk)
+
+    def finish(self):
+        """
+        Process every partition. Returns a dict of the transition counts, the
+        per-scheme last action date, step totals (scheme_step_totals) and
+        latest steps (latest_steps), and schemes handled per (user, department).
+        """
+        n = max(self._rows, 1)
+        self._next_user = np.lib.format.open_memmap(os.path.join(self._dir, "next_user.npy"), "w+", np.int32, (n,))
+        self._next_dept = np.lib.format.open_memmap(os.path.join(self._dir, "next_dept.npy"), "w+", np.int32, (n,))
+        self._dwell = np.lib.format.open_memmap(os.path.join(self._dir, "dwell.npy"), "w+", np.float64, (n,))
+        empty = pd.DataFrame({'scheme_id': pd.Series(dtype=object), 'forwarded_at': pd.Series(dtype='datetime64[ns]'),
+                              'user': pd.Series(dtype=object), 'time_taken': pd.Series(dtype=float)})
+        parts = {"transitions": [], "last_action": [], "step_totals": [], "last_steps": [], "schemes_handled": []}
+        for p in range(self.partitions):
+            pieces = [os.path.join(self._dir, f"part_{p}_{c}.pkl") for c in range(self._chunks)]
+            pieces = [pd.read_pickle(f) for f in pieces if os.path.exists(f)]
+            if not pieces:
+                continue
+            steps = add_transitions(pd.concat(pieces, ignore_index=True))
+            rows = steps['row'].to_numpy()
+            self._next_user[rows] = self._names.get_indexer(steps['next_user'])
+            self._next_dept[rows] = self._names.get_indexer(steps['next_department'])
+            self._dwell[rows] = steps['dwell_hours'].to_numpy(dtype=float)
+            parts["transitions"].append(summarise_transitions(steps))
+            parts["last_action"].append(steps.groupby('scheme_id')['forwarded_at'].max())
+            parts["step_totals"].append(scheme_step_totals(steps))
+            parts["last_steps"].append(latest_steps(steps))
+            parts["schemes_handled"].append(steps.groupby(['user', 'department'])['scheme_id'].nunique())
+        handled = [h for h in parts["schemes_handled"] if not h.empty]
+        return {
+            "transitions": add_transition_counts(*parts["transitions"]),
+            "last_action": (pd.concat(parts["last_action"]) if parts["last_action"]
+                            else empty.groupby('scheme_id')['forwarded_at'].max()),
+            "step_totals": pd.concat(parts["step_totals"]) if parts["step_totals"] else scheme_step_totals(empty),
+            "last_steps": pd.concat(parts["last_steps"]) if parts["last_steps"] else latest_steps(empty),
+            "schemes_handled": (pd.concat(handled).groupby(level=[0, 1]).sum() if handled
+                                else pd.Series(dtype='int64')),
+        }
+
+    def chunks(self):
+        """Re-read the cleaned chunks in order with the transition columns added."""
+        names = np.append(self._names.to_numpy(dtype=object), np.nan)  # code -1 -> NaN
+        start = 0
+        for c in range(self._chunks):
+            chunk = pd.read_pickle(os.path.join(self._dir, f"chunk_{c}.pkl"))
+            stop = start + len(chunk)
+            yield chunk.assign(
+                next_user=names[self._next_user[start:stop]],
+                next_department=names[self._next_dept[start:stop]],
+                dwell_hours=np.array(self._dwell[start:stop]),
+            )
+            start = stop
+
+    def close(self):
+        for attr in ("_next_user", "_next_dept", "_dwell"):
+            if hasattr(self, attr):
+                delattr(self, attr)  # release the memory maps before removing the files
+        shutil.rmtree(self._dir, ignore_errors=True)
+
+def iter_raw_chunks(fpath, chunksize=CHUNK_ROWS, date_col=None):
+    """Yield raw CSV chunks as text, parsing `date_col` with a format inferred once."""
+    date_format = None
+    for chunk in pd.read_csv(fpath, dtype=str, chunksize=chunksize):
+        if date_col is not None:
+            if date_format is None:
+                date_format = infer_date_format(chunk[date_col])
+            chunk[date_col] = pd.to_datetime(chunk[date_col], format=date_format, dayfirst=True, errors="coerce")
+        yield chunk
+
+def first_scheme_rows(schemes, seen):
+    """Rows of the scheme_ids not in `seen` (first row of each), adding them to `seen`."""
+    first = schemes.drop_duplicates('scheme_id')
+    new = np.fromiter((key not in seen for key in first['scheme_id']), dtype=bool, count=len(first))
+    first = first[new]
+    seen.update(first['scheme_id'])
+    return first
+
+def add_scheme_sets(sets, schemes, col):
+    """Add the scheme_ids of `schemes` to the set kept for each `col` value they appear under."""
+    pairs = schemes[[col, 'scheme_id']].dropna().astype(object).drop_duplicates()
+    for value, ids in pairs.groupby(col)['scheme_id']:
+        sets.setdefault(value, set()).update(ids)
+
+def summarise_scheme_sets(sets, col):
+    """summarise_schemes_by of the rows folded into `sets` by add_scheme_sets."""
+    values = sorted(sets)
+    return pd.DataFrame({col: values, 'schemes_handled': np.array([len(sets[v]) for v in values], dtype='int64')})
+
+def run_streaming(data_dir=OUTDIR, outdir=OUTDIR, fmt=STORAGE_FORMAT, chunksize=CHUNK_ROWS):
+    """
+    Full rebuild equivalent to `main`, processing the raw CSVs chunk by chunk.
+    Outputs equal those of `main`, except that float sums over groups spanning
+    chunks (per-user mean time, cube cells) may differ in the last bits.
+    """
+    marks = raw_watermarks(data_dir)
+    rows = dict.fromkeys(RAW_FILES, 0)
+
+    # Workflow first: schemes need each scheme's last action date and step totals
+    print(f"Streaming workflow from {data_dir} in chunks of {chunksize} rows...")
+    health = HealthAudit()
+    try:
+        user_times, workflow_cube, workflow_sketch = None, None, None
+        spill = WorkflowSpill()
+        try:
+            for chunk in iter_raw_chunks(os.path.join(data_dir, RAW_FILES["workflow"]), chunksize, "forwarded_at"):
+                rows["workflow"] += len(chunk)
+                health.add_workflow(chunk)
+                chunk = clean_workflow(chunk)
+                spill.add(chunk)
+                if 'time_taken' in chunk.columns:
+                    times = chunk.groupby(['user', 'department'])['time_taken'].agg(['sum', 'count'])
+                    user_times = times if user_times is None else user_times.add(times, fill_value=0)
+                workflow_cube = add_cubes(workflow_cube, build_workflow_cube(chunk))
+                workflow_sketch = merge_sketches(workflow_sketch, build_workflow_sketch(chunk))
+
+            print("Deriving workflow transitions and per-scheme totals...")
+            totals = spill.finish()
+            with TableWriter(outdir, "workflow_cleaned", fmt) as writer:
+                for chunk in spill.chunks():
+                    writer.write(chunk)
+        finally:
+            spill.close()
+        last_action, step_totals, last_steps = totals["last_action"], totals["step_totals"], totals["last_steps"]
+
+        print("Streaming attachments...")
+        attach_counts, scheme_files = None, {}
+        with TableWriter(outdir, "attachments_cleaned", fmt) as writer:
+            for chunk in iter_raw_chunks(os.path.join(data_dir, RAW_FILES["attachments"]), chunksize):
+                rows["attachments"] += len(chunk)
+                health.add_attachments(chunk)
+                chunk = clean_attachments(chunk)
+                writer.write(chunk)
+                counts = chunk.groupby(['user', 'department'])['fileName'].count()
+                attach_counts = counts if attach_counts is None else attach_counts.add(counts, fill_value=0)
+                add_counts(scheme_files, chunk.groupby('scheme_id').size())
+        scheme_files = pd.Series(scheme_files, dtype='int64')
+
+        print("Streaming schemes...")
+        # Distinct scheme_ids per department and category, de-duplicated chunk by chunk
+        scheme_sets, seen = {'department_at_time': {}, 'category': {}}, set()
+        scheme_cube, scheme_sketch = None, None
+        with TableWriter(outdir, "schemes_cleaned", fmt) as writer, TableWriter(outdir, SCHEME_FACTS, fmt) as facts:
+            for chunk in iter_raw_chunks(os.path.join(data_dir, RAW_FILES["schemes"]), chunksize, "creationDate"):
+                rows["schemes"] += len(chunk)
+                health.add_schemes(chunk)
+                ids = chunk['scheme_id'].dropna().unique()
+                last_forw = last_action.reindex(ids).rename('last_action_date').rename_axis('scheme_id').reset_index()
+                chunk = clean_schemes(chunk, last_forw)
+                health.add_aging(chunk['aging_days'].gt(180).sum())
+                writer.write(chunk)
+                for col, sets in scheme_sets.items():
+                    add_scheme_sets(sets, chunk, col)
+                # A scheme_id listed more than once counts on its first row, as in build_cubes
+                first = first_scheme_rows(chunk, seen)
+                scheme_cube = add_cubes(scheme_cube, build_scheme_cube(first, step_totals, scheme_files))
+                scheme_sketch = merge_sketches(scheme_sketch, build_scheme_sketch(chunk))
+                if len(first):
+                    facts.write(build_scheme_facts(first, step_totals, scheme_files, last_steps))
+
+        print("Generating summary tables...")
+        handled = totals["schemes_handled"]
+        if not handled.empty:
+            by_user = handled.sort_index().rename('schemes_handled').rename_axis(['user', 'department']).reset_index()
+            if user_times is not None:
+                keys = pd.MultiIndex.from_frame(by_user[['user', 'department']])
+                by_user['avg_processing_time'] = (user_times['sum'] / user_times['count']).reindex(keys).values
+            write_table(by_user, outdir, "summary_by_user", fmt)
+            write_table(totals["transitions"], outdir, "summary_transitions", fmt)
+        for col, name in [('department_at_time', "summary_by_department"), ('category', "summary_by_category")]:
+            if scheme_sets[col]:
+                write_table(summarise_scheme_sets(scheme_sets[col], col), outdir, name, fmt)
+        if attach_counts is not None and not attach_counts.empty:
+            by_user_attach = attach_counts.astype("int64").rename('total_attachments').reset_index()
+            write_table(by_user_attach, outdir, "summary_attachments_by_user", fmt)
+
+        print("Writing daily cubes...")
+        if scheme_cube is not None:
+            write_table(scheme_cube, outdir, SCHEME_CUBE, fmt)
+            write_table(scheme_sketch, outdir, SCHEME_SKETCH, fmt)
+        if workflow_cube is not None:
+            write_table(workflow_cube, outdir, WORKFLOW_CUBE, fmt)
+            write_table(workflow_sketch, outdir, WORKFLOW_SKETCH, fmt)
+
+        print("Saving health summary...")
+        save_health_summary(health.result(), outdir, "streaming", rows)
+    finally:
+        health.close()
+    save_state(marks, rows, last_action.max(), outdir, fmt)
+    print("Streaming preprocessing complete. Outputs saved in:", outdir)
+
+# 9. Parallel Pipeline
+# Same outputs as `main`, spread over a process pool. Workflow and attachments
+# are split by a hash of scheme_id, so duplicate rows and per-scheme
+# aggregates never straddle partitions; per-user summaries are split by
+# (user, department) so every group is computed whole, exactly as serially.
+
+def hash_partitions(df, cols, n):
+    """Split `df` into `n` frames by a hash of `cols`, keeping row order."""
+    codes = pd.util.hash_pandas_object(df[cols], index=False).to_numpy() % n
+    return [df[codes == i] for i in range(n)]
+
+def load_raw_table(fpath, date_col=None):
+    df = pd.read_csv(fpath, dtype=str)
+    if date_col is not None:
+        df[date_col] = parse_date_column(df[date_col])
+    return df
+
+def process_workflow_partition(workflow):
+    health = audit_workflow(workflow)
+    duplicates = count_duplicates(workflow)
+    workflow = add_transitions(clean_workflow(workflow))
+    last_forw = workflow.groupby('scheme_id')['forwarded_at'].max()
+    return health, duplicates, workflow, last_forw, summarise_transitions(workflow)
+
+def process_attachments_partition(attachments):
+    health = audit_attachments(attachments)
+    duplicates = count_duplicates(attachments)
+    attachments = clean_attachments(attachments)
+    return health, duplicates, attachments, summarise_attachments_by_user(attachments)
+
+def process_schemes(schemes, last_forw):
+    health = audit_schemes(schemes)
+    duplicates = count_duplicates(schemes[['scheme_id']])
+    aging_gt_180 = count_aging_gt_180(schemes, last_forw)
+    return health, duplicates, aging_gt_180, clean_schemes(schemes, last_forw)
+
+def run_parallel(data_dir=OUTDIR, outdir=OUTDIR, fmt=STORAGE_FORMAT, workers=None):
+    """Full rebuild on a process pool; prints and returns per-stage timings."""
+    workers = workers or os.cpu_count() or 1
+    timings = {}
+    marks = raw_watermarks(data_dir)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        start = time.perf_counter()
+        print(f"Loading data from {data_dir} with {workers} workers...")
+        futures = {
+            "schemes": pool.submit(load_raw_table, os.path.join(data_dir, RAW_FILES["schemes"]), "creationDate"),
+            "workflow": pool.submit(load_raw_table, os.path.join(data_dir, RAW_FILES["workflow"]), "forwarded_at"),
+            "attachments": pool.submit(load_raw_table, os.path.join(data_dir, RAW_FILES["attachments"])),
+        }
+        schemes, workflow, attachments = (futures[k].result() for k in RAW_FILES)
+        rows = {"schemes": len(schemes), "workflow": len(workflow), "attachments": len(attachments)}
+        timings["load"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        print("Auditing and cleaning workflow partitions...")
+        results = list(pool.map(process_workflow_partition, hash_partitions(workflow, ['scheme_id'], workers)))
+        workflow_health = {}
+        for health, _, _, _, _ in results:
+            add_counts(workflow_health, health)
+        workflow_duplicates = sum(r[1] for r in results)
+        workflow_clean = pd.concat([r[2] for r in results]).sort_index()
+        last_forw = pd.concat([r[3] for r in results]).sort_index()
+        transitions = add_transition_counts(*(r[4] for r in results))
+        last_forw = last_forw.rename('last_action_date').rename_axis('scheme_id').reset_index()
+        timings["workflow"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        print("Enriching schemes and cleaning attachments...")
+        schemes_future = pool.submit(process_schemes, schemes, last_forw)
+        results = list(pool.map(process_attachments_partition, hash_partitions(attachments, ['scheme_id'], workers)))
+        attachments_health = {}
+        for health, _, _, _ in results:
+            add_counts(attachments_health, health)
+        attachments_duplicates = sum(r[1] for r in results)
+        attachments_clean = pd.concat([r[2] for r in results]).sort_index()
+        attach_counts = pd.concat([r[3] for r in results])
+        schemes_health, schemes_duplicates, aging_gt_180, schemes_clean = schemes_future.result()
+        timings["schemes_attachments"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        print("Generating summary tables...")
+        summaries = {}
+        if not workflow_clean.empty:
+            parts = hash_partitions(workflow_clean, ['user', 'department'], workers)
+            summaries["summary_by_user"] = (
+                pd.concat(pool.map(summarise_by_user, parts))
+                .sort_values(['user', 'department'], ignore_index=True)
+            )
+            summaries["summary_transitions"] = transitions
+        if not schemes_clean.empty:
+            summaries["summary_by_department"] = summarise_schemes_by(schemes_clean, 'department_at_time')
+            summaries["summary_by_category"] = summarise_schemes_by(schemes_clean, 'category')
+        if not attachments_clean.empty:
+            summaries["summary_attachments_by_user"] = (
+                attach_counts.groupby(['user', 'department'])['total_attachments'].sum().reset_index()
+            )
+        summaries.update(build_cubes(schemes_clean, workflow_clean, attachments_clean))
+        timings["summaries"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        print("Saving outputs...")
+        tables = {
+            "schemes_cleaned": schemes_clean,
+            "workflow_cleaned": workflow_clean,
+            "attachments_cleaned": attachments_clean,
+            **summaries,
+        }
+        writes = [pool.submit(write_table, df, outdir, name, fmt) for name, df in tables.items()]
+        for future in writes:
+            future.result()
+        timings["write"] = time.perf_counter() - start
+
+    data_health = {**schemes_health, **workflow_health, **attachments_health}
+    data_health['schemes_duplicate_scheme_id'] = schemes_duplicates
+    data_health['workflow_duplicate_rows'] = workflow_duplicates
+    data_health['attachments_duplicate_rows'] = attachments_duplicates
+    data_health['schemes_aging_gt_180'] = aging_gt_180
+    save_health_summary(data_health, outdir, "parallel", rows)
+    save_state(marks, rows, workflow_clean['forwarded_at'].max(), outdir, fmt)
+
+    print("Stage timings (s):")
+    for stage, seconds in timings.items():
+        print(f"  {stage:<20} {seconds:8.2f}")
+    print("Parallel preprocessing complete. Outputs saved in:", outdir)
+    return timings
+
+# 10. Main Routine
+def main(data_dir=OUTDIR, outdir=OUTDIR, fmt=STORAGE_FORMAT, incremental=False, streaming=False,
+         chunksize=CHUNK_ROWS, parallel=False, workers=None):
+    if incremental:
+        return run_incremental(data_dir, outdir, fmt)
+    if streaming:
+        return run_streaming(data_dir, outdir, fmt, chunksize)
+    if parallel:
+        return run_parallel(data_dir, outdir, fmt, workers)
+    # Watermarks are taken before reading; the raw files must not be appended
+    # to while a full rebuild runs
+    marks = raw_watermarks(data_dir)
+    print(f"Loading data from {data_dir} ...")
+    schemes, workflow, attachments = load_csvs(data_dir)
+    print("Cleaning, enriching and auditing...")
+    health = HealthAudit()
+    try:
+        schemes_clean, workflow_clean, attachments_clean = clean_and_enrich(schemes, workflow, attachments, health)
+        print("Saving cleaned data...")
+        save_clean_data(schemes_clean, workflow_clean, attachments_clean, outdir, fmt)
+        print("Generating summary tables...")
+        generate_summary_tables(schemes_clean, workflow_clean, attachments_clean, outdir, fmt)
+        print("Building daily cubes and scheme facts...")
+        generate_cubes(schemes_clean, workflow_clean, attachments_clean, outdir, fmt)
+        rows = {"schemes": len(schemes), "workflow": len(workflow), "attachments": len(attachments)}
+        print("Saving health summary...")
+        save_health_summary(health.result(), outdir, "full", rows)
+    finally:
+        health.close()
+    save_state(marks, rows, workflow_clean['forwarded_at'].max(), outdir, fmt)
+    print("Preprocessing complete. Outputs saved in:", outdir)
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Clean raw CSVs and build dashboard tables.")
+    parser.add_argument("--data-dir", default=OUTDIR,
+                        help="directory holding the raw schemes/workflow/attachments CSVs")
+    parser.add_argument("--outdir", default=OUTDIR,
+                        help="directory to write the cleaned tables, summaries and health files to")
+    parser.add_argument("--format", choices=sorted(FORMATS), default=STORAGE_FORMAT,
+                        help="storage format for cleaned tables and summaries")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only ingest rows appended to the raw CSVs since the last run")
+    parser.add_argument("--streaming", action="store_true",
+                        help="read the raw CSVs in bounded chunks (for exports larger than memory)")
+    parser.add_argument("--chunksize", type=int, default=CHUNK_ROWS,
+                        help="rows per chunk in streaming mode")
+    parser.add_argument("--parallel", action="store_true",
+                        help="run the rebuild on a process pool and report stage timings")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="worker processes for --parallel (default: CPU count)")
+    args = parser.parse_args()
+    main(data_dir=args.data_dir, outdir=args.outdir, fmt=args.format, incremental=args.incremental,
+         streaming=args.streaming, chunksize=args.chunksize, parallel=args.parallel, workers=args.workers)
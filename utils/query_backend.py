@@ -0,0 +1,303 @@
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+from utils.storage import AGING_LABELS, resolve_table
+from utils.filter_index import CREATION_MODES
+
+# --- Query Backend ---
+# "pandas" (default) filters the loaded frames through the FilterIndex and
+# aggregates them in-process. "duckdb" runs the same filters and aggregations
+# as SQL over the cleaned table files with an embedded DuckDB engine: the
+# date range is pushed down into the scans, scans run on all cores, and only
+# aggregated rows come back to pandas. duckdb is an optional dependency.
+
+QUERY_BACKEND = os.environ.get("SCHEMES_QUERY_BACKEND", "pandas")
+
+TABLES = {"schemes": "schemes_cleaned", "workflow": "workflow_cleaned", "attachments": "attachments_cleaned"}
+
+AGGREGATES = ("kpis", "monthly", "category_counts", "performance", "flow_counts", "aging_counts")
+
+# Filtered rows as CTEs; the three selections match FilterIndex.resolve
+CREATION_SELECTION = """
+WITH sel_schemes AS (
+    SELECT * FROM schemes WHERE creationDate BETWEEN $start AND $end {scheme_filters}
+),
+sel_workflow AS (
+    SELECT * FROM workflow WHERE scheme_id IN (SELECT scheme_id FROM sel_schemes)
+),
+sel_attachments AS (
+    SELECT * FROM attachments WHERE scheme_id IN (SELECT scheme_id FROM sel_schemes)
+)
+"""
+
+WORKFLOW_SELECTION = """
+WITH sel_workflow AS (
+    SELECT * FROM workflow WHERE forwarded_at BETWEEN $start AND $end {workflow_filters}
+),
+sel_schemes AS (
+    SELECT * FROM schemes WHERE scheme_id IN (SELECT scheme_id FROM sel_workflow)
+),
+sel_attachments AS (
+    SELECT * FROM attachments WHERE scheme_id IN (SELECT scheme_id FROM sel_schemes)
+)
+"""
+
+QUERIES = {
+    "kpis": """
+        SELECT
+            (SELECT count(DISTINCT scheme_id) FROM sel_schemes) AS total_schemes,
+            (SELECT avg(time_taken) FROM sel_workflow) AS avg_processing_time,
+            (SELECT count(DISTINCT scheme_id) FROM sel_schemes
+             WHERE CAST(aging_bucket AS VARCHAR) = '> 180 days') AS aging_over_180,
+            (SELECT count(*) FROM sel_attachments) AS total_attachments,
+            (SELECT count(*) FROM sel_workflow) AS workflow_rows,
+            (SELECT avg(w.wf_time / a.num_attach)
+             FROM (SELECT scheme_id, coalesce(sum(time_taken), 0) AS wf_time
+                   FROM sel_workflow GROUP BY scheme_id) AS w
+             JOIN (SELECT scheme_id, count(*) AS num_attach
+                   FROM sel_attachments GROUP BY scheme_id) AS a USING (scheme_id)) AS avg_time_per_attachment,
+            (SELECT count(DISTINCT createdBy) FROM sel_schemes) AS unique_generators,
+            (SELECT count(DISTINCT "user") FROM sel_workflow) AS unique_participators
+    """,
+    "monthly": """
+        SELECT date_trunc('month', forwarded_at) AS month, avg(time_taken) AS time_taken
+        FROM sel_workflow WHERE forwarded_at IS NOT NULL
+        GROUP BY 1 ORDER BY 1
+    """,
+    "category_counts": """
+        SELECT CAST(category AS VARCHAR) AS category, count(*) AS count
+        FROM sel_schemes WHERE category IS NOT NULL
+        GROUP BY 1 ORDER BY count DESC, category
+    """,
+    "performance": """
+        SELECT CAST("user" AS VARCHAR) AS "user", count(DISTINCT scheme_id) AS schemes_handled,
+               avg(time_taken) AS avg_processing_time
+        FROM sel_workflow WHERE "user" IS NOT NULL
+        GROUP BY 1 ORDER BY 1
+    """,
+    "flow_counts": """
+        SELECT CAST(department AS VARCHAR) AS department,
+               CAST(next_department AS VARCHAR) AS next_department, count(*) AS count
+        FROM sel_workflow WHERE department IS NOT NULL AND next_department IS NOT NULL
+        GROUP BY 1, 2 ORDER BY 1, 2
+    """,
+    "aging_counts": """
+        SELECT CAST(aging_bucket AS VARCHAR) AS "Aging Bucket", count(*) AS "Count"
+        FROM sel_schemes WHERE aging_bucket IS NOT NULL
+        GROUP BY 1
+    """,
+}
+
+
+class DuckDBBackend:
+    """
+    Dashboard aggregations as SQL over the cleaned tables in `data_dir`.
+
+    Parquet and CSV files are scanned directly; Feather/Arrow files through
+    a pyarrow dataset. Queries share one connection and are serialized;
+    DuckDB parallelizes each scan internally.
+    """
+
+    def __init__(self, data_dir, fmt="auto"):
+        import duckdb
+        import pyarrow.dataset as ds
+
+        self.con = duckdb.connect()
+        self.lock = threading.Lock()
+        for view, name in TABLES.items():
+            fpath, table_fmt = resolve_table(data_dir, name, fmt)
+            if table_fmt == "parquet":
+                source = f"read_parquet('{fpath}')"
+            elif table_fmt == "csv":
+                source = f"read_csv('{fpath}', auto_detect=true)"
+            else:
+                self.con.register(f"{view}_arrow", ds.dataset(fpath, format="ipc"))
+                source = f"{view}_arrow"
+            self.con.execute(f"CREATE VIEW {view} AS SELECT * FROM {source}")
+
+    @staticmethod
+    def selection(filters):
+        """CTE SQL and parameters selecting the rows of a `sidebar_filters` dict."""
+        start, end = filters["date_range"]
+        params = {"start": pd.Timestamp(start).to_pydatetime(), "end": pd.Timestamp(end).to_pydatetime()}
+
+        def member(column, key, values):
+            if not values:
+                return ""
+            params[key] = [str(v) for v in values]
+            return f" AND list_contains(${key}, CAST({column} AS VARCHAR))"
+
+        if filters["filter_mode"] in CREATION_MODES:
+            scheme_filters = (member("category", "categories", filters["categories"])
+                              + member("department_at_time", "departments", filters["departments"])
+                              + member("createdBy", "users", filters["users"]))
+            return CREATION_SELECTION.format(scheme_filters=scheme_filters), params
+        workflow_filters = (member("department", "departments", filters["departments"])
+                            + member('"user"', "users", filters["users"]))
+        if filters["categories"]:
+            categories = member("category", "categories", filters["categories"])
+            workflow_filters += f" AND scheme_id IN (SELECT scheme_id FROM schemes WHERE true{categories})"
+        return WORKFLOW_SELECTION.format(workflow_filters=workflow_filters), params
+
+    def query(self, name, filters):
+        """Run aggregation `name` (see QUERIES) for a `sidebar_filters` dict; returns a DataFrame."""
+        cte, params = self.selection(filters)
+        with self.lock:
+            return self.con.execute(cte + QUERIES[name], params).df()
+
+    def kpis(self, filters):
+        """KPI card values (see components.kpi_cards.compute_kpis)."""
+        row = self.query("kpis", filters).iloc[0]
+        total_schemes, total_attachments = int(row["total_schemes"]), int(row["total_attachments"])
+        avg_processing_time = row["avg_processing_time"]
+        avg_time_per_attachment = 0
+        if total_attachments > 0 and row["workflow_rows"] > 0:
+            avg_time_per_attachment = row["avg_time_per_attachment"]
+        return {
+            "total_schemes": total_schemes,
+            "avg_processing_time": float(avg_processing_time) if pd.notna(avg_processing_time) else np.nan,
+            "aging_over_180": int(row["aging_over_180"]),
+            "total_attachments": total_attachments,
+            "avg_attachments_per_scheme": (total_attachments / total_schemes) if total_schemes > 0 else 0,
+            "avg_time_per_attachment": avg_time_per_attachment,
+            "unique_generators": int(row["unique_generators"]),
+            "unique_participators": int(row["unique_participators"]),
+        }
+
+    def aggregates(self, filters):
+        """Every dashboard aggregation for a `sidebar_filters` dict, by name (see AGGREGATES)."""
+        results = {"kpis": self.kpis(filters)}
+        for name in AGGREGATES[1:]:
+            results[name] = self.query(name, filters)
+        aging = results["aging_counts"].set_index("Aging Bucket")["Count"]
+        results["aging_counts"] = aging.reindex(AGING_LABELS, fill_value=0).rename_axis("Aging Bucket").reset_index()
+        return results
+
+
+# --- Shared Backend Cache ---
+# One backend per dataset version, like the filter indexes in utils.filter_index.
+
+_backends = OrderedDict()
+_backends_lock = threading.Lock()
+MAX_BACKENDS = 2
+
+def get_backend(data_dir, fmt="auto", version=None):
+    """DuckDBBackend over `data_dir` for a dataset version, created on first use."""
+    key = (data_dir, fmt, version)
+    with _backends_lock:
+        backend = _backends.get(key)
+        if backend is None:
+            backend = DuckDBBackend(data_dir, fmt)
+            if version is not None:
+                _backends[key] = backend
+                while len(_backends) > MAX_BACKENDS:
+                    _backends.popitem(last=False)
+        return backend
+
+
+# --- Parity Check ---
+# `python -m utils.query_backend --check DATA_DIR` runs every aggregation on
+# both backends for a set of filters and reports any difference.
+
+def pandas_aggregates(schemes, workflow, attachments, index, filters):
+    """The AGGREGATES computed in-process from the loaded frames, as the dashboard does."""
+    from components.kpi_cards import compute_kpis
+    from components.charts import (
+        prep_avg_processing_time, prep_category_counts, prep_performance, prep_aging_counts,
+    )
+
+    selection = index.resolve(filters)
+    s, w, a = (schemes.iloc[selection["schemes"]], workflow.iloc[selection["workflow"]],
+               attachments.iloc[selection["attachments"]])
+    flow = w.groupby(['department', 'next_department'], observed=True).size()
+    return {
+        "kpis": compute_kpis(s, w, a),
+        "monthly": prep_avg_processing_time(w),
+        "category_counts": prep_category_counts(s),
+        "performance": prep_performance(w)[["user", "schemes_handled", "avg_processing_time"]],
+        "flow_counts": flow[flow > 0].rename("count").reset_index(),
+        "aging_counts": prep_aging_counts(s),
+    }
+
+def _comparable(frame):
+    """Frame with text keys, ns datetimes, float values and rows in key order."""
+    frame = frame.copy()
+    for col in frame.columns:
+        if pd.api.types.is_datetime64_any_dtype(frame[col]):
+            frame[col] = frame[col].astype("datetime64[ns]")
+        elif pd.api.types.is_numeric_dtype(frame[col]):
+            frame[col] = frame[col].astype(float)
+        else:
+            frame[col] = frame[col].astype(str)
+    keys = [c for c in frame.columns if not pd.api.types.is_float_dtype(frame[c])]
+    return frame.sort_values(keys).reset_index(drop=True)
+
+def compare_aggregates(expected, actual, rtol=1e-4):
+    """Names (and KPI keys) where two aggregate dicts differ."""
+    differences = []
+    for key, value in expected["kpis"].items():
+        other = actual["kpis"][key]
+        if not (pd.isna(value) and pd.isna(other)) and not np.isclose(value, other, rtol=rtol):
+            differences.append(f"kpis.{key}: {value} != {other}")
+    for name in AGGREGATES[1:]:
+        left, right = _comparable(expected[name]), _comparable(actual[name])
+        if name == "category_counts":
+            left = left[left["count"] > 0].reset_index(drop=True)  # categoricals list unused categories
+        try:
+            pd.testing.assert_frame_equal(left, right, check_dtype=False, rtol=rtol)
+        except AssertionError as err:
+            differences.append(f"{name}: {str(err).splitlines()[0]}")
+    return differences
+
+def parity_filters(index):
+    """Sidebar date presets in both filter modes, unfiltered and with a few values picked."""
+    min_date, max_date = index.scheme_dates.bounds()
+    ranges = [(min_date, max_date)] + [
+        (max_date - pd.DateOffset(months=months), max_date) for months in (1, 12, 36)
+    ]
+    creation = {"categories": index.scheme_values("category")[:1],
+                "departments": index.scheme_values("department_at_time")[:2],
+                "users": index.scheme_values("createdBy")[:3]}
+    steps = {"categories": index.scheme_values("category")[:1],
+             "departments": index.workflow_values("department")[:1],
+             "users": index.workflow_values("user")[:5]}
+    filters = []
+    for date_range in ranges:
+        for mode, picks in (("Creation Info", creation), ("Workflow Path", steps)):
+            empty = {"categories": [], "departments": [], "users": []}
+            filters.append({"filter_mode": mode, "date_range": date_range, **empty})
+            filters.append({"filter_mode": mode, "date_range": date_range, **picks})
+    return filters
+
+def parity_check(data_dir, fmt="auto"):
+    """Compare both backends on the tables in `data_dir`; returns a list of differences."""
+    from utils import data_loader
+    from utils.filter_index import FilterIndex
+
+    data_loader.DATA_DIR, data_loader.DATA_FORMAT = data_dir, fmt
+    schemes, workflow, attachments = (data_loader.load_schemes(), data_loader.load_workflow(),
+                                      data_loader.load_attachments())
+    index = FilterIndex(schemes, workflow, attachments)
+    backend = DuckDBBackend(data_dir, fmt)
+    differences = []
+    for filters in parity_filters(index):
+        expected = pandas_aggregates(schemes, workflow, attachments, index, filters)
+        label = f"{filters['filter_mode']} {filters['date_range'][0]:%Y-%m-%d}.. " \
+                f"{'filtered' if filters['users'] else 'all'}"
+        differences += [f"{label}: {d}" for d in compare_aggregates(expected, backend.aggregates(filters))]
+    return differences
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check that the pandas and DuckDB backends agree.")
+    parser.add_argument("--check", metavar="DATA_DIR", required=True, help="directory of cleaned tables")
+    parser.add_argument("--format", default="auto", help="storage format to read")
+    args = parser.parse_args()
+    found = parity_check(args.check, args.format)
+    print("\n".join(found) if found else "Backends agree on every aggregation.")
+    raise SystemExit(1 if found else 0)
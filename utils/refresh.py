@@ -0,0 +1,247 @@
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import threading
+import time
+
+from utils.storage import STORAGE_FORMAT
+from utils.health import HISTORY_FILE
+
+# --- Versioned Datasets ---
+# A refresh never writes into the directory the dashboard is reading. Each
+# build goes to its own directory under <root>/versions/, and the file
+# <root>/CURRENT names the active one. The pointer is replaced atomically
+# (os.replace), so a reader sees either the old or the new dataset, never a
+# mix or a half-written table. Without a CURRENT file the root itself holds
+# the dataset, as written by a plain `python -m utils.preprocessing` run.
+#
+# The dashboard pins each rerun to one directory (utils.data_loader.
+# pinned_dataset), so a swap during a rerun only takes effect on the next
+# one; the last KEEP_VERSIONS builds stay on disk for reruns still reading
+# them.
+
+VERSIONS_DIR = "versions"
+POINTER_FILE = "CURRENT"
+BUILD_INFO = "refresh.json"
+LOCK_FILE = "refresh.lock"
+KEEP_VERSIONS = 3
+STALE_LOCK_SECONDS = 12 * 3600
+
+# Poll interval of the background refresher in seconds; 0 disables it
+REFRESH_SECONDS = float(os.environ.get("SCHEMES_REFRESH_SECONDS", "0"))
+
+# Directory holding schemes.csv, workflow.csv and attachments.csv (default: the data root)
+RAW_DIR = os.environ.get("SCHEMES_RAW_DIR")
+
+# Preprocessing mode of a refresh: "full", "streaming", "parallel" or "incremental"
+REFRESH_MODE = os.environ.get("SCHEMES_REFRESH_MODE", "full")
+
+RAW_FILES = ("schemes.csv", "workflow.csv", "attachments.csv")
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def active_data_dir(root):
+    """Directory of the active dataset under `root`."""
+    try:
+        with open(os.path.join(root, POINTER_FILE), encoding="utf-8") as f:
+            name = f.read().strip()
+    except OSError:
+        return root
+    return os.path.join(root, VERSIONS_DIR, name) if name else root
+
+def raw_signature(raw_dir):
+    """(size, mtime) of every raw CSV, or None if one is missing."""
+    signature = {}
+    for fname in RAW_FILES:
+        try:
+            stat = os.stat(os.path.join(raw_dir, fname))
+        except OSError:
+            return None
+        signature[fname] = [stat.st_size, stat.st_mtime_ns]
+    return signature
+
+def built_signature(data_dir):
+    """Raw signature the dataset in `data_dir` was built from, if recorded."""
+    try:
+        with open(os.path.join(data_dir, BUILD_INFO), encoding="utf-8") as f:
+            return json.load(f).get("raw_signature")
+    except (OSError, ValueError):
+        return None
+
+def new_version_dir(root):
+    now = time.time()
+    name = time.strftime("%Y%m%dT%H%M%S", time.localtime(now)) + f"{int(now * 1000) % 1000:03d}-{os.getpid()}"
+    path = os.path.join(root, VERSIONS_DIR, name)
+    os.makedirs(path)
+    return path
+
+def publish(root, version_dir):
+    """Make `version_dir` the active dataset (atomic pointer swap)."""
+    tmp = os.path.join(root, POINTER_FILE + ".tmp")
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(os.path.basename(version_dir))
+    os.replace(tmp, os.path.join(root, POINTER_FILE))
+
+def retire_old_versions(root, keep=KEEP_VERSIONS):
+    """Remove all but the newest `keep` builds; returns the removed directories."""
+    versions_dir = os.path.join(root, VERSIONS_DIR)
+    active = os.path.basename(active_data_dir(root))
+    names = sorted(os.listdir(versions_dir)) if os.path.isdir(versions_dir) else []
+    removed = []
+    for name in names[:-keep] if keep else names:
+        if name == active:
+            continue
+        path = os.path.join(versions_dir, name)
+        # Memory-mapped files can't be removed on Windows while mapped; retried next time
+        shutil.rmtree(path, ignore_errors=True)
+        removed.append(path)
+    return removed
+
+class BuildLock:
+    """Lock file so only one process builds a new version of `root` at a time."""
+
+    def __init__(self, root):
+        self.path = os.path.join(root, LOCK_FILE)
+        self.acquired = False
+
+    def __enter__(self):
+        try:
+            if time.time() - os.path.getmtime(self.path) > STALE_LOCK_SECONDS:
+                os.remove(self.path)  # left behind by a crashed build
+        except OSError:
+            pass
+        try:
+            os.close(os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+            self.acquired = True
+        except FileExistsError:
+            pass
+        return self
+
+    def __exit__(self, *exc):
+        if self.acquired:
+            os.remove(self.path)
+
+def build_version(root, raw_dir=None, fmt=STORAGE_FORMAT, mode=REFRESH_MODE, warm=None):
+    """
+    Run preprocessing into a new version directory, warm it with
+    `warm(version_dir)` and publish it. Returns the published directory, or
+    None if another process is already building. Preprocessing runs in a
+    child process so it never competes with the dashboard for the GIL.
+    """
+    raw_dir = raw_dir or root
+    with BuildLock(root) as lock:
+        if not lock.acquired:
+            return None
+        signature = raw_signature(raw_dir)
+        version_dir = new_version_dir(root)
+        try:
+            args = []
+            if mode == "incremental":
+                # Start from a copy of the active dataset and fold in the new rows
+                shutil.copytree(active_data_dir(root), version_dir, dirs_exist_ok=True,
+                                ignore=shutil.ignore_patterns(VERSIONS_DIR, POINTER_FILE + "*", LOCK_FILE))
+                args.append("--incremental")
+            else:
+                # Carry the health snapshot history over; the new build appends to it
+                history = os.path.join(active_data_dir(root), HISTORY_FILE)
+                if os.path.exists(history):
+                    shutil.copy2(history, version_dir)
+                if mode in ("streaming", "parallel"):
+                    args.append(f"--{mode}")
+            subprocess.run(
+                [sys.executable, "-m", "utils.preprocessing", "--data-dir", raw_dir, "--outdir", version_dir,
+                 "--format", fmt, *args],
+                cwd=PROJECT_ROOT, check=True, stdout=subprocess.DEVNULL,
+            )
+            with open(os.path.join(version_dir, BUILD_INFO), "w", encoding="utf-8") as f:
+                json.dump({"raw_signature": signature, "format": fmt, "mode": mode,
+                           "built_at": time.strftime("%Y-%m-%dT%H:%M:%S")}, f)
+            if warm is not None:
+                warm(version_dir)
+        except BaseException:
+            shutil.rmtree(version_dir, ignore_errors=True)
+            raise
+        publish(root, version_dir)
+        return version_dir
+
+class Refresher(threading.Thread):
+    """
+    Background thread that polls the raw CSVs and publishes a new dataset
+    version when they change. A change is acted on once two consecutive polls
+    see the same sizes and mtimes, so files still being exported are not read.
+    """
+
+    def __init__(self, root, raw_dir=None, fmt=STORAGE_FORMAT, interval=REFRESH_SECONDS, mode=REFRESH_MODE,
+                 warm=None, retire=None):
+        super().__init__(name="dataset-refresher", daemon=True)
+        self.root, self.raw_dir = root, raw_dir or root
+        self.fmt, self.interval, self.mode = fmt, interval, mode
+        self.warm, self.retire = warm, retire
+        self.status = {"building": False, "last_check": None, "last_build": None, "last_error": None}
+        self._stop = threading.Event()
+        self._pending = None
+
+    def stop(self):
+        self._stop.set()
+
+    def run(self):
+        while not self._stop.is_set():
+            try:
+                self.check()
+            except Exception as exc:  # keep polling; the dashboard keeps serving the active version
+                self.status["last_error"] = f"{type(exc).__name__}: {exc}"
+            self._stop.wait(self.interval)
+
+    def check(self):
+        """One poll: build and publish a new version if the raw files changed and settled."""
+        self.status["last_check"] = time.strftime("%Y-%m-%dT%H:%M:%S")
+        signature = raw_signature(self.raw_dir)
+        if signature is None or signature == built_signature(active_data_dir(self.root)):
+            self._pending = None
+            return
+        if signature != self._pending:
+            self._pending = signature  # changed since the last poll; wait for it to settle
+            return
+        self.status["building"] = True
+        try:
+            version_dir = build_version(self.root, self.raw_dir, self.fmt, self.mode, self.warm)
+        finally:
+            self.status["building"] = False
+        if version_dir is None:
+            return
+        self._pending = None
+        self.status["last_build"] = os.path.basename(version_dir)
+        self.status["last_error"] = None
+        for path in retire_old_versions(self.root):
+            if self.retire is not None:
+                self.retire(path)
+
+_refresher = None
+_refresher_lock = threading.Lock()
+
+def start_refresher(root, **kwargs):
+    """Start the process-wide Refresher once (no-op when SCHEMES_REFRESH_SECONDS is 0); returns it."""
+    global _refresher
+    interval = kwargs.get("interval", REFRESH_SECONDS)
+    if interval <= 0:
+        return None
+    with _refresher_lock:
+        if _refresher is None or not _refresher.is_alive():
+            _refresher = Refresher(root, raw_dir=kwargs.pop("raw_dir", RAW_DIR), **kwargs)
+            _refresher.start()
+        return _refresher
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build and publish a new dataset version.")
+    parser.add_argument("root", help="data root holding versions/ and CURRENT")
+    parser.add_argument("--raw-dir", default=RAW_DIR, help="directory of the raw CSVs (default: root)")
+    parser.add_argument("--format", default=STORAGE_FORMAT, help="storage format of the outputs")
+    parser.add_argument("--mode", default=REFRESH_MODE, choices=["full", "streaming", "parallel", "incremental"])
+    args = parser.parse_args()
+    published = build_version(args.root, args.raw_dir, args.format, args.mode)
+    if published is None:
+        sys.exit("Another build is in progress.")
+    retire_old_versions(args.root)
+    print("Published", published)
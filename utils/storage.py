@@ -0,0 +1,249 @@
+import os
+import pandas as pd
+
+# --- Configuration ---
+# Format used when writing cleaned tables and summaries: "csv", "parquet", "feather" or "arrow"
+STORAGE_FORMAT = os.environ.get("SCHEMES_STORAGE_FORMAT", "csv")
+
+# "arrow" is an uncompressed Arrow IPC file that readers memory-map: numeric
+# and datetime columns are zero-copy views of the file, and every process
+# mapping it shares the same page-cache pages
+FORMATS = {"csv": ".csv", "parquet": ".parquet", "feather": ".feather", "arrow": ".arrow"}
+
+AGING_LABELS = ["< 90 days", "90–180 days", "> 180 days"]
+
+# Low-cardinality text columns kept as pandas categoricals
+CATEGORICAL_COLUMNS = ["department_at_time", "plant", "category"]
+
+# Identifier and label columns. Preprocessing reads the raw exports as text and
+# the columnar formats store them as text; CSV reads keep them as text too, so
+# ids such as "007" survive a round trip and compare equal to new raw rows
+# (sketch registers are digit-heavy text too, see utils.sketch)
+TEXT_COLUMNS = [
+    "scheme_id", "user", "department", "next_user", "next_department", "createdBy", "fileName",
+    "department_at_time", "plant", "category", "registers",
+]
+
+# Datetime columns of the cleaned tables; CSV needs them re-parsed on read
+DATE_COLUMNS = [
+    "creationDate", "forwarded_at", "last_action_date", "transition_date", "creation_date", "forwarded_date",
+    "creation_month", "forwarded_month",
+]
+
+# --- Paths ---
+
+def table_path(directory, name, fmt):
+    """Path of table `name` (e.g. "schemes_cleaned") stored as `fmt`."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown storage format {fmt!r}; expected one of {sorted(FORMATS)}")
+    return os.path.join(directory, name + FORMATS[fmt])
+
+def resolve_table(directory, name, fmt="auto"):
+    """
+    Locate table `name` in `directory`.
+
+    With fmt="auto" the most recently written of the available formats wins,
+    so switching formats in preprocessing never serves a stale older file.
+    Returns (path, fmt).
+    """
+    if fmt != "auto":
+        return table_path(directory, name, fmt), fmt
+    candidates = [
+        (os.path.getmtime(table_path(directory, name, f)), f)
+        for f in FORMATS if os.path.exists(table_path(directory, name, f))
+    ]
+    if not candidates:
+        # Let the caller fail with the conventional CSV path in the message
+        return table_path(directory, name, "csv"), "csv"
+    _, fmt = max(candidates)
+    return table_path(directory, name, fmt), fmt
+
+# --- Dtypes ---
+
+def apply_dtypes(df):
+    """Restore the datetime and categorical dtypes of a cleaned table."""
+    for col in DATE_COLUMNS:
+        if col in df.columns and not pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = pd.to_datetime(df[col], errors="coerce")
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+    if "aging_bucket" in df.columns:
+        df["aging_bucket"] = pd.Categorical(df["aging_bucket"], categories=AGING_LABELS, ordered=True)
+    return df
+
+# --- Read / Write ---
+
+def write_table(df, directory, name, fmt=STORAGE_FORMAT):
+    """Write `df` as table `name` in the given format and return the path."""
+    fpath = table_path(directory, name, fmt)
+    if fmt == "csv":
+        df.to_csv(fpath, index=False)
+    elif fmt == "parquet":
+        df.to_parquet(fpath, index=False)
+    elif fmt == "arrow":
+        write_arrow(df, fpath)
+    else:
+        df.reset_index(drop=True).to_feather(fpath)
+    return fpath
+
+def write_arrow(df, fpath):
+    """
+    Write `df` as an uncompressed Arrow IPC file for memory-mapped reads.
+
+    Text columns are stored as sorted dictionaries so readers get categorical
+    codes rather than one Python string per row. The file is written next to
+    its target and renamed over it: processes still mapping the old file keep
+    a valid mapping instead of seeing it truncated.
+    """
+    import pyarrow as pa
+
+    df = df.reset_index(drop=True)
+    text = [col for col in df.columns if pd.api.types.infer_dtype(df[col], skipna=True) == "string"
+            and not isinstance(df[col].dtype, pd.CategoricalDtype)]
+    df = df.astype({col: "category" for col in text})
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    tmp = fpath + ".tmp"
+    with pa.OSFile(tmp, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+    os.replace(tmp, fpath)
+
+def read_arrow(fpath, columns=None):
+    """Memory-map an Arrow IPC file; columns without nulls are zero-copy views of it."""
+    import pyarrow as pa
+
+    table = pa.ipc.open_file(pa.memory_map(fpath, "r")).read_all()
+    if columns is not None:
+        table = table.select(columns)
+    # split_blocks keeps every column in its own block, so nothing is consolidated (copied)
+    return table.to_pandas(split_blocks=True)
+
+def available_columns(fpath, fmt):
+    """Column names stored in a table file, without reading its rows."""
+    if fmt == "csv":
+        return list(pd.read_csv(fpath, nrows=0).columns)
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    import pyarrow.feather as feather
+    if fmt == "parquet":
+        return pq.read_schema(fpath).names
+    if fmt == "arrow":
+        return pa.ipc.open_file(pa.memory_map(fpath, "r")).schema.names
+    return feather.read_table(fpath, memory_map=True).column_names
+
+def read_table(fpath, fmt, columns=None):
+    """
+    Read a table written by `write_table`.
+
+    `columns` projects the read onto a subset of columns; names missing from
+    the file are ignored. Columnar formats only decode the requested columns.
+    """
+    if columns is not None:
+        present = set(available_columns(fpath, fmt))
+        columns = [c for c in columns if c in present]
+    if fmt == "csv":
+        df = pd.read_csv(fpath, usecols=columns, dtype={col: str for col in TEXT_COLUMNS})
+    elif fmt == "parquet":
+        df = pd.read_parquet(fpath, columns=columns)
+    elif fmt == "arrow":
+        df = read_arrow(fpath, columns)
+    else:
+        df = pd.read_feather(fpath, columns=columns)
+    return apply_dtypes(df)
+
+def append_table(df, directory, name, fmt=STORAGE_FORMAT):
+    """
+    Append rows to table `name`, creating it if missing.
+
+    CSV files are appended in place (columns aligned to the existing header);
+    columnar files are rewritten with the new rows added.
+    """
+    fpath = table_path(directory, name, fmt)
+    if not os.path.exists(fpath):
+        return write_table(df, directory, name, fmt)
+    if fmt == "csv":
+        header = available_columns(fpath, fmt)
+        df.reindex(columns=header).to_csv(fpath, mode="a", header=False, index=False)
+        return fpath
+    existing = read_table(fpath, fmt)
+    return write_table(pd.concat([existing, df], ignore_index=True), directory, name, fmt)
+
+class TableWriter:
+    """
+    Write a table chunk by chunk in any storage format.
+
+    The column layout is fixed by the first chunk. Categoricals are written as
+    plain strings (their categories differ between chunks); `read_table`
+    restores the categorical dtypes. Integer columns stay integers: a later
+    chunk holding nulls in one is written as nullable integers, which read
+    back as floats, as a whole-table write of the same column would. "arrow"
+    tables are written uncompressed to a temporary file that replaces the
+    target on close.
+    """
+
+    def __init__(self, directory, name, fmt=STORAGE_FORMAT):
+        self.target = table_path(directory, name, fmt)
+        self.path = self.target + ".tmp" if fmt == "arrow" else self.target
+        self.fmt = fmt
+        self.columns = None
+        self._integers = set()
+        self._started = False
+        self._schema = None
+        self._writer = None
+
+    def _prepare(self, df):
+        df = df.reset_index(drop=True)
+        for col in df.columns:
+            values = df[col]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                df[col] = values.astype(object)
+            elif col in self._integers and pd.api.types.is_float_dtype(values):
+                df[col] = values.astype("Int64")
+        return df
+
+    def write(self, df):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        df = self._prepare(df)
+        if self.columns is None:
+            self.columns = list(df.columns)
+            self._integers = {
+                col for col in df.columns
+                if pd.api.types.is_integer_dtype(df[col]) and not pd.api.types.is_bool_dtype(df[col])
+            }
+        df = df.reindex(columns=self.columns)
+        if self.fmt == "csv":
+            df.to_csv(self.path, mode="a" if self._started else "w", header=not self._started, index=False)
+            self._started = True
+            return
+        if self._schema is None:
+            schema = pa.Schema.from_pandas(df, preserve_index=False)
+            fields = [
+                pa.field(f.name, pa.string()) if pa.types.is_null(f.type) else f for f in schema
+            ]
+            # Without pandas metadata, integer columns holding nulls read back as floats
+            self._schema = pa.schema(fields)
+            if self.fmt == "parquet":
+                self._writer = pq.ParquetWriter(self.path, self._schema)
+            else:
+                options = pa.ipc.IpcWriteOptions(compression=None if self.fmt == "arrow" else "lz4")
+                self._writer = pa.ipc.new_file(self.path, self._schema, options=options)
+        table = pa.Table.from_pandas(df, schema=self._schema, preserve_index=False)
+        self._writer.write_table(table)
+
+    def close(self, commit=True):
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+        if self.path != self.target and os.path.exists(self.path):
+            if commit:
+                os.replace(self.path, self.target)
+            else:
+                os.remove(self.path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        self.close(commit=exc_type is None)